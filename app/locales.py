@@ -25,7 +25,7 @@ translations = {
         "loading_history": "Loading history...",
         "currency": "Currency",
         "rate_usd_base": "Rate (USD Base)",
-        "auto_refresh": "Auto-refreshes every 5 mins",
+        "auto_refresh": "Updates are pushed live",
         "no_news": "No news available.",
         "option": "Option",
         "original": "Original",
@@ -53,7 +53,15 @@ translations = {
         "volatility_label": "7-Day Volatility (%)",
         "clear_history": "Clear History",
         "history_cleared": "History cleared",
-        "add_row": "Add Row"
+        "add_row": "Add Row",
+        "load_more": "Load more",
+        "invalid_condition": "Invalid Condition",
+        "alert_triggered": "Alert Triggered",
+        "bulk_pricing": "Bulk Pricing",
+        "skus_count": "SKUs",
+        "quotes_count": "Quotes",
+        "route": "Route",
+        "effective_rate": "Effective rate"
     },
     "zh": {
         "title": "汇率波动看板",
@@ -79,7 +87,7 @@ translations = {
         "loading_history": "加载记录中...",
         "currency": "货币",
         "rate_usd_base": "汇率 (USD基准)",
-        "auto_refresh": "每5分钟自动刷新",
+        "auto_refresh": "有新汇率时自动推送更新",
         "no_news": "暂无资讯",
         "option": "选项",
         "original": "原币金额",
@@ -107,6 +115,14 @@ translations = {
         "volatility_label": "7天波动率 (%)",
         "clear_history": "清空历史",
         "history_cleared": "历史已清空",
-        "add_row": "添加一行"
+        "add_row": "添加一行",
+        "load_more": "加载更多",
+        "invalid_condition": "无效条件",
+        "alert_triggered": "预警已触发",
+        "bulk_pricing": "批量定价",
+        "skus_count": "SKU 数",
+        "quotes_count": "报价数",
+        "route": "换算路径",
+        "effective_rate": "实际汇率"
     }
 }
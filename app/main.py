@@ -1,22 +1,118 @@
 from fastapi import FastAPI, Request, Form, Query, Depends, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from app.services.exchange_api import exchange_service
+from app.services.http_client import http_client
+from app.services.history_store import HISTORY_PAGE_SIZE
+from app.services.broadcaster import broadcaster
+from app.services.response_cache import response_cache
+from app.services.assets import assets, ImmutableStaticFiles, ASSETS_URL_PREFIX
+from app.services.batch_convert import BatchConverter, BatchFormatError, MEDIA_TYPES, detect_format, spool_body
+from app.services.bulk_pricing import BulkPricer, read_quotes, parse_markets, smart_price
+from app.services.volatility import parse_window
+from app.services.currency_graph import format_route
+from app.services.rate_deltas import parse_symbols, project
+from app.services.downsample import parse_time, parse_resolution, HISTORY_MAX_POINTS, HISTORY_POINTS_LIMIT
+from app.services.metrics import registry, MetricsMiddleware, METRICS_ENABLED
+from app.services.profiling import (
+    ProfilingMiddleware, profile_buffer, instrument_templates, span, token_matches,
+    PROFILE_SAMPLE_RATE, PROFILE_TOKEN, PROFILE_HEADER
+)
 from app.locales import translations
+from contextlib import asynccontextmanager
+import json
 import os
+import math
+import asyncio
 
-app = FastAPI(title="Exchange Rate Dashboard")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期。
+    启动时构建静态资源（内容哈希 + 预压缩）、加载预警日志、创建共享 HTTP 客户端并开启后台汇率预刷新任务，
+    关闭时按相反顺序释放。
+    """
+    await asyncio.get_running_loop().run_in_executor(None, assets.build)
+    await exchange_service.alerts.load()
+    await http_client.start()
+    exchange_service.start_background_tasks()
+    yield
+    await exchange_service.stop_background_tasks()
+    await http_client.close()
+
+app = FastAPI(title="Exchange Rate Dashboard", lifespan=lifespan)
 
-# 挂载静态文件
+# 请求指标（按路由统计延迟和状态码），通过 /metrics 暴露
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# 按需请求分析（抽样或带管理令牌的请求），记录可通过 /admin/profiles 查看
+if PROFILE_SAMPLE_RATE > 0 or PROFILE_TOKEN:
+    app.add_middleware(ProfilingMiddleware)
+
+# 挂载静态文件：构建后带内容哈希的资源永久缓存（需先于 /static 挂载），原始文件仍可按原路径访问
+app.mount(ASSETS_URL_PREFIX, ImmutableStaticFiles(directory=assets.build_dir, check_dir=False, manifest=assets), name="assets")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # 模板
-templates = Jinja2Templates(directory="templates")
+templates = instrument_templates(Jinja2Templates(directory="templates"))
+templates.env.globals["asset_url"] = assets.url
 
 # 下拉菜单的常用货币
 CURRENCIES = ["USD", "CNY", "EUR", "GBP", "JPY", "HKD", "AUD", "CAD", "SGD", "CHF", "INR", "RUB", "KRW", "THB", "VND", "MYR", "IDR", "PHP", "TWD", "NZD"]
 
+def render_rates_table(rates, trans):
+    """
+    渲染实时汇率表格片段（只显示主要货币）。
+    """
+    display_rates = {k: v for k, v in rates.items() if k in CURRENCIES}
+    return templates.get_template("partials/rates_table.html").render(rates=display_rates, trans=trans)
+
+async def push_rates(data):
+    """
+    快照监听器：每份新快照为每种语言渲染一次汇率表格，推送给所有 SSE 订阅者。
+    """
+    fragments = {lang: render_rates_table(data["conversion_rates"], trans) for lang, trans in translations.items()}
+    broadcaster.publish("rates", fragments)
+
+async def push_news(news):
+    """
+    新闻监听器：新闻更新时为每种语言渲染一次新闻列表并推送。
+    """
+    fragments = {
+        lang: templates.get_template("partials/news_list.html").render(news=news, trans=trans)
+        for lang, trans in translations.items()
+    }
+    broadcaster.publish("news", fragments)
+
+def push_alerts(notifications):
+    """
+    预警触发监听器：把触发的预警以 JSON 推送给所有 SSE 订阅者。
+    """
+    broadcaster.publish("alert", json.dumps(notifications, ensure_ascii=False))
+
+# 抓取时才计算的指标
+registry.gauge("dashboard_rates_snapshot_age_seconds", "当前汇率快照距上游发布的秒数", exchange_service.snapshot_age)
+registry.gauge("dashboard_rates_version", "汇率快照版本号", lambda: exchange_service.rates_version)
+registry.gauge("dashboard_history_records", "历史记录条数", exchange_service.history_store.size)
+registry.gauge("dashboard_alerts_active", "未触发的预警数", lambda: len(exchange_service.alerts))
+registry.gauge("dashboard_sse_subscribers", "SSE 连接数", lambda: len(broadcaster))
+registry.gauge(
+    "dashboard_upstream_breaker_open", "上游熔断器是否处于熔断状态（1 为熔断）",
+    lambda: {(b.name,): int(b.state == "open") for b in list(exchange_service.rate_providers.breakers.values()) + [exchange_service.news_breaker]},
+    ("provider",))
+
+exchange_service.add_snapshot_listener(push_rates)
+exchange_service.add_news_listener(push_news)
+exchange_service.alerts.add_listener(push_alerts)
+
+def json_body(content):
+    """
+    按 JSONResponse 相同的方式序列化 JSON 响应体。
+    """
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+
 # 获取语言依赖
 def get_lang(request: Request):
     """
@@ -30,17 +126,21 @@ async def read_root(request: Request, lang: str = Query(None)):
     """
     首页路由。
     渲染 index.html 模板，并根据查询参数或 Cookie 设置语言。
+    页面内容只取决于语言和静态资源版本，每种语言只渲染一次，之后直接使用缓存（支持 ETag / 304）。
     """
     # 如果查询参数中有 lang，则设置 cookie
     response_lang = lang if lang in translations else request.cookies.get("lang", "zh")
     trans = translations[response_lang]
-    
-    response = templates.TemplateResponse("index.html", {
-        "request": request, 
-        "currencies": CURRENCIES, 
-        "trans": trans,
-        "current_lang": response_lang
-    })
+
+    def render():
+        return templates.get_template("index.html").render(
+            currencies=CURRENCIES,
+            trans=trans,
+            current_lang=response_lang
+        )
+
+    key = ("index", response_lang, assets.version)
+    response = await response_cache.respond(request, key, render, vary=("Accept-Encoding", "Cookie"))
     if lang:
         response.set_cookie(key="lang", value=lang)
     return response
@@ -53,18 +153,61 @@ async def get_realtime_rates(request: Request, lang: str = Depends(get_lang)):
     """
     trans = translations.get(lang, translations["zh"])
     rates = await exchange_service.get_realtime_rates()
-    # 过滤主要货币进行显示
-    display_rates = {k: v for k, v in rates.items() if k in CURRENCIES}
-    return templates.TemplateResponse("partials/rates_table.html", {"request": request, "rates": display_rates, "trans": trans})
+    key = ("realtime", lang, exchange_service.rates_version)
+    return await response_cache.respond(request, key, lambda: render_rates_table(rates, trans), vary=("Accept-Encoding", "Cookie"))
+
+@app.get("/api/stream")
+async def stream_updates(request: Request, lang: str = Depends(get_lang)):
+    """
+    服务端推送 (SSE) 通道。
+    有新汇率快照时推送 rates 事件（渲染好的汇率表格），新闻更新时推送 news 事件，
+    预警触发时推送 alert 事件（JSON）。前端通过 htmx sse 扩展订阅，替代定时轮询。
+    """
+    queue = broadcaster.subscribe()
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(broadcaster.stream(queue, lang), media_type="text/event-stream", headers=headers)
 
 @app.get("/api/rates/json")
-async def get_rates_json():
+async def get_rates_json(request: Request, symbols: str = Query(None), since: int = Query(None, ge=0)):
     """
     获取实时汇率数据的 JSON 格式。
     用于前端图表或其他需要原始数据的场景。
+    symbols 为逗号分隔的货币列表，只返回这些货币；
+    带上 since（上次拿到的快照版本号）时只返回此后变化的汇率：
+      {"version": 当前版本, "since": since, "full": 是否为完整汇率, "rates": {...}, "removed": [...]}
+    响应头 X-Rates-Version 为当前快照版本号（单调递增）。
+    同一快照、同一参数只序列化一次，支持 ETag / 304。
     """
     rates = await exchange_service.get_realtime_rates()
-    return JSONResponse(content=rates)
+    version = exchange_service.rates_version
+    codes = parse_symbols(symbols)
+    if since is None:
+        render = lambda: json_body(project(rates, codes))
+    else:
+        render = lambda: json_body(exchange_service.get_rates_delta(since, rates, codes))
+    key = ("rates_json", version, codes, since)
+    return await response_cache.respond(request, key, render, media_type="application/json",
+                                        headers={"X-Rates-Version": str(version)})
+
+@app.get("/api/matrix")
+async def get_rate_matrix(base: str = Query("USD"), quotes: str = Query(None)):
+    """
+    获取交叉汇率矩阵（JSON）。
+    base 和 quotes 均为逗号分隔的货币列表，返回 base × quotes 子矩阵，
+    rates[i][j] 表示 1 单位 base[i] 可兑换多少 quotes[j]。
+    不传 quotes 时返回 base 对所有货币的整行。
+    """
+    matrix = await exchange_service.get_cross_rates()
+    bases = [c.strip().upper() for c in base.split(",") if c.strip()]
+    quote_list = [c.strip().upper() for c in quotes.split(",") if c.strip()] if quotes else matrix.codes
+    bases, quote_list, sub, unknown = matrix.sub_matrix(bases, quote_list)
+    return JSONResponse(content={
+        "base": bases,
+        "quotes": quote_list,
+        "rates": sub.tolist(),
+        "timestamp": matrix.timestamp,
+        "unknown": unknown
+    })
 
 @app.post("/api/convert", response_class=HTMLResponse)
 async def convert_currency(request: Request, amount: float = Form(...), from_curr: str = Form(...), to_curr: str = Form(...), lang: str = Depends(get_lang)):
@@ -74,8 +217,100 @@ async def convert_currency(request: Request, amount: float = Form(...), from_cur
     """
     trans = translations.get(lang, translations["zh"])
     rates = await exchange_service.get_realtime_rates()
-    result = exchange_service.convert_currency(amount, from_curr, to_curr, rates)
-    return f"<div class='alert alert-success mt-3'>{trans['result']}: {amount} {from_curr} = <strong>{result} {to_curr}</strong></div>"
+    converted = await exchange_service.convert_with_route(amount, from_curr, to_curr, rates)
+    if converted is None:
+        return f"<div class='alert alert-success mt-3'>{trans['result']}: {amount} {from_curr} = <strong>0.0 {to_curr}</strong></div>"
+    result, rate, hops = converted
+    route = f"<div class='small text-muted'>{trans['route']}: {format_route(hops)} · {trans['effective_rate']}: {round(rate, 6)}</div>" if hops else ""
+    return f"<div class='alert alert-success mt-3'>{trans['result']}: {amount} {from_curr} = <strong>{result} {to_curr}</strong>{route}</div>"
+
+@app.get("/api/route")
+async def get_route(from_curr: str = Query(..., alias="from"), to_curr: str = Query(..., alias="to")):
+    """
+    获取两种货币之间的最优换算路径（JSON），以及当前报价中不一致的闭环。
+    """
+    rates = await exchange_service.get_realtime_rates()
+    graph = await exchange_service.currency_graph_for(rates)
+    from_curr, to_curr = from_curr.upper(), to_curr.upper()
+    result = graph.route(from_curr, to_curr)
+    if result is None:
+        return JSONResponse(status_code=404, content={"error": f"无法换算: {from_curr} -> {to_curr}"})
+    rate, hops = result
+    return JSONResponse(content={
+        "from": from_curr,
+        "to": to_curr,
+        "rate": rate,
+        "route": hops,
+        "timestamp": graph.timestamp,
+        "inconsistencies": graph.inconsistencies()
+    })
+
+@app.post("/api/convert/batch")
+async def convert_batch(request: Request, format: str = Query(None, pattern="^(csv|ndjson)$"), output: str = Query(None, pattern="^(csv|ndjson)$"), from_curr: str = Query(None), to_curr: str = Query(None)):
+    """
+    批量货币转换。
+    请求体为上传的 CSV 或 NDJSON（按 Content-Type 或 format 参数判断），
+    每行包含 amount、from_curr、to_curr；from_curr/to_curr 查询参数可作为整批的默认货币。
+    整批使用同一份汇率快照，分块向量化计算并流式返回结果，
+    所用快照的时间戳在 X-Rates-Timestamp 响应头中返回。
+    """
+    matrix = await exchange_service.get_cross_rates()
+    converter = BatchConverter(
+        matrix,
+        input_format=format or detect_format(request.headers.get("content-type")),
+        output_format=output,
+        default_from=from_curr.upper() if from_curr else None,
+        default_to=to_curr.upper() if to_curr else None
+    )
+    spool = await spool_body(request.stream())
+    try:
+        converter.open(spool)
+    except BatchFormatError as e:
+        spool.close()
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    headers = {"X-Rates-Timestamp": str(matrix.timestamp or "")}
+    return StreamingResponse(converter.stream(), media_type=converter.media_type, headers=headers)
+
+@app.post("/api/pricing/bulk")
+async def bulk_pricing(request: Request, format: str = Query(None, pattern="^(csv|json|ndjson)$"), output: str = Query("csv", pattern="^(csv|ndjson)$"), view: str = Query("grid", pattern="^(grid|quotes)$"), markets: str = Query(None), lang: str = Depends(get_lang)):
+    """
+    批量定价与比价。
+    请求体为 SKU 报价（CSV / JSON / NDJSON），markets 参数为市场与利润率，如 USD:20,EUR:25
+    （JSON 请求体也可以在 markets 字段中给出）。
+    整批基于同一份汇率快照向量化计算到岸成本、每个 SKU 的最低价供应商和各市场建议售价，
+    grid 视图按 SKU 流式返回价格表，quotes 视图返回每条报价及最低价标记。
+    历史记录中只写入一条汇总。
+    """
+    trans = translations.get(lang, translations["zh"])
+    matrix = await exchange_service.get_cross_rates()
+    content_type = (request.headers.get("content-type") or "").lower()
+    input_format = format or ("csv" if "csv" in content_type or not content_type else "ndjson" if "ndjson" in content_type else "json")
+    spool = await spool_body(request.stream())
+    loop = asyncio.get_running_loop()
+
+    def compute():
+        try:
+            columns, rows, body_markets = read_quotes(spool, input_format)
+        finally:
+            spool.close()
+        pricer = BulkPricer(matrix, parse_markets(markets) if markets else body_markets)
+        return pricer.compute(columns, rows)
+
+    try:
+        pricer = await loop.run_in_executor(None, compute)
+    except BatchFormatError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    summary = pricer.summary()
+    details = (f"{trans['skus_count']}: {summary['skus']}, {trans['quotes_count']}: {summary['quotes']}, "
+               f"{trans['markets_count']}: {summary['markets']}, {trans['best_price_cny']} Σ ¥{summary['total_best_cost_cny']}")
+    await exchange_service.add_history_record("bulk_pricing", details)
+    headers = {
+        "X-Rates-Timestamp": str(matrix.timestamp or ""),
+        "X-Pricing-Summary": json.dumps(summary),
+        "HX-Trigger": "historyChanged"
+    }
+    return StreamingResponse(pricer.stream(output, view), media_type=MEDIA_TYPES[output], headers=headers)
 
 @app.get("/api/news", response_class=HTMLResponse)
 async def get_news(request: Request, lang: str = Depends(get_lang)):
@@ -85,17 +320,68 @@ async def get_news(request: Request, lang: str = Depends(get_lang)):
     """
     trans = translations.get(lang, translations["zh"])
     news = await exchange_service.get_news()
-    return templates.TemplateResponse("partials/news_list.html", {"request": request, "news": news, "trans": trans})
+    key = ("news", lang, exchange_service.news_version)
+    render = lambda: templates.get_template("partials/news_list.html").render(news=news, trans=trans)
+    return await response_cache.respond(request, key, render, vary=("Accept-Encoding", "Cookie"))
+
+@app.get("/api/news/search")
+async def search_news(q: str = Query(None), currency: str = Query(None), limit: int = Query(20, ge=1, le=200)):
+    """
+    搜索已抓取的新闻（JSON）。
+    q 为关键词（多个词须同时出现），currency 为货币/代码标签（如 EUR），结果按发布时间倒序。
+    只查询内存索引，不访问上游。
+    """
+    total, items = exchange_service.search_news(q, currency, limit)
+    return JSONResponse(content={
+        "query": q,
+        "currency": currency.upper() if currency else None,
+        "total": total,
+        "items": items,
+        "indexed": len(exchange_service.news_index),
+        "currencies": exchange_service.news_index.tag_counts()
+    })
 
 @app.get("/api/history")
-async def get_history(base: str = Query("USD"), target: str = Query("CNY"), days: int = Query(30)):
+async def get_history(base: str = Query("USD"), target: str = Query("CNY"), days: int = Query(30, ge=0),
+                      start: str = Query(None, alias="from"), end: str = Query(None, alias="to"),
+                      resolution: str = Query(None), max_points: int = Query(HISTORY_MAX_POINTS, ge=0, le=HISTORY_POINTS_LIMIT)):
     """
     获取历史汇率数据的 JSON 格式。
     用于前端绘制历史趋势图表。
+    区间为 from/to（Unix 秒或 YYYY-MM-DD），默认为过去 days 天；
+    resolution（如 1h、1d）返回 OHLC 分桶，否则最多返回 max_points 个点（LTTB 降采样，0 表示不降采样）。
     """
-    data = await exchange_service.get_historical_data(base, target, days)
+    try:
+        start_ts = parse_time(start) if start else None
+        end_ts = parse_time(end) if end else None
+        resolution_seconds = parse_resolution(resolution) if resolution else None
+        data = await exchange_service.get_historical_data(
+            base.upper(), target.upper(), days, start_ts, end_ts, resolution_seconds, max_points)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     return JSONResponse(content=data)
 
+@app.get("/api/volatility")
+async def get_volatility(window: str = Query("7d"), currencies: str = Query(None), base: str = Query("USD")):
+    """
+    获取滚动波动率统计（JSON）。
+    window 为时间窗口（如 24h、7d、30d，纯数字按天计算），currencies 为逗号分隔的货币列表，
+    返回各货币相对 base 的对数收益率均值、标准差和已实现波动率（百分比）。
+    """
+    try:
+        window_seconds = parse_window(window)
+        codes = [c.strip().upper() for c in currencies.split(",") if c.strip()] if currencies else None
+        stats, start, end = exchange_service.get_volatility(window_seconds, codes, base.upper())
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return JSONResponse(content={
+        "base": base.upper(),
+        "window": window_seconds,
+        "start": start,
+        "end": end,
+        "currencies": stats
+    })
+
 @app.post("/api/purchase/compare", response_class=HTMLResponse)
 async def calculate_purchase_cost(request: Request, lang: str = Depends(get_lang)):
     """
@@ -109,11 +395,11 @@ async def calculate_purchase_cost(request: Request, lang: str = Depends(get_lang
     # 实际上，对于动态列表，接受 JSON 正文或解析原始表单更容易。
     # 但是 HTMX 发送表单数据。让我们简化：用户添加行，提交表单。
     # 我们将直接从请求中读取表单数据以获取动态字段。
-    form_data = await request.form()
+    with span("form"):
+        form_data = await request.form()
     
     items = []
     rates = await exchange_service.get_realtime_rates()
-    cny_rate = rates.get("CNY", 1.0) # 假设我们想要 CNY 的成本
     
     # 手动提取列表，因为键可能是重复的 'amount' 和 'currency'
     raw_amounts = form_data.getlist("amount")
@@ -125,13 +411,17 @@ async def calculate_purchase_cost(request: Request, lang: str = Depends(get_lang
     for amt, curr in zip(raw_amounts, raw_currencies):
         try:
             val = float(amt)
-            # 先转换为 USD 然后转换为 CNY
-            usd_val = val / rates.get(curr, 1.0)
-            cny_val = usd_val * cny_rate
+            # 按最优换算路径转换为 CNY
+            converted = await exchange_service.convert_with_route(val, curr, "CNY", rates)
+            if converted is None:
+                continue
+            cny_val, rate, hops = converted
             results.append({
                 "amount": val,
                 "currency": curr,
-                "cny_cost": round(cny_val, 2)
+                "cny_cost": cny_val,
+                "rate": round(rate, 6),
+                "route": format_route(hops)
             })
             total_cny += cny_val
         except:
@@ -148,7 +438,7 @@ async def calculate_purchase_cost(request: Request, lang: str = Depends(get_lang
             
     # 记录到历史
     details = f"{trans['total_options']}: {len(results)}, {trans['best_price_cny']}: ¥{min_cost if results else 0}"
-    exchange_service.add_history_record("purchase_cost_compare", details)
+    await exchange_service.add_history_record("purchase_cost_compare", details)
 
     response = templates.TemplateResponse("partials/purchase_result.html", {"request": request, "results": results, "trans": trans})
     response.headers["HX-Trigger"] = "historyChanged"
@@ -162,7 +452,8 @@ async def calculate_sale_price(request: Request, lang: str = Depends(get_lang)):
     """
     trans = translations.get(lang, translations["zh"])
     # 列表的类似处理
-    form_data = await request.form()
+    with span("form"):
+        form_data = await request.form()
     
     try:
         cost_cny = float(form_data.get("cost_cny", 0))
@@ -178,20 +469,16 @@ async def calculate_sale_price(request: Request, lang: str = Depends(get_lang)):
     results = []
     for mkt, margin in zip(raw_markets, raw_margins):
         try:
-            margin_pct = float(margin) / 100.0
-            target_price_cny = cost_cny * (1 + margin_pct)
-            
             # 转换 CNY -> USD -> 目标市场货币
-            # CNY -> USD
-            price_usd = target_price_cny / cny_rate
-            # USD -> 目标
-            price_local = price_usd * rates.get(mkt, 1.0)
+            target_price_cny, price_local = smart_price(cost_cny, float(margin), cny_rate, rates.get(mkt, 1.0), mkt)
+            if math.isnan(price_local):
+                continue
             
             results.append({
                 "market": mkt,
                 "margin": margin,
-                "price_local": round(price_local, 2),
-                "price_cny": round(target_price_cny, 2)
+                "price_local": price_local,
+                "price_cny": target_price_cny
             })
         except:
             continue
@@ -200,7 +487,7 @@ async def calculate_sale_price(request: Request, lang: str = Depends(get_lang)):
     # 构造更详细的记录
     res_strs = [f"{r['market']} {r['price_local']} ({r['margin']}%)" for r in results]
     details = f"{trans['cost']} ¥{cost_cny} -> {', '.join(res_strs)}"
-    exchange_service.add_history_record("smart_pricing", details)
+    await exchange_service.add_history_record("smart_pricing", details)
     
     response = templates.TemplateResponse("partials/sale_result.html", {"request": request, "results": results, "trans": trans})
     response.headers["HX-Trigger"] = "historyChanged"
@@ -210,10 +497,12 @@ async def calculate_sale_price(request: Request, lang: str = Depends(get_lang)):
 async def add_warning(request: Request, lang: str = Depends(get_lang)):
     """
     添加汇率预警。
-    设置当汇率达到特定阈值时的提醒（目前仅记录到历史记录中）。
+    设置当汇率达到特定阈值时的提醒：注册到预警引擎，每份新汇率快照都会检查，
+    触发时写入历史记录并进入通知队列。
     """
     trans = translations.get(lang, translations["zh"])
-    form_data = await request.form()
+    with span("form"):
+        form_data = await request.form()
     
     base = form_data.get("base_currency")
     target = form_data.get("target_currency")
@@ -222,29 +511,58 @@ async def add_warning(request: Request, lang: str = Depends(get_lang)):
         pair = f"{base}/{target}"
     else:
         pair = form_data.get("pair", "USD/CNY")
+        base, _, target = pair.partition("/")
 
     condition = form_data.get("condition")
     try:
         threshold = float(form_data.get("threshold"))
     except (TypeError, ValueError):
         return HTMLResponse(f"<div class='alert alert-danger'>{trans['invalid_threshold']}</div>")
+    if condition not in (">", "<"):
+        return HTMLResponse(f"<div class='alert alert-danger'>{trans['invalid_condition']}</div>")
 
-    # 暂时只记录为“活动预警”
     details = f"{trans['alert_when']} {pair} {condition} {threshold}"
-    exchange_service.add_history_record("warning", details)
+    await exchange_service.add_history_record("warning", details)
+    alert, triggered = await exchange_service.register_alert(base, target, condition, threshold)
     
     content = f"<div class='alert alert-info'>{trans['warning_set']}: {details}</div>"
+    if triggered:
+        content = f"<div class='alert alert-warning'>{trans['alert_triggered']}: {details}</div>"
     return HTMLResponse(content=content, headers={"HX-Trigger": "historyChanged"})
 
+@app.get("/api/alerts/notifications")
+async def get_alert_notifications(since: int = Query(0)):
+    """
+    获取预警触发通知（JSON）。
+    返回序号大于 since 的通知，客户端用最后一条的 seq 作为下次的 since。
+    """
+    return JSONResponse(content={
+        "notifications": exchange_service.alerts.recent_notifications(since),
+        "active": len(exchange_service.alerts)
+    })
+
 @app.get("/api/settle/history", response_class=HTMLResponse)
-async def get_history_records(request: Request, filter_type: str = Query(None), lang: str = Depends(get_lang)):
+async def get_history_records(request: Request, filter_type: str = Query(None), cursor: int = Query(None), limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=500), lang: str = Depends(get_lang)):
     """
     获取用户的操作历史记录 HTML 片段。
     支持按类型筛选（如：计算记录、预警记录）。
+    支持游标分页：带 cursor 参数时只返回后续记录行，用于“加载更多”。
     """
     trans = translations.get(lang, translations["zh"])
-    records = exchange_service.get_history_records(filter_type)
-    return templates.TemplateResponse("partials/history_list.html", {"request": request, "records": records, "trans": trans})
+    template = "partials/history_rows.html" if cursor else "partials/history_list.html"
+
+    async def render():
+        records, next_cursor = await exchange_service.get_history_records(filter_type, limit, cursor)
+        return templates.get_template(template).render(
+            records=records,
+            next_cursor=next_cursor,
+            cursor=cursor,
+            filter_type=filter_type,
+            trans=trans
+        )
+
+    key = ("history", lang, filter_type, cursor, limit, exchange_service.history_store.version)
+    return await response_cache.respond(request, key, render, vary=("Accept-Encoding", "Cookie"))
 
 @app.post("/api/history/clear", response_class=HTMLResponse)
 async def clear_history(request: Request, lang: str = Depends(get_lang)):
@@ -252,7 +570,47 @@ async def clear_history(request: Request, lang: str = Depends(get_lang)):
     清空所有历史记录。
     """
     trans = translations.get(lang, translations["zh"])
-    exchange_service.clear_history_records()
+    await exchange_service.clear_history_records()
     response = templates.TemplateResponse("partials/history_list.html", {"request": request, "records": [], "trans": trans})
     response.headers["HX-Trigger"] = "historyChanged"
     return response
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus 文本格式的运行指标。
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def profile_admin_allowed(request):
+    return token_matches(request.headers.get(PROFILE_HEADER))
+
+@app.get("/admin/profiles")
+async def list_profiles(request: Request):
+    """
+    最近的请求分析记录列表（需要 X-Profile-Token 头）。
+    """
+    if not profile_admin_allowed(request):
+        return JSONResponse(status_code=404, content={"error": "Not Found"})
+    return JSONResponse(content={"profiles": profile_buffer.list()})
+
+@app.get("/admin/profiles/{trace_id}")
+async def get_profile(request: Request, trace_id: int, format: str = Query("json", pattern="^(json|text|pstats)$")):
+    """
+    单条分析记录（需要 X-Profile-Token 头）。
+    format=json 返回耗时段和统计摘要，text 返回 cProfile 文本摘要，
+    pstats 下载原始统计数据（可用 python -m pstats 或 snakeviz 打开）。
+    """
+    if not profile_admin_allowed(request):
+        return JSONResponse(status_code=404, content={"error": "Not Found"})
+    trace = profile_buffer.get(trace_id)
+    if trace is None:
+        return JSONResponse(status_code=404, content={"error": "分析记录不存在或已被淘汰"})
+    if format == "text":
+        return PlainTextResponse(trace.profile_text or "")
+    if format == "pstats":
+        if trace.profile_data is None:
+            return JSONResponse(status_code=404, content={"error": "该请求没有 cProfile 统计"})
+        headers = {"Content-Disposition": f'attachment; filename="profile-{trace.id}.prof"'}
+        return Response(content=trace.profile_data, media_type="application/octet-stream", headers=headers)
+    return JSONResponse(content=trace.to_dict())
@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import asyncio
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from dotenv import load_dotenv
+from app.services.shared_snapshot import atomic_write, file_lock
+
+load_dotenv()
+
+# 触发通知队列的容量，超出后丢弃最旧的通知
+ALERT_QUEUE_SIZE = int(os.getenv("ALERT_QUEUE_SIZE", "1000"))
+
+CONDITIONS = (">", "<")
+
+
+class PairAlerts:
+    """
+    单个货币对上的预警。
+    above（汇率 > 阈值）和 below（汇率 < 阈值）各用一组按阈值升序排列的并行列表保存，
+    新汇率到来时用二分查找一次性找出所有被触发的预警：
+    above 触发的是阈值小于汇率的前缀，below 触发的是阈值大于汇率的后缀。
+    """
+    def __init__(self):
+        self.above_thresholds = []
+        self.above_ids = []
+        self.below_thresholds = []
+        self.below_ids = []
+
+    def __len__(self):
+        return len(self.above_ids) + len(self.below_ids)
+
+    def _lists(self, condition):
+        if condition == ">":
+            return self.above_thresholds, self.above_ids
+        return self.below_thresholds, self.below_ids
+
+    def add(self, alert_id, condition, threshold):
+        thresholds, ids = self._lists(condition)
+        pos = bisect_right(thresholds, threshold)
+        thresholds.insert(pos, threshold)
+        ids.insert(pos, alert_id)
+
+    def remove(self, alert_id, condition, threshold):
+        thresholds, ids = self._lists(condition)
+        pos = bisect_left(thresholds, threshold)
+        while pos < len(ids) and thresholds[pos] == threshold:
+            if ids[pos] == alert_id:
+                del thresholds[pos]
+                del ids[pos]
+                return True
+            pos += 1
+        return False
+
+    def pop_triggered(self, rate):
+        """
+        取出并删除所有被当前汇率触发的预警 ID。
+        """
+        above = bisect_left(self.above_thresholds, rate)
+        fired = self.above_ids[:above]
+        del self.above_thresholds[:above]
+        del self.above_ids[:above]
+
+        below = bisect_right(self.below_thresholds, rate)
+        fired += self.below_ids[below:]
+        del self.below_thresholds[below:]
+        del self.below_ids[below:]
+        return fired
+
+
+class AlertEngine:
+    """
+    汇率预警引擎。
+    预警按货币对分组保存在 PairAlerts 中，每份汇率快照只需对每个货币对做两次二分查找，
+    耗时与货币对数量相关，而与预警总数无关。预警为一次性：触发后即移除。
+    预警的增删和触发以追加日志形式持久化到 JSONL 文件，启动时重放并压缩；
+    触发的预警会进入一个有界的通知队列，供前端拉取或推送。
+    多个 worker 进程共享同一份日志：每次增删和检查都在文件锁内先重放其他进程追加的日志，
+    再写入自己的变更，因此每条预警只会被一个进程触发（并写入历史记录）；
+    其他进程重放到触发日志时同样生成通知，连接到任一进程的客户端都能收到推送。
+    通知序号由触发的进程在锁内分配并写入日志，所有进程看到的序号相同，
+    轮询的客户端无论请求落到哪个进程，since 都有效；压缩日志时序号以 seq 条目保留下来。
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self._reset()
+        self._last_id = 0
+        self.notifications = deque(maxlen=ALERT_QUEUE_SIZE)
+        self._listeners = [] # 触发监听器（同步函数），参数为本次触发的通知列表
+        self._loaded = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="alert-log")
+
+    def __len__(self):
+        # 不触发加载（加载需要文件锁，只在执行器线程中进行），未加载时为 0
+        return len(self._alerts)
+
+    async def load(self):
+        """
+        在执行器线程中加载（并压缩）预警日志，应用启动时调用。
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._ensure_loaded)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with file_lock(self.lock_path):
+            self._sync()
+            # 启动时压缩日志，只保留仍然有效的预警；
+            # 写入临时文件后原子替换，其他进程发现文件被替换后会重新加载
+            entries = self._compacted_entries()
+            if self._entries > len(entries):
+                self._rewrite_log(entries)
+        self._loaded = True
+
+    def _reset(self, inode=None):
+        self._pairs = {} # (base, target) -> PairAlerts
+        self._alerts = {} # id -> alert
+        self._inode = inode # 已重放的日志文件 inode
+        self._offset = 0 # 已重放到的日志偏移
+        self._entries = 0 # 日志中的条目数
+        self._fired_seq = 0 # 最后一条触发通知的序号（跨进程一致）
+
+    def _compacted_entries(self):
+        entries = [{"op": "seq", "seq": self._fired_seq}] if self._fired_seq else []
+        return entries + [{"op": "add", "alert": a} for a in self._alerts.values()]
+
+    def _sync(self):
+        """
+        重放其他进程追加的日志（在互斥文件锁内调用），返回其他进程触发的预警。
+        日志被替换（压缩）或变短时从头重新加载。
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            return []
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            self._reset(st.st_ino)
+        if st.st_size == self._offset:
+            return []
+        fired = []
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self._offset += len(line)
+                self._entries += 1
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                op = entry.get("op")
+                if op == "add":
+                    self._index(entry["alert"])
+                    continue
+                if op == "seq":
+                    self._fired_seq = max(self._fired_seq, entry["seq"])
+                    continue
+                alert = self._unindex(entry.get("id"))
+                if op != "fired":
+                    continue
+                # 旧版日志的触发条目没有序号，按日志顺序编号（各进程重放同一份日志，结果相同）
+                self._fired_seq = max(self._fired_seq, entry.get("seq") or self._fired_seq + 1)
+                # 启动加载时重放到的是历史触发，不再生成通知
+                if alert is not None and self._loaded:
+                    fired.append(dict(alert, rate=entry.get("rate"), fired=entry.get("fired"), seq=self._fired_seq))
+        if st.st_size > self._offset:
+            # 进程异常退出时留下的半行，截断后再追加
+            with open(self.path, "r+b") as f:
+                f.truncate(self._offset)
+        return fired
+
+    def _index(self, alert):
+        self._alerts[alert["id"]] = alert
+        self._pairs.setdefault((alert["base"], alert["target"]), PairAlerts()).add(alert["id"], alert["condition"], alert["threshold"])
+        self._last_id = max(self._last_id, alert["id"])
+
+    def _unindex(self, alert_id):
+        alert = self._alerts.pop(alert_id, None)
+        if alert is None:
+            return None
+        key = (alert["base"], alert["target"])
+        pair = self._pairs.get(key)
+        if pair is not None:
+            pair.remove(alert_id, alert["condition"], alert["threshold"])
+            if not len(pair):
+                del self._pairs[key]
+        return alert
+
+    def _write_log(self, entries):
+        data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode("utf-8")
+        with open(self.path, "ab") as f:
+            f.write(data)
+        if self._inode is None:
+            self._inode = os.stat(self.path).st_ino
+        self._offset += len(data)
+        self._entries += len(entries)
+
+    def _rewrite_log(self, entries):
+        data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode("utf-8")
+        atomic_write(self.path, data)
+        self._inode = os.stat(self.path).st_ino
+        self._offset = len(data)
+        self._entries = len(entries)
+
+    async def _run(self, func, *args):
+        """
+        在文件锁内重放其他进程的日志后执行 func（在专用线程中），
+        其他进程触发的预警作为通知分发给监听器。返回 func 的结果。
+        """
+        loop = asyncio.get_running_loop()
+        others, result = await loop.run_in_executor(self._executor, self._locked, func, args)
+        self._notify(others)
+        return result
+
+    def _locked(self, func, args):
+        self._ensure_loaded()
+        with file_lock(self.lock_path):
+            others = self._sync()
+            return others, func(*args)
+
+    def _register_sync(self, base, target, condition, threshold):
+        self._last_id = max(int(time.time() * 1000), self._last_id + 1)
+        alert = {
+            "id": self._last_id,
+            "base": base,
+            "target": target,
+            "condition": condition,
+            "threshold": float(threshold),
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        self._index(alert)
+        self._write_log([{"op": "add", "alert": alert}])
+        return alert
+
+    async def register(self, base, target, condition, threshold):
+        """
+        注册一条预警，返回预警字典。condition 为 '>' 或 '<'。
+        """
+        if condition not in CONDITIONS:
+            raise ValueError(f"不支持的条件: {condition}")
+        return await self._run(self._register_sync, base, target, condition, threshold)
+
+    def _remove_sync(self, alert_id):
+        alert = self._unindex(alert_id)
+        if alert is not None:
+            self._write_log([{"op": "remove", "id": alert_id}])
+        return alert
+
+    async def remove(self, alert_id):
+        """
+        删除一条预警，返回被删除的预警（不存在时返回 None）。
+        """
+        return await self._run(self._remove_sync, alert_id)
+
+    def _evaluate_sync(self, matrix, pairs):
+        fired = []
+        for key in list(pairs if pairs is not None else self._pairs):
+            pair = self._pairs.get(key)
+            rate = matrix.rate(*key)
+            if pair is None or rate is None:
+                continue
+            for alert_id in pair.pop_triggered(rate):
+                alert = self._alerts.pop(alert_id)
+                self._fired_seq += 1
+                fired.append(dict(alert, rate=rate, fired=datetime.now().strftime("%Y-%m-%d %H:%M:%S"), seq=self._fired_seq))
+            if not len(pair):
+                del self._pairs[key]
+        if fired:
+            self._write_log([{"op": "fired", "id": a["id"], "rate": a["rate"], "fired": a["fired"], "seq": a["seq"]} for a in fired])
+        return fired
+
+    async def evaluate(self, matrix, pairs=None):
+        """
+        用一份交叉汇率矩阵检查预警，返回本进程触发的预警列表。
+        pairs 为 None 时检查所有货币对。
+        """
+        fired = await self._run(self._evaluate_sync, matrix, pairs)
+        self._notify(fired)
+        return fired
+
+    def _notify(self, fired):
+        if not fired:
+            return
+        self.notifications.extend(fired)
+        for listener in self._listeners:
+            listener(fired)
+
+    def add_listener(self, listener):
+        """
+        注册触发监听器，每次有预警触发时以通知列表为参数调用（同步、需快速返回）。
+        """
+        self._listeners.append(listener)
+
+    def recent_notifications(self, since=0):
+        """
+        返回序号大于 since 的触发通知（按触发顺序）。
+        """
+        return [n for n in self.notifications if n["seq"] > since]
@@ -0,0 +1,146 @@
+import os
+import gzip
+import hashlib
+import mimetypes
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+from dotenv import load_dotenv
+from app.services.response_cache import accepted_encodings, MIN_COMPRESS_SIZE
+from app.services.shared_snapshot import atomic_write
+
+load_dotenv()
+
+# brotli 为可选依赖，未安装时只生成 gzip 版本
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 静态文件源目录
+STATIC_DIR = "static"
+# 构建输出目录：带内容哈希的文件及其预压缩版本（默认在数据目录下）
+ASSETS_BUILD_DIR = os.getenv("ASSETS_BUILD_DIR") or os.path.join(
+    os.getenv("DASHBOARD_DATA_DIR") or os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data"),
+    "assets"
+)
+ASSETS_URL_PREFIX = "/static/dist"
+
+# 文件名带内容哈希，内容变化时 URL 也会变化，可以永久缓存
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# 需要生成压缩版本的文件类型
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".map", ".json", ".svg", ".html", ".txt", ".xml"}
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def _write_once(path, data):
+    """
+    写入构建产物。文件名带内容哈希，已存在且大小相同时说明内容相同，直接跳过；
+    多个进程同时启动时各自原子写入同样的内容，也不会互相影响。
+    """
+    try:
+        if os.path.getsize(path) == len(data):
+            return
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    atomic_write(path, data)
+
+
+class AssetManifest:
+    """
+    静态资源清单。
+    启动时把 static/ 下的每个文件复制为带内容哈希的文件名（如 css/style.3f2a9c01b7e4.css），
+    可压缩的文件同时写入 .gz（以及安装了 brotli 时的 .br）版本。
+    模板通过 asset_url('css/style.css') 引用带哈希的 URL。
+    旧版本的文件不会删除，部署前渲染的页面仍能加载到它们引用的资源。
+    """
+    def __init__(self, source_dir=STATIC_DIR, build_dir=ASSETS_BUILD_DIR, url_prefix=ASSETS_URL_PREFIX):
+        self.source_dir = source_dir
+        self.build_dir = build_dir
+        self.url_prefix = url_prefix
+        self.paths = {} # 源文件相对路径 -> 带哈希的相对路径
+        self.encodings = {} # 带哈希的相对路径 -> 已生成的压缩编码
+        self.version = "" # 整个清单的哈希，资源变化时改变
+
+    def build(self):
+        """
+        构建所有静态资源（在线程池中调用）。
+        """
+        paths = {}
+        encodings = {}
+        for root, _, files in os.walk(self.source_dir):
+            for name in sorted(files):
+                source = os.path.join(root, name)
+                rel = os.path.relpath(source, self.source_dir).replace(os.sep, "/")
+                with open(source, "rb") as f:
+                    data = f.read()
+                stem, ext = os.path.splitext(rel)
+                hashed = f"{stem}.{hashlib.blake2b(data, digest_size=6).hexdigest()}{ext}"
+                target = os.path.join(self.build_dir, *hashed.split("/"))
+                _write_once(target, data)
+                available = set()
+                if ext.lower() in COMPRESSIBLE_EXTENSIONS and len(data) >= MIN_COMPRESS_SIZE:
+                    variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+                    if brotli is not None:
+                        variants["br"] = brotli.compress(data, quality=11)
+                    for encoding, body in variants.items():
+                        if len(body) < len(data):
+                            _write_once(target + ENCODING_SUFFIXES[encoding], body)
+                            available.add(encoding)
+                paths[rel] = hashed
+                encodings[hashed] = available
+        self.paths = paths
+        self.encodings = encodings
+        self.version = hashlib.blake2b("\n".join(sorted(paths.values())).encode("utf-8"), digest_size=6).hexdigest()
+        return self
+
+    def url(self, path):
+        """
+        返回静态资源的 URL：已构建的返回带哈希的地址，否则退回原始的 /static/ 地址。
+        """
+        hashed = self.paths.get(path)
+        if hashed is None:
+            return f"/static/{path}"
+        return f"{self.url_prefix}/{hashed}"
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    服务构建后的静态资源：带永久缓存头（immutable），
+    客户端接受时直接返回预先压缩好的 .br / .gz 文件，不在请求时压缩。
+    """
+    def __init__(self, *, manifest, **kwargs):
+        super().__init__(**kwargs)
+        self.manifest = manifest
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        rel = os.path.relpath(full_path, os.path.realpath(self.directory)).replace(os.sep, "/")
+        available = self.manifest.encodings.get(rel, ())
+        headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL}
+        media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+        if available:
+            headers["Vary"] = "Accept-Encoding"
+            accepted = accepted_encodings(request_headers.get("accept-encoding"))
+            for encoding in ("br", "gzip"):
+                if encoding in available and encoding in accepted:
+                    encoded_path = str(full_path) + ENCODING_SUFFIXES[encoding]
+                    try:
+                        stat_result = os.stat(encoded_path)
+                    except OSError:
+                        continue
+                    full_path = encoded_path
+                    headers["Content-Encoding"] = encoding
+                    break
+
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result,
+                                media_type=media_type, headers=headers)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+# 创建全局静态资源清单
+assets = AssetManifest()
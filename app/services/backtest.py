@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from app.services.rate_tape import RateTape, read_tape_file, records_to_arrays
+from app.services.currency_graph import CurrencyGraph, table_quotes, RATES_SPREAD_BPS
+from app.services.bulk_pricing import smart_price, COST_CURRENCY
+from app.services.money import convert_amount
+from app.services.downsample import parse_time
+
+
+def load_scenario(path):
+    """
+    读取回测场景（JSON）：
+      {
+        "convert": [{"amount": 1000, "from": "USD", "to": "CNY"}],
+        "pricing": [{"cost_cny": 100, "markets": {"USD": 20, "EUR": 25}}],
+        "alerts":  [{"base": "USD", "target": "CNY", "condition": ">", "threshold": 7.3}]
+      }
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        scenario = json.load(f)
+    return normalize_scenario(scenario)
+
+
+def normalize_scenario(scenario):
+    """
+    校验并规范化场景（货币代码转大写），格式错误时抛出 ValueError。
+    """
+    try:
+        converts = [{"amount": float(c["amount"]), "from": c["from"].upper(), "to": c["to"].upper()}
+                    for c in scenario.get("convert", [])]
+        pricing = [{"cost_cny": float(p["cost_cny"]), "markets": {m.upper(): float(v) for m, v in p["markets"].items()}}
+                   for p in scenario.get("pricing", [])]
+        alerts = [{"base": a["base"].upper(), "target": a["target"].upper(), "condition": a["condition"],
+                   "threshold": float(a["threshold"])} for a in scenario.get("alerts", [])]
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        raise ValueError(f"无效的回测场景: {e}")
+    if any(a["condition"] not in (">", "<") for a in alerts):
+        raise ValueError("预警条件只能是 > 或 <")
+    return {"convert": converts, "pricing": pricing, "alerts": alerts}
+
+
+def scenario_codes(scenario):
+    """
+    返回场景涉及的所有货币（含 USD 和成本货币）。
+    """
+    codes = {"USD", COST_CURRENCY}
+    for c in scenario["convert"]:
+        codes.update((c["from"], c["to"]))
+    for p in scenario["pricing"]:
+        codes.update(p["markets"])
+    for a in scenario["alerts"]:
+        codes.update((a["base"], a["target"]))
+    return sorted(codes)
+
+
+def _stats(values, timestamps):
+    """
+    可合并的序列统计：条数、总和、最小/最大值及其时间、首尾值及其时间（忽略 NaN）。
+    """
+    mask = np.isfinite(values)
+    if not mask.any():
+        return None
+    values, timestamps = values[mask], timestamps[mask]
+    lo, hi = int(np.argmin(values)), int(np.argmax(values))
+    return {
+        "count": int(len(values)), "sum": float(values.sum()),
+        "min": float(values[lo]), "min_at": int(timestamps[lo]),
+        "max": float(values[hi]), "max_at": int(timestamps[hi]),
+        "first": float(values[0]), "first_at": int(timestamps[0]),
+        "last": float(values[-1]), "last_at": int(timestamps[-1]),
+    }
+
+
+def _merge_stats(a, b):
+    """
+    合并两段按时间先后排列的统计（a 在前）。
+    """
+    if a is None or b is None:
+        return a or b
+    merged = dict(a)
+    merged["count"] = a["count"] + b["count"]
+    merged["sum"] = a["sum"] + b["sum"]
+    if b["min"] < a["min"]:
+        merged["min"], merged["min_at"] = b["min"], b["min_at"]
+    if b["max"] > a["max"]:
+        merged["max"], merged["max_at"] = b["max"], b["max_at"]
+    merged["last"], merged["last_at"] = b["last"], b["last_at"]
+    return merged
+
+
+def _summary(stats, digits=6):
+    if stats is None:
+        return None
+    return {
+        "min": round(stats["min"], digits), "min_at": stats["min_at"],
+        "max": round(stats["max"], digits), "max_at": stats["max_at"],
+        "mean": round(stats["sum"] / stats["count"], digits),
+        "first": round(stats["first"], digits), "last": round(stats["last"], digits),
+        "change_pct": round((stats["last"] / stats["first"] - 1) * 100, 4) if stats["first"] else None,
+    }
+
+
+def evaluate_chunk(task):
+    """
+    回测一个磁带文件（在进程池中执行）。
+    按生产代码的逻辑逐段计算：换算走换算图的最优路径，定价使用 smart_price，
+    预警与 AlertEngine 一样按中间价交叉汇率严格比较阈值。
+    返回可与其他文件合并的部分结果。
+    """
+    path, start, end, scenario, codes, baseline, spread_bps = task
+    timestamps, values = records_to_arrays(read_tape_file(path, start, end), codes)
+    rows = len(timestamps)
+    result = {"rows": rows, "first_at": int(timestamps[0]) if rows else None, "last_at": int(timestamps[-1]) if rows else None,
+              "convert": [], "pricing": [], "alerts": []}
+    if rows == 0:
+        return result
+    column = {code: values[:, i] for i, code in enumerate(codes)}
+
+    # 换算：每个快照构建只含场景货币的换算图（与线上相同的寻路逻辑）
+    converted = np.full((rows, len(scenario["convert"])), np.nan)
+    if scenario["convert"]:
+        for r in range(rows):
+            rates = {code: float(values[r, i]) for i, code in enumerate(codes) if np.isfinite(values[r, i])}
+            graph = CurrencyGraph(table_quotes("USD", rates, spread_bps, "tape"))
+            for k, c in enumerate(scenario["convert"]):
+                rate = graph.rate(c["from"], c["to"])
+                if rate is not None:
+                    value = convert_amount(c["amount"], c["from"], c["to"], rate)
+                    converted[r, k] = np.nan if value is None else value
+    for k in range(len(scenario["convert"])):
+        result["convert"].append(_stats(converted[:, k], timestamps))
+
+    # 定价：按每个快照的汇率重新定价，并计算以回测起点价格销售时的实际利润率
+    for p in scenario["pricing"]:
+        markets = []
+        for market, margin in p["markets"].items():
+            _, price_local = smart_price(p["cost_cny"], margin, column[COST_CURRENCY], column[market], market)
+            _, base_price = smart_price(p["cost_cny"], margin, baseline[COST_CURRENCY], baseline[market], market)
+            # 售价固定为起点价格时，按当前汇率换回人民币的实际利润率（%）
+            realized = (base_price * column[COST_CURRENCY] / column[market] / p["cost_cny"] - 1) * 100
+            markets.append({
+                "price_local": _stats(price_local, timestamps),
+                "realized_margin": _stats(realized, timestamps),
+                "loss_snapshots": int(np.sum(realized < 0)),
+                "below_target_snapshots": int(np.sum(realized < margin)),
+            })
+        result["pricing"].append(markets)
+
+    # 预警：统计条件由不满足变为满足的次数（触发后重新布置）
+    for a in scenario["alerts"]:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            series = column[a["target"]] / column[a["base"]]
+        state = series > a["threshold"] if a["condition"] == ">" else series < a["threshold"]
+        edges = np.flatnonzero(state[1:] & ~state[:-1]) + 1
+        result["alerts"].append({
+            "first_state": bool(state[0]), "last_state": bool(state[-1]),
+            "edges": int(len(edges)), "first_edge_at": int(timestamps[edges[0]]) if len(edges) else None,
+            "in_condition": int(state.sum()),
+            "extreme": _stats(series, timestamps),
+        })
+    return result
+
+
+def merge_results(scenario, partials):
+    """
+    按时间顺序合并各文件的部分结果，生成回测报告。
+    """
+    partials = [p for p in partials if p["rows"]]
+    report = {"snapshots": sum(p["rows"] for p in partials),
+              "from": partials[0]["first_at"] if partials else None,
+              "to": partials[-1]["last_at"] if partials else None,
+              "convert": [], "pricing": [], "alerts": []}
+
+    for k, c in enumerate(scenario["convert"]):
+        stats = None
+        for p in partials:
+            stats = _merge_stats(stats, p["convert"][k])
+        report["convert"].append(dict(c, result=_summary(stats)))
+
+    for k, item in enumerate(scenario["pricing"]):
+        for m, (market, margin) in enumerate(item["markets"].items()):
+            price = realized = None
+            loss = below = 0
+            for p in partials:
+                part = p["pricing"][k][m]
+                price = _merge_stats(price, part["price_local"])
+                realized = _merge_stats(realized, part["realized_margin"])
+                loss += part["loss_snapshots"]
+                below += part["below_target_snapshots"]
+            report["pricing"].append({
+                "cost_cny": item["cost_cny"], "market": market, "margin": margin,
+                "price_local": _summary(price, 2),
+                "realized_margin_pct": _summary(realized, 4),
+                "loss_snapshots": loss,
+                "below_target_snapshots": below,
+            })
+
+    for k, a in enumerate(scenario["alerts"]):
+        fires = 0
+        first_fired = None
+        in_condition = 0
+        extreme = None
+        previous = None
+        for p in partials:
+            part = p["alerts"][k]
+            # 文件边界上的触发：本段第一条满足条件而上一段最后一条不满足（起点满足条件视为注册后立即触发）
+            if part["first_state"] and not previous:
+                fires += 1
+                first_fired = first_fired or p["first_at"]
+            fires += part["edges"]
+            first_fired = first_fired or part["first_edge_at"]
+            in_condition += part["in_condition"]
+            extreme = _merge_stats(extreme, part["extreme"])
+            previous = part["last_state"]
+        report["alerts"].append(dict(a, fires=fires, first_fired=first_fired,
+                                     snapshots_in_condition=in_condition, rate=_summary(extreme)))
+    return report
+
+
+def run_backtest(tape_dir, scenario, start=None, end=None, workers=None, spread_bps=RATES_SPREAD_BPS):
+    """
+    用磁带回放场景。每个磁带文件（一天）是一个任务，由进程池并行计算后按时间顺序合并。
+    workers 为 1 时在当前进程中执行。
+    """
+    tape = RateTape(tape_dir)
+    paths = tape.files(start, end)
+    codes = scenario_codes(scenario)
+    started = time.perf_counter()
+
+    # 定价的实际利润率以回测起点的汇率为基准
+    baseline = None
+    for record in tape.read(start, end):
+        rates = (record.get("data") or {}).get("conversion_rates")
+        if rates:
+            baseline = {code: rates.get(code, np.nan) for code in codes}
+            break
+    if baseline is None:
+        raise ValueError("磁带中没有符合条件的快照")
+
+    tasks = [(path, start, end, scenario, codes, baseline, spread_bps) for path in paths]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) == 1:
+        partials = [evaluate_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            partials = list(executor.map(evaluate_chunk, tasks))
+
+    report = merge_results(scenario, partials)
+    elapsed = time.perf_counter() - started
+    span = (report["to"] - report["from"]) if report["snapshots"] else 0
+    report.update({
+        "tape": tape_dir,
+        "files": len(paths),
+        "workers": min(workers, len(tasks)),
+        "elapsed_seconds": round(elapsed, 3),
+        "speedup": round(span / elapsed) if elapsed > 0 else None, # 回放速度是实际时间的多少倍
+    })
+    return report
+
+
+def main(argv=None):
+    from app.services.exchange_api import RATE_TAPE_DIR
+    parser = argparse.ArgumentParser(description="用汇率磁带回测换算、定价和预警")
+    parser.add_argument("scenario", help="回测场景 JSON 文件")
+    parser.add_argument("--tape", default=RATE_TAPE_DIR, help="磁带目录")
+    parser.add_argument("--from", dest="start", default=None, help="开始时间（Unix 秒或 YYYY-MM-DD）")
+    parser.add_argument("--to", dest="end", default=None, help="结束时间（Unix 秒或 YYYY-MM-DD）")
+    parser.add_argument("--workers", type=int, default=None, help="进程数（默认 CPU 核数）")
+    parser.add_argument("--output", default=None, help="报告输出文件（默认输出到标准输出）")
+    args = parser.parse_args(argv)
+
+    try:
+        scenario = load_scenario(args.scenario)
+        start = parse_time(args.start) if args.start else None
+        end = parse_time(args.end) if args.end else None
+        report = run_backtest(args.tape, scenario, start, end, args.workers)
+    except (OSError, ValueError) as e:
+        print(f"回测失败: {e}")
+        return 1
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"报告已写入 {args.output}")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    # python -m app.services.backtest scenario.json [--tape data/rate_tape] [--from 2024-01-01] [--workers 4]
+    sys.exit(main())
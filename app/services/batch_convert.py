@@ -0,0 +1,251 @@
+import os
+import io
+import csv
+import json
+import codecs
+import tempfile
+import numpy as np
+from dotenv import load_dotenv
+from app.services.money import to_minor, from_minor, convert_minor
+
+load_dotenv()
+
+# 各字段可用的列名（CSV 表头或 NDJSON 字段名）
+AMOUNT_KEYS = ("amount",)
+FROM_KEYS = ("from_curr", "from")
+TO_KEYS = ("to_curr", "to")
+
+# 每个向量化计算块的行数，决定了批量换算的内存上限
+BATCH_CHUNK_ROWS = int(os.getenv("BATCH_CHUNK_ROWS", "5000"))
+# 请求体在内存中缓冲的上限（字节），超过后转存到临时文件
+BATCH_SPOOL_BYTES = int(os.getenv("BATCH_SPOOL_BYTES", str(8 * 1024 * 1024)))
+READ_CHUNK_BYTES = 64 * 1024
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class BatchFormatError(ValueError):
+    """
+    批量换算输入格式错误（例如 CSV 缺少必需的列）。
+    """
+    pass
+
+
+def detect_format(content_type):
+    """
+    根据 Content-Type 判断输入格式，无法判断时默认为 CSV。
+    """
+    content_type = (content_type or "").lower()
+    if "ndjson" in content_type or "jsonl" in content_type or "json" in content_type:
+        return "ndjson"
+    return "csv"
+
+
+async def spool_body(byte_stream):
+    """
+    把请求体转存到 SpooledTemporaryFile（超过 BATCH_SPOOL_BYTES 后落盘）。
+    StreamingResponse 输出期间会占用 receive 监听客户端断开，无法同时读取请求体，
+    因此先转存再逐块读取，内存占用仍然有上限。
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_BYTES)
+    async for chunk in byte_stream:
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def open_text(f):
+    """
+    先完整校验已转存的请求体是 UTF-8（在开始流式输出前就能返回 400），
+    再以文本流的形式重新打开。newline="" 保留原始换行，csv.reader 才能正确处理引号内的换行。
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for chunk in iter(lambda: f.read(READ_CHUNK_BYTES), b""):
+            decoder.decode(chunk)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise BatchFormatError("请求体不是 UTF-8 编码")
+    f.seek(0)
+    return io.TextIOWrapper(f, encoding="utf-8-sig", newline="")
+
+
+def parse_amounts(values):
+    """
+    把金额字符串批量转换为 float64 数组，无法解析的值为 NaN。
+    """
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        amounts = np.full(len(values), np.nan)
+        for i, value in enumerate(values):
+            try:
+                amounts[i] = float(value)
+            except (TypeError, ValueError):
+                pass
+        return amounts
+
+
+def convert_columns(matrix, amounts, from_codes, to_codes):
+    """
+    对一整块数据做向量化换算。金额按源货币的最小单位转为整数，用整数汇率矩阵换算，
+    结果按目标货币的小数位银行家舍入。
+    返回 (汇率数组, 结果数组, 有效掩码)；无效行（金额无法解析、超出范围或货币未知）的汇率和结果为 NaN。
+    """
+    amounts = parse_amounts(amounts)
+    from_idx = matrix.indices(from_codes)
+    to_idx = matrix.indices(to_codes)
+    known = (from_idx >= 0) & (to_idx >= 0)
+    from_exp = matrix.minor_units[from_idx]
+    to_exp = matrix.minor_units[to_idx]
+    significands, exponents = matrix.scaled
+    minor, parsed = to_minor(amounts, from_exp)
+    converted, ok = convert_minor(minor, from_exp, to_exp, significands[from_idx, to_idx], exponents[from_idx, to_idx])
+    valid = known & parsed & ok
+    rates = np.where(valid, matrix.matrix[from_idx, to_idx], np.nan)
+    results = np.where(valid, from_minor(converted, to_exp), np.nan)
+    return rates, results, valid
+
+
+def _first(row, names):
+    """
+    返回 row 中第一个非空的字段值。
+    """
+    for name in names:
+        value = row.get(name)
+        if value is not None:
+            return value
+    return None
+
+
+class BatchConverter:
+    """
+    流式批量换算。
+    按 BATCH_CHUNK_ROWS 行一块读取输入，每块基于同一个交叉汇率矩阵（同一份快照）做向量化换算，
+    换算完立即输出，内存占用与输入大小无关。
+    CSV 需要 amount、from_curr(或 from)、to_curr(或 to) 列，其余列原样输出；
+    NDJSON 每行一个对象，字段名相同。输出在原字段基础上追加 rate 和 result。
+    缺少货币列时可用 default_from / default_to 指定整批的默认货币。
+    """
+    def __init__(self, matrix, input_format="csv", output_format=None, default_from=None, default_to=None):
+        self.matrix = matrix
+        self.input_format = input_format
+        self.output_format = output_format or input_format
+        self.default_from = default_from
+        self.default_to = default_to
+        self._text = None
+        self._reader = None
+        self._header = None
+
+    @property
+    def media_type(self):
+        return MEDIA_TYPES[self.output_format]
+
+    def _pick(self, names, default, label):
+        for name in names:
+            if name in self._header:
+                return name
+        if default is None:
+            raise BatchFormatError(f"CSV 缺少 {label} 列")
+        return None
+
+    def open(self, f):
+        """
+        开始读取已转存的请求体（取得文件的所有权，输出结束后关闭）。
+        编码和 CSV 表头会先校验，这样格式错误可以在开始输出前返回。
+        """
+        self._text = open_text(f)
+        if self.input_format == "csv":
+            self._reader = csv.reader(self._text)
+            try:
+                self._header = next(self._reader, None)
+            except csv.Error as e:
+                raise BatchFormatError(f"CSV 格式错误: {e}")
+            if not self._header:
+                raise BatchFormatError("CSV 为空")
+            self._amount_key = self._pick(AMOUNT_KEYS, None, "amount")
+            self._from_key = self._pick(FROM_KEYS, self.default_from, "from_curr")
+            self._to_key = self._pick(TO_KEYS, self.default_to, "to_curr")
+
+    def _records(self):
+        """
+        逐条读取输入记录（字典），跳过空行。
+        CSV 由同一个 csv.reader 读完整个文本流，引号内含换行的字段可以跨行。
+        """
+        if self.input_format == "csv":
+            for values in self._reader:
+                if values:
+                    yield dict(zip(self._header, values))
+            return
+        for line in self._text:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = {}
+            yield row if isinstance(row, dict) else {}
+
+    def _chunks(self):
+        chunk = []
+        for row in self._records():
+            chunk.append(row)
+            if len(chunk) >= BATCH_CHUNK_ROWS:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _convert(self, rows):
+        if self.input_format == "csv":
+            # CSV 的列名已由表头确定
+            amount_keys, from_keys, to_keys = (self._amount_key,), (self._from_key,), (self._to_key,)
+        else:
+            # NDJSON 每行可以使用任一别名
+            amount_keys, from_keys, to_keys = AMOUNT_KEYS, FROM_KEYS, TO_KEYS
+        amounts = [_first(row, amount_keys) for row in rows]
+        from_codes = [str(_first(row, from_keys) or self.default_from or "").upper() for row in rows]
+        to_codes = [str(_first(row, to_keys) or self.default_to or "").upper() for row in rows]
+        return convert_columns(self.matrix, amounts, from_codes, to_codes)
+
+    def _format(self, rows, rates, results, valid, first):
+        out = io.StringIO()
+        if self.output_format == "csv":
+            writer = csv.writer(out, lineterminator="\n")
+            # NDJSON 输入时按规范字段名输出（取各别名中第一个存在的值）
+            fields = [(f,) for f in self._header] if self._header else [AMOUNT_KEYS, FROM_KEYS, TO_KEYS]
+            if first:
+                writer.writerow([names[0] for names in fields] + ["rate", "result"])
+            for i, row in enumerate(rows):
+                extra = [repr(float(rates[i])), repr(float(results[i]))] if valid[i] else ["", ""]
+                writer.writerow([_first(row, names) or "" for names in fields] + extra)
+        else:
+            for i, row in enumerate(rows):
+                row["rate"] = float(rates[i]) if valid[i] else None
+                row["result"] = float(results[i]) if valid[i] else None
+                out.write(json.dumps(row, ensure_ascii=False))
+                out.write("\n")
+        return out.getvalue().encode("utf-8")
+
+    async def stream(self):
+        """
+        逐块换算并输出编码后的结果。
+        """
+        first = True
+        try:
+            for rows in self._chunks():
+                rates, results, valid = self._convert(rows)
+                yield self._format(rows, rates, results, valid, first)
+                first = False
+            if first and self.output_format == "csv":
+                # 没有数据行时仍输出表头
+                yield self._format([], [], [], [], True)
+        finally:
+            self.close()
+
+    def close(self):
+        if self._text is not None:
+            self._text.close()
@@ -0,0 +1,82 @@
+import os
+import asyncio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 每个订阅者的消息队列长度，队列满时丢弃最旧的消息
+BROADCAST_QUEUE_SIZE = int(os.getenv("BROADCAST_QUEUE_SIZE", "8"))
+# SSE 心跳间隔（秒），防止代理断开空闲连接
+SSE_HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))
+
+
+class Broadcaster:
+    """
+    服务端推送广播器。
+    每个订阅者（一个 SSE 连接）拥有自己的有界队列，发布消息时只做非阻塞入队：
+    慢客户端的队列满了就丢弃它最旧的消息，不会拖慢发布者或其他客户端。
+    消息内容在发布前只生成一次，服务端的工作量只与更新次数相关，与客户端数量无关。
+    """
+    def __init__(self, queue_size=BROADCAST_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = set()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        """
+        新建一个订阅队列（在事件循环中调用）。
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event, data):
+        """
+        向所有订阅者发布一条消息。
+        data 可以是字符串，也可以是 {语言: 字符串}（按订阅者的语言选择）。
+        """
+        message = (event, data)
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # 慢客户端：丢弃最旧的一条，保证最新的数据总能送达
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+                queue.put_nowait(message)
+
+    async def stream(self, queue, lang=None):
+        """
+        把订阅队列转换为 SSE 文本流，空闲时定期发送心跳注释。
+        连接断开时自动取消订阅。
+        """
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if isinstance(data, dict):
+                    data = data.get(lang) or next(iter(data.values()), "")
+                yield format_sse(event, data)
+        finally:
+            self.unsubscribe(queue)
+
+
+def format_sse(event, data):
+    """
+    按 SSE 协议格式化一条消息（多行数据需要逐行加 data: 前缀）。
+    """
+    lines = "".join(f"data: {line}\n" for line in data.splitlines() or [""])
+    return f"event: {event}\n{lines}\n"
+
+# 创建全局单例实例
+broadcaster = Broadcaster()
@@ -0,0 +1,310 @@
+import io
+import os
+import csv
+import json
+from itertools import zip_longest
+import numpy as np
+from dotenv import load_dotenv
+from app.services.batch_convert import BatchFormatError, parse_amounts
+from app.services.money import minor_unit, minor_units, to_minor, from_minor, scale_rates, convert_minor
+
+load_dotenv()
+
+# 流式输出时每块包含的 SKU 行数
+BULK_CHUNK_ROWS = int(os.getenv("BULK_CHUNK_ROWS", "5000"))
+
+# 成本计价货币（与采购比价、智能定价一致）
+COST_CURRENCY = "CNY"
+
+
+def smart_price(cost_cny, margin_pct, cny_rate, market_rate, market=None):
+    """
+    智能定价：人民币成本加上利润率后换算为市场货币（CNY -> USD -> 市场货币，汇率均为 USD 基准）。
+    参数可以是数值，也可以是 numpy 数组（回测时对整段汇率序列一次计算）。
+    成本按分转为整数后用整数运算计算，人民币售价精确到分，当地货币售价按 market 的小数位舍入。
+    返回 (人民币售价, 当地货币售价)，无法计算的位置为 NaN。
+    """
+    cny_exp = minor_unit(COST_CURRENCY)
+    market_exp = minor_unit(market)
+    markup = 1 + np.asarray(margin_pct, dtype=np.float64) / 100.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        to_market = markup * np.asarray(market_rate, dtype=np.float64) / np.asarray(cny_rate, dtype=np.float64)
+    cost, ok = to_minor(cost_cny, cny_exp)
+    price_cny, ok_cny = convert_minor(cost, cny_exp, cny_exp, *scale_rates(markup))
+    price_local, ok_local = convert_minor(cost, cny_exp, market_exp, *scale_rates(to_market))
+    price_cny = np.where(ok & ok_cny, from_minor(price_cny, cny_exp), np.nan)
+    price_local = np.where(ok & ok_local, from_minor(price_local, market_exp), np.nan)
+    if price_local.ndim == 0:
+        return float(price_cny), float(price_local)
+    return np.broadcast_to(price_cny, price_local.shape), price_local
+
+
+def parse_markets(text):
+    """
+    解析市场与利润率，如 "USD:20,EUR:25,JPY:30"（利润率为百分比）。
+    返回 [(货币, 利润率), ...]。
+    """
+    markets = []
+    for part in (text or "").split(","):
+        if not part.strip():
+            continue
+        code, _, margin = part.partition(":")
+        try:
+            markets.append((code.strip().upper(), float(margin or 0)))
+        except ValueError:
+            raise BatchFormatError(f"无效的利润率: {part}")
+    return markets
+
+
+def _markets_from_json(items):
+    markets = []
+    for item in items or []:
+        try:
+            markets.append((str(item["market"]).upper(), float(item.get("margin", 0))))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise BatchFormatError(f"无效的市场: {item}")
+    return markets
+
+
+def _rows_to_columns(rows):
+    """
+    把字典行转换为列式数据 {列名: 值列表}。
+    """
+    rows = [row if isinstance(row, dict) else {} for row in rows]
+    names = {}
+    for row in rows:
+        for key in row:
+            names.setdefault(key, None)
+    return {name: [row.get(name) for row in rows] for name in names}, len(rows)
+
+
+def read_quotes(f, input_format):
+    """
+    读取报价数据，返回 (列式报价数据 {列名: 值列表}, 行数, 请求体中的市场列表)。
+    CSV 直接按列转置，不为每行创建字典。
+    csv:    表头含 sku、amount、currency，可选 supplier、freight、duty_pct；
+            也可以只给 sku、cost_cny（视为人民币成本）；currency 为空时按人民币计算。
+    json:   {"quotes": [...], "markets": [{"market": "USD", "margin": 20}, ...]} 或报价数组。
+    ndjson: 每行一个报价对象。
+    """
+    # 分组比价需要全部报价，这里整体读入后解析
+    try:
+        text = io.StringIO(f.read().decode("utf-8-sig"), newline="")
+    except UnicodeDecodeError:
+        raise BatchFormatError("请求体不是 UTF-8 编码")
+    if input_format == "csv":
+        reader = csv.reader(text)
+        try:
+            header = next(reader, None)
+            if not header or "sku" not in header:
+                raise BatchFormatError("CSV 缺少 sku 列")
+            if "amount" not in header and "cost_cny" not in header:
+                raise BatchFormatError("CSV 缺少 amount 或 cost_cny 列")
+            rows = [row for row in reader if row]
+        except csv.Error as e:
+            raise BatchFormatError(f"CSV 格式错误: {e}")
+        # 按列转置；列数不足的行补空值，多出的列忽略
+        columns = list(zip_longest(*rows, fillvalue=""))[:len(header)] if rows else []
+        columns += [()] * (len(header) - len(columns))
+        return {name: list(values) or [""] * len(rows) for name, values in zip(header, columns)}, len(rows), []
+
+    if input_format == "ndjson":
+        rows = []
+        for line in text:
+            if line.strip():
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    rows.append({})
+        return _rows_to_columns(rows) + ([],)
+
+    try:
+        data = json.load(text)
+    except ValueError:
+        raise BatchFormatError("JSON 格式错误")
+    if isinstance(data, list):
+        return _rows_to_columns(data) + ([],)
+    if not isinstance(data, dict) or not isinstance(data.get("quotes"), list):
+        raise BatchFormatError("JSON 缺少 quotes 数组")
+    return _rows_to_columns(data["quotes"]) + (_markets_from_json(data.get("markets")),)
+
+
+def _amount_column(columns, key, n):
+    """
+    读取数值列，缺失或无法解析的值为 NaN（没有该列时直接返回 NaN 数组）。
+    """
+    values = columns.get(key)
+    if values is None:
+        return np.full(n, np.nan)
+    return parse_amounts(values)
+
+
+class BulkPricer:
+    """
+    批量定价与比价。
+    一次请求基于同一份交叉汇率矩阵，把所有报价整体作为数组计算：
+      到岸成本(CNY) = (报价 + 运费) × 汇率[报价货币 → CNY] × (1 + 关税%)
+    按 SKU 分组找出最低到岸成本的供应商，再用 SKU × 市场 的矩阵运算得出各市场建议售价：
+      建议售价(当地货币) = 最低成本 × (1 + 利润率%) × 汇率[CNY → 市场货币]
+    金额全部按各货币的最小单位以 int64 整数计算（见 money），每一步按银行家舍入，合计没有浮点误差。
+    计算完成后按块流式输出，grid 视图每个 SKU 一行，quotes 视图每条报价一行（带最低价标记）。
+    """
+    def __init__(self, matrix, markets):
+        if not markets:
+            raise BatchFormatError("至少需要一个市场")
+        self.matrix = matrix
+        self.market_codes = [code for code, _ in markets]
+        unknown = [code for code in self.market_codes if matrix.rate(COST_CURRENCY, code) is None]
+        if unknown:
+            raise BatchFormatError(f"未知的市场货币: {', '.join(unknown)}")
+        self.margins = np.array([margin for _, margin in markets], dtype=np.float64)
+
+    def compute(self, columns, n):
+        """
+        对全部报价（列式数据，共 n 行）做向量化计算（CPU 密集，应在线程池中调用）。
+        """
+        self.columns = columns
+        self.rows = n
+        skus = [str(s) if s is not None else "" for s in columns.get("sku", [""] * n)]
+        amounts = _amount_column(columns, "amount", n)
+        currencies = [str(c).upper() if c else "" for c in columns.get("currency", [""] * n)]
+        # 只给出人民币成本的行
+        cost_cny = _amount_column(columns, "cost_cny", n)
+        use_cost = np.isnan(amounts) & np.isfinite(cost_cny)
+        amounts = np.where(use_cost, cost_cny, amounts)
+        if use_cost.any() or not all(currencies):
+            currencies = [COST_CURRENCY if use_cost[i] or not c else c for i, c in enumerate(currencies)]
+
+        freight = np.nan_to_num(_amount_column(columns, "freight", n), nan=0.0)
+        duty = np.nan_to_num(_amount_column(columns, "duty_pct", n), nan=0.0)
+
+        currency_idx = self.matrix.indices(currencies)
+        cny = self.matrix.index[COST_CURRENCY]
+        cny_exp = minor_unit(COST_CURRENCY)
+        quote_exp = self.matrix.minor_units[currency_idx]
+        significands, exponents = self.matrix.scaled
+        # (报价 + 运费) 按报价货币的最小单位取整后换算为人民币分，再计关税
+        quote_minor, ok_amount = to_minor(amounts, quote_exp)
+        freight_minor, ok_freight = to_minor(freight, quote_exp)
+        cost_cny, ok_cny = convert_minor(quote_minor + freight_minor, quote_exp, cny_exp,
+                                         significands[currency_idx, cny], exponents[currency_idx, cny])
+        landed_minor, ok_duty = convert_minor(cost_cny, cny_exp, cny_exp, *scale_rates(1 + duty / 100.0))
+        valid = ((currency_idx >= 0) & np.isfinite(amounts) & np.array([s != "" for s in skus], dtype=bool)
+                 & ok_amount & ok_freight & ok_cny & ok_duty)
+        self.landed_minor = np.where(valid, landed_minor, 0)
+        landed = np.where(valid, from_minor(landed_minor, cny_exp), np.nan)
+
+        # 按 SKU 分组（组号按首次出现的顺序分配），组内按到岸成本升序，第一条即为最低价
+        groups = {}
+        group = np.fromiter((groups.setdefault(s, len(groups)) for s in skus), dtype=np.int64, count=n)
+        sort_key = np.where(valid, landed, np.inf)
+        order = np.lexsort((sort_key, group))
+        sorted_group = group[order]
+        starts = np.flatnonzero(np.r_[True, sorted_group[1:] != sorted_group[:-1]]) if n else np.empty(0, dtype=np.int64)
+        best_row = order[starts]
+        best_valid = valid[best_row]
+
+        self.skus = list(groups)
+        self.landed = landed
+        self.valid = valid
+        self.best_row = best_row
+        self.best_cost = np.where(best_valid, landed[best_row], np.nan)
+        self.best_cost_minor = np.where(best_valid, self.landed_minor[best_row], 0)
+        self.quote_counts = np.bincount(group, weights=valid, minlength=len(groups)).astype(np.int64)
+        self.cheapest = np.zeros(n, dtype=bool)
+        self.cheapest[best_row[best_valid]] = True
+        if "" in groups:
+            # 缺少 SKU 的报价只计入无效报价，不出现在价格表中
+            keep = np.arange(len(groups)) != groups[""]
+            self.skus = [sku for sku in self.skus if sku]
+            self.best_row = self.best_row[keep]
+            self.best_cost = self.best_cost[keep]
+            self.best_cost_minor = self.best_cost_minor[keep]
+            self.quote_counts = self.quote_counts[keep]
+
+        # SKU × 市场 价格矩阵：每个市场的 (1 + 利润率) × 汇率合成一个整数汇率，一次舍入
+        from_cny = self.matrix.matrix[cny, self.matrix.indices(self.market_codes)]
+        market_exp = minor_units(self.market_codes)
+        significands, exponents = scale_rates((1 + self.margins / 100.0) * from_cny)
+        prices, ok_price = convert_minor(self.best_cost_minor[:, None], cny_exp, market_exp[None, :],
+                                         significands[None, :], exponents[None, :])
+        priced = np.isfinite(self.best_cost)[:, None] & ok_price
+        self.price_local = np.where(priced, from_minor(prices, market_exp[None, :]), np.nan)
+        return self
+
+    def summary(self):
+        """
+        返回汇总信息：SKU 数、有效报价数、无法定价的 SKU 数、最低成本合计。
+        """
+        priced = np.isfinite(self.best_cost)
+        return {
+            "skus": int(len(self.skus)),
+            "quotes": int(self.valid.sum()),
+            "invalid_quotes": int(len(self.valid) - self.valid.sum()),
+            "unpriced_skus": int((~priced).sum()),
+            "markets": len(self.market_codes),
+            "total_best_cost_cny": float(from_minor(int(self.best_cost_minor[priced].sum()), minor_unit(COST_CURRENCY))),
+        }
+
+    def _supplier(self, row_index):
+        suppliers = self.columns.get("supplier")
+        return str(suppliers[row_index] or "") if suppliers else ""
+
+    def _grid_chunk(self, lo, hi, output_format, first):
+        out = io.StringIO()
+        price_fields = [f"price_{code}" for code in self.market_codes]
+        if output_format == "csv":
+            writer = csv.writer(out, lineterminator="\n")
+            if first:
+                writer.writerow(["sku", "best_supplier", "best_cost_cny", "quotes"] + price_fields)
+            prices = self.price_local[lo:hi].tolist()
+            for i in range(lo, hi):
+                if np.isfinite(self.best_cost[i]):
+                    writer.writerow([self.skus[i], self._supplier(self.best_row[i]), float(self.best_cost[i]), int(self.quote_counts[i])] + prices[i - lo])
+                else:
+                    writer.writerow([self.skus[i], "", "", 0] + [""] * len(price_fields))
+        else:
+            for i in range(lo, hi):
+                priced = bool(np.isfinite(self.best_cost[i]))
+                out.write(json.dumps({
+                    "sku": self.skus[i],
+                    "best_supplier": self._supplier(self.best_row[i]) if priced else None,
+                    "best_cost_cny": float(self.best_cost[i]) if priced else None,
+                    "quotes": int(self.quote_counts[i]),
+                    "prices": dict(zip(self.market_codes, self.price_local[i].tolist())) if priced else None,
+                }, ensure_ascii=False))
+                out.write("\n")
+        return out.getvalue().encode("utf-8")
+
+    def _quotes_chunk(self, lo, hi, output_format, first):
+        out = io.StringIO()
+        names = list(self.columns)
+        values = [self.columns[name][lo:hi] for name in names]
+        landed = self.landed[lo:hi].tolist()
+        valid = self.valid[lo:hi].tolist()
+        cheapest = self.cheapest[lo:hi].tolist()
+        if output_format == "csv":
+            writer = csv.writer(out, lineterminator="\n")
+            if first:
+                writer.writerow(names + ["landed_cny", "is_cheapest"])
+            for i, row in enumerate(zip(*values) if names else [()] * (hi - lo)):
+                writer.writerow(list(row) + [landed[i] if valid[i] else "", int(cheapest[i])])
+        else:
+            for i, row in enumerate(zip(*values) if names else [()] * (hi - lo)):
+                item = {name: value for name, value in zip(names, row) if value is not None}
+                item["landed_cny"] = landed[i] if valid[i] else None
+                item["is_cheapest"] = cheapest[i]
+                out.write(json.dumps(item, ensure_ascii=False))
+                out.write("\n")
+        return out.getvalue().encode("utf-8")
+
+    async def stream(self, output_format="csv", view="grid"):
+        """
+        按块输出计算结果。
+        """
+        total = len(self.skus) if view == "grid" else self.rows
+        render = self._grid_chunk if view == "grid" else self._quotes_chunk
+        if total == 0 and output_format == "csv":
+            yield render(0, 0, output_format, True)
+        for lo in range(0, total, BULK_CHUNK_ROWS):
+            yield render(lo, min(lo + BULK_CHUNK_ROWS, total), output_format, lo == 0)
@@ -0,0 +1,59 @@
+import numpy as np
+from app.services.money import minor_units, scale_rates
+
+
+class CrossRateMatrix:
+    """
+    交叉汇率矩阵。
+    由一份 USD 基准汇率快照一次性构建 N×N 矩阵（外积），
+    matrix[i, j] 表示 1 单位 codes[i] 可兑换多少单位 codes[j]。
+    同一份快照只构建一次，之后的换算和矩阵查询都是查表。
+    金额换算使用整数表示的汇率矩阵（见 money.scale_rates），同样每份快照只计算一次。
+    """
+    def __init__(self, rates, timestamp=None):
+        # 只保留有效的正数汇率，避免除零
+        self.codes = [c for c, v in rates.items() if isinstance(v, (int, float)) and v > 0]
+        self.index = {c: i for i, c in enumerate(self.codes)}
+        usd_rates = np.array([rates[c] for c in self.codes], dtype=np.float64)
+        self.matrix = np.outer(1.0 / usd_rates, usd_rates)
+        self.minor_units = minor_units(self.codes) # 各货币的小数位数
+        self._scaled = None
+        self.source = rates
+        self.timestamp = timestamp
+
+    @property
+    def scaled(self):
+        """
+        整数汇率矩阵 (有效数字, 指数)，首次使用时计算。
+        """
+        if self._scaled is None:
+            self._scaled = scale_rates(self.matrix)
+        return self._scaled
+
+    def rate(self, from_curr, to_curr):
+        """
+        返回 from_curr -> to_curr 的汇率，未知货币返回 None。
+        """
+        i = self.index.get(from_curr)
+        j = self.index.get(to_curr)
+        if i is None or j is None:
+            return None
+        return float(self.matrix[i, j])
+
+    def indices(self, codes):
+        """
+        把货币代码列表映射为矩阵下标数组，未知货币为 -1。
+        """
+        return np.array([self.index.get(c, -1) for c in codes], dtype=np.intp)
+
+    def sub_matrix(self, bases, quotes):
+        """
+        取出 bases × quotes 子矩阵。
+        返回 (有效的 bases, 有效的 quotes, 子矩阵, 未知货币列表)。
+        """
+        known_bases = [c for c in bases if c in self.index]
+        known_quotes = [c for c in quotes if c in self.index]
+        unknown = [c for c in dict.fromkeys(bases + quotes) if c not in self.index]
+        rows = self.indices(known_bases)
+        cols = self.indices(known_quotes)
+        return known_bases, known_quotes, self.matrix[np.ix_(rows, cols)], unknown
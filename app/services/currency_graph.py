@@ -0,0 +1,201 @@
+import os
+import json
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 主汇率快照（USD 基准中间价）的买卖价差（基点），0 表示按中间价换算
+RATES_SPREAD_BPS = float(os.getenv("RATES_SPREAD_BPS", "0"))
+# 其他报价文件（银行报价等），见 load_quotes
+CURRENCY_QUOTES_FILE = os.getenv("CURRENCY_QUOTES_FILE", "")
+# 闭环收益超过该比例（如 1e-6 即 0.01 基点）才视为报价不一致
+INCONSISTENCY_TOLERANCE = float(os.getenv("INCONSISTENCY_TOLERANCE", "1e-6"))
+
+# 每多走一步的微小代价（对数空间），使等价路径中优先选择步数最少的，并吸收浮点误差形成的伪闭环
+HOP_PENALTY = 1e-12
+
+
+def table_quotes(base, rates, spread_bps=0, source=""):
+    """
+    把一张以 base 计价的中间价表（1 base = rates[X] X）展开为双向报价边。
+    价差平均分摊到买卖两侧。返回 [(源货币, 目标货币, 汇率, 来源), ...]。
+    """
+    keep = 1 - spread_bps / 20000.0
+    edges = []
+    for code, rate in rates.items():
+        if code == base or not isinstance(rate, (int, float)) or rate <= 0:
+            continue
+        edges.append((base, code, rate * keep, source))
+        edges.append((code, base, keep / rate, source))
+    return edges
+
+
+def pair_quotes(base, quote, bid, ask, source=""):
+    """
+    双边报价：卖出 1 base 得到 bid 个 quote，买入 1 base 需要 ask 个 quote。
+    """
+    edges = []
+    if bid and bid > 0:
+        edges.append((base, quote, bid, source))
+    if ask and ask > 0:
+        edges.append((quote, base, 1.0 / ask, source))
+    return edges
+
+
+def load_quotes(path):
+    """
+    读取报价文件，返回报价边列表。文件为 JSON 数组，每项为以下两种之一：
+      {"base": "EUR", "rates": {"CNY": 7.81, ...}, "spread_bps": 20, "source": "bank"}  中间价表
+      {"base": "EUR", "quote": "CNY", "bid": 7.80, "ask": 7.86, "source": "bank"}      双边报价
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    edges = []
+    for item in items:
+        base = str(item.get("base", "")).upper()
+        source = item.get("source") or os.path.basename(path)
+        if "rates" in item:
+            rates = {str(c).upper(): v for c, v in item["rates"].items()}
+            edges += table_quotes(base, rates, float(item.get("spread_bps", 0)), source)
+        elif "quote" in item:
+            edges += pair_quotes(base, str(item["quote"]).upper(), item.get("bid"), item.get("ask"), source)
+    return edges
+
+
+class CurrencyGraph:
+    """
+    多基准货币换算图。
+    每条报价是一条有向边，权重为 -log(汇率)，同一货币对有多个报价时只保留最优的一条。
+    对每份快照用 Floyd–Warshall（按中间节点逐步做 N×N 向量运算）一次性求出所有货币对的最优路径，
+    并记录下一跳矩阵；之后每次换算只需查表，路径按需还原并缓存。
+    权重和为负的闭环表示沿环兑换一圈会多出钱，即报价之间存在三角不一致，会被单独标记出来。
+    """
+    def __init__(self, edges, source=None, timestamp=None):
+        codes = sorted({e[0] for e in edges} | {e[1] for e in edges})
+        self.codes = codes
+        self.index = {c: i for i, c in enumerate(codes)}
+        self.source = source # 构建该图的汇率快照对象，用于判断是否需要重建
+        self.timestamp = timestamp
+        n = len(codes)
+        weights = np.full((n, n), np.inf)
+        edge_rates = np.zeros((n, n))
+        sources = {}
+        for from_curr, to_curr, rate, source in edges:
+            i, j = self.index[from_curr], self.index[to_curr]
+            w = -np.log(rate)
+            if w < weights[i, j]:
+                weights[i, j] = w
+                edge_rates[i, j] = rate
+                sources[(i, j)] = source
+        np.fill_diagonal(weights, 0.0)
+        np.fill_diagonal(edge_rates, 1.0)
+        self.weights = weights # 直接报价边的权重
+        self.edge_rates = edge_rates # 直接报价边的原始汇率
+        self.sources = sources
+        self._routes = {}
+        self._solve()
+
+    def _solve(self):
+        n = len(self.codes)
+        dist = np.where(np.isfinite(self.weights), self.weights + HOP_PENALTY, np.inf)
+        np.fill_diagonal(dist, 0.0)
+        nxt = np.where(np.isfinite(dist), np.arange(n)[None, :], -1)
+        for k in range(n):
+            candidate = dist[:, k, None] + dist[None, k, :]
+            better = candidate < dist
+            if better.any():
+                dist = np.where(better, candidate, dist)
+                nxt = np.where(better, nxt[:, k, None], nxt)
+        self.dist = dist
+        self.next_hop = nxt
+        # 对角线为负说明该货币处在一个收益为正的闭环上
+        self.inconsistent = np.flatnonzero(np.diag(dist) < -INCONSISTENCY_TOLERANCE)
+
+    def _walk(self, i, j):
+        """
+        按下一跳矩阵还原 i -> j 的路径节点；遇到闭环（报价不一致时可能出现）返回 None。
+        """
+        path = [i]
+        seen = {i}
+        while i != j:
+            i = int(self.next_hop[i, j])
+            if i < 0 or i in seen:
+                return None
+            path.append(i)
+            seen.add(i)
+        return path
+
+    def route(self, from_curr, to_curr):
+        """
+        返回 from_curr -> to_curr 的最优换算 (实际汇率, 路径)，路径为
+        [{"from", "to", "rate", "source"}, ...]；无法换算时返回 None。
+        实际汇率按路径上各条报价相乘得出，不包含寻路时的步数代价。
+        """
+        key = (from_curr, to_curr)
+        if key in self._routes:
+            return self._routes[key]
+        i = self.index.get(from_curr)
+        j = self.index.get(to_curr)
+        result = None
+        if i is not None and j is not None:
+            if i == j:
+                result = (1.0, [])
+            else:
+                path = self._walk(i, j)
+                if path is None and np.isfinite(self.weights[i, j]):
+                    # 存在不一致闭环时最优路径没有意义，退回直接报价
+                    path = [i, j]
+                if path is not None:
+                    hops = [{
+                        "from": self.codes[a],
+                        "to": self.codes[b],
+                        "rate": float(self.edge_rates[a, b]),
+                        "source": self.sources.get((a, b), "")
+                    } for a, b in zip(path, path[1:])]
+                    rate = 1.0
+                    for hop in hops:
+                        rate *= hop["rate"]
+                    result = (rate, hops)
+        self._routes[key] = result
+        return result
+
+    def rate(self, from_curr, to_curr):
+        """
+        返回 from_curr -> to_curr 的最优实际汇率，无法换算时返回 None。
+        """
+        result = self.route(from_curr, to_curr)
+        return result[0] if result else None
+
+    def inconsistencies(self):
+        """
+        返回报价不一致的闭环：[{"cycle": [货币, ...], "gain_pct": 兑换一圈的收益百分比}, ...]。
+        """
+        cycles = []
+        seen = set()
+        for i in self.inconsistent.tolist():
+            # 沿下一跳走一圈得到闭环
+            cycle = [i]
+            node = int(self.next_hop[i, i])
+            while node >= 0 and node not in cycle and len(cycle) <= len(self.codes):
+                cycle.append(node)
+                node = int(self.next_hop[node, i])
+            key = frozenset(cycle)
+            if node != i or key in seen:
+                continue
+            seen.add(key)
+            weight = sum(self.weights[a, b] for a, b in zip(cycle, cycle[1:] + cycle[:1]))
+            cycles.append({
+                "cycle": [self.codes[c] for c in cycle] + [self.codes[i]],
+                "gain_pct": round(float(np.expm1(-weight)) * 100, 6)
+            })
+        return cycles
+
+
+def format_route(hops):
+    """
+    把路径格式化为 "EUR → USD → CNY"。
+    """
+    if not hops:
+        return ""
+    return " → ".join([hops[0]["from"]] + [hop["to"] for hop in hops])
@@ -0,0 +1,162 @@
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+import numpy as np
+from dotenv import load_dotenv
+from app.services.volatility import parse_window
+
+load_dotenv()
+
+# 历史趋势图默认最多返回的点数（0 表示不降采样）及允许的上限
+HISTORY_MAX_POINTS = int(os.getenv("HISTORY_MAX_POINTS", "1000"))
+HISTORY_POINTS_LIMIT = 10000
+# 降采样结果缓存的条目上限
+HISTORY_SERIES_CACHE_SIZE = int(os.getenv("HISTORY_SERIES_CACHE_SIZE", "128"))
+
+
+def parse_time(value):
+    """
+    解析时间参数：Unix 秒，或 UTC 日期/时间（YYYY-MM-DD、YYYY-MM-DDTHH:MM[:SS]）。
+    """
+    value = (value or "").strip()
+    if value.isdigit():
+        return int(value)
+    for fmt in ("%Y-%m-%d", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return int(datetime.strptime(value, fmt).replace(tzinfo=timezone.utc).timestamp())
+        except ValueError:
+            continue
+    raise ValueError(f"无效的时间: {value}")
+
+
+def parse_resolution(value):
+    """
+    解析 OHLC 分桶粒度（如 5m、1h、1d），返回秒数。
+    """
+    seconds = parse_window(value)
+    if seconds <= 0:
+        raise ValueError(f"无效的分桶粒度: {value}")
+    return seconds
+
+
+def ohlc_buckets(timestamps, values, resolution):
+    """
+    按固定粒度（从 Unix 纪元对齐）把序列聚合为 OHLC 分桶。
+    时间戳已排序，所以每个桶是一段连续区间，用 reduceat 一次算出所有桶的最高/最低价。
+    返回 {"timestamps", "open", "high", "low", "close", "count"} 数组。
+    """
+    if len(values) == 0:
+        empty = np.empty(0, dtype=np.float64)
+        return {"timestamps": np.empty(0, dtype=np.int64), "open": empty, "high": empty, "low": empty,
+                "close": empty, "count": np.empty(0, dtype=np.int64)}
+    bucket = timestamps // resolution
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(values)]
+    return {
+        "timestamps": bucket[starts] * resolution,
+        "open": values[starts],
+        "high": np.maximum.reduceat(values, starts),
+        "low": np.minimum.reduceat(values, starts),
+        "close": values[ends - 1],
+        "count": ends - starts,
+    }
+
+
+def lttb(timestamps, values, threshold):
+    """
+    Largest-Triangle-Three-Buckets 降采样，返回保留点的下标数组（保留首尾两点）。
+    各桶的边界和平均点用前缀和一次算出；每个桶选点依赖上一个桶选中的点，
+    只能按桶依次处理，但每个桶内部是一次向量运算，循环次数等于输出点数而不是输入点数。
+    """
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = (timestamps - timestamps[0]).astype(np.float64)
+    y = np.asarray(values, dtype=np.float64)
+    buckets = threshold - 2
+    # 中间 n-2 个点平均分到 buckets 个桶中，edges[i]:edges[i+1] 为第 i 个桶
+    edges = (np.arange(buckets + 1) * (n - 2) // buckets + 1).astype(np.int64)
+    sizes = np.diff(edges)
+    cx = np.r_[0.0, np.cumsum(x)]
+    cy = np.r_[0.0, np.cumsum(y)]
+    avg_x = (cx[edges[1:]] - cx[edges[:-1]]) / sizes
+    avg_y = (cy[edges[1:]] - cy[edges[:-1]]) / sizes
+    # 第 i 个桶选点时参考下一个桶的平均点，最后一个桶参考最后一个点
+    next_x = np.r_[avg_x[1:], x[-1]]
+    next_y = np.r_[avg_y[1:], y[-1]]
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(buckets):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def format_labels(timestamps, fine):
+    """
+    把时间戳格式化为图表标签：fine 为 True 时精确到分钟，否则按日期显示。
+    """
+    return np.datetime_as_string(np.asarray(timestamps).astype("datetime64[s]"), unit="m" if fine else "D").tolist()
+
+
+def build_series(timestamps, values, resolution=None, max_points=HISTORY_MAX_POINTS):
+    """
+    把原始序列整理为图表数据。
+    指定 resolution（秒）时返回 OHLC 分桶，分桶数超过 max_points 时自动放大粒度；
+    否则点数超过 max_points 时用 LTTB 降采样。返回的点数因此与查询区间长短无关。
+    """
+    source_points = len(values)
+    result = {"source_points": source_points}
+    if resolution:
+        if max_points and source_points:
+            span = int(timestamps[-1]) - int(timestamps[0])
+            resolution = max(resolution, -(-span // max_points))
+        buckets = ohlc_buckets(timestamps, values, resolution)
+        result["resolution"] = resolution
+        result["labels"] = format_labels(buckets["timestamps"], resolution < 86400)
+        result["data"] = np.round(buckets["close"], 4).tolist()
+        result["ohlc"] = {key: np.round(buckets[key], 4).tolist() for key in ("open", "high", "low", "close")}
+        result["ohlc"]["count"] = buckets["count"].tolist()
+    else:
+        if max_points and source_points > max_points:
+            index = lttb(timestamps, values, max_points)
+            timestamps, values = timestamps[index], values[index]
+        # 跨度较短时精确到分钟，否则按日期显示
+        fine = len(timestamps) and timestamps[-1] - timestamps[0] < 3 * 86400
+        result["resolution"] = None
+        result["labels"] = format_labels(timestamps, fine)
+        result["data"] = np.round(values, 4).tolist()
+    result["points"] = len(result["data"])
+    return result
+
+
+class SeriesCache:
+    """
+    降采样结果的 LRU 缓存。
+    键由货币对、区间内首尾快照的时间戳和条数、粒度/点数组成：
+    数据追加或回填后键自然变化，旧条目按最近最少使用淘汰。
+    """
+    def __init__(self, max_entries=HISTORY_SERIES_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
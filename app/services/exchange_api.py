@@ -1,22 +1,62 @@
 import os
 import json
-import httpx
 import time
-from datetime import datetime, timedelta
+import asyncio
 from dotenv import load_dotenv
+from app.services.http_client import http_client
+from app.services.history_store import create_history_store, HISTORY_PAGE_SIZE
+from app.services.rate_history import RateHistoryStore
+from app.services.cross_rates import CrossRateMatrix
+from app.services.alerts import AlertEngine
+from app.services.volatility import RollingVolatility
+from app.services.shared_snapshot import SharedSnapshot, atomic_write
+from app.services.news_index import NewsIndex
+from app.services.rate_tape import RateTape
+from app.services.rate_deltas import RateDeltaLog
+from app.services.money import convert_amount
+from app.services.currency_graph import CurrencyGraph, table_quotes, load_quotes, RATES_SPREAD_BPS, CURRENCY_QUOTES_FILE
+from app.services.downsample import SeriesCache, build_series, HISTORY_MAX_POINTS
+from app.services.rate_providers import create_provider_chain, CircuitBreaker, ProviderError
+from app.services.profiling import span
+from app.services.metrics import (
+    RATES_CACHE_HIT, RATES_CACHE_MISS, RATES_CACHE_STALE,
+    NEWS_CACHE_HIT, NEWS_CACHE_MISS, NEWS_CACHE_STALE,
+    SERIES_CACHE_HIT, SERIES_CACHE_MISS
+)
+import numpy as np
 
 # 加载环境变量（如 API 密钥）
 load_dotenv()
 
-# 定义数据存储路径
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
+# 定义数据存储路径（可用 DASHBOARD_DATA_DIR 指定其他目录，例如基准测试时使用临时目录）
+DATA_DIR = os.getenv("DASHBOARD_DATA_DIR") or os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
 DAILY_RATES_FILE = os.path.join(DATA_DIR, "daily_rates.json")
 HISTORY_RECORDS_FILE = os.path.join(DATA_DIR, "history_records.json")
+RATE_HISTORY_DIR = os.path.join(DATA_DIR, "rate_history")
+ALERTS_FILE = os.path.join(DATA_DIR, "alerts.jsonl")
+RATES_SNAPSHOT_FILE = os.path.join(DATA_DIR, "rates_snapshot.bin")
+RATES_LOCK_FILE = os.path.join(DATA_DIR, "rates_snapshot.lock")
+RATE_TAPE_DIR = os.path.join(DATA_DIR, "rate_tape")
 
 # 获取 API 密钥
 EXCHANGE_API_KEY = os.getenv("EXCHANGE_API_KEY")
 ALPHAVANTAGE_API_KEY = os.getenv("ALPHAVANTAGE_API_KEY")
 
+# 汇率缓存有效期（秒）：上游未返回 time_next_update_unix 时使用
+RATES_CACHE_TTL = int(os.getenv("RATES_CACHE_TTL", "300"))
+# 过期后留给后台刷新任务的宽限期（秒），宽限期内请求不会自行触发刷新
+RATES_STALE_GRACE = int(os.getenv("RATES_STALE_GRACE", "30"))
+# 刷新失败后的重试间隔（秒）
+RATES_RETRY_INTERVAL = int(os.getenv("RATES_RETRY_INTERVAL", "60"))
+# 冷启动（没有任何缓存）时请求最多等待上游的秒数，超时先返回默认汇率，刷新在后台继续
+RATES_COLD_START_TIMEOUT = float(os.getenv("RATES_COLD_START_TIMEOUT", "3"))
+# 多进程部署时 follower 检查共享快照的间隔（秒）
+SNAPSHOT_POLL_INTERVAL = float(os.getenv("SNAPSHOT_POLL_INTERVAL", "1"))
+# 是否把每次上游响应归档到汇率磁带（用于回放和回测）
+RATE_TAPE_ENABLED = os.getenv("RATE_TAPE_ENABLED", "1") == "1"
+# 新闻缓存有效期（秒）
+NEWS_CACHE_TTL = int(os.getenv("NEWS_CACHE_TTL", "3600"))
+
 # 默认回退汇率（当 API 不可用时使用）
 DEFAULT_RATES = {
     "USD": 1, "CNY": 7.25, "EUR": 0.92, "GBP": 0.79, "JPY": 150.0,
@@ -34,10 +74,53 @@ class ExchangeService:
     5. 管理用户操作历史记录
     """
     def __init__(self):
-        # 初始化时加载本地缓存的汇率数据
+        # 多进程共享的二进制汇率快照，只有持有文件锁的 leader 进程请求上游
+        self.shared_snapshot = SharedSnapshot(RATES_SNAPSHOT_FILE, RATES_LOCK_FILE)
+        # 初始化时加载本地缓存的汇率数据（优先使用共享快照）
         self.rates_cache = self._load_json(DAILY_RATES_FILE)
-        self.news_cache = {} # 新闻内存缓存
+        self.rates_version = 1 if "conversion_rates" in self.rates_cache else 0 # 汇率快照版本号，每次更新递增，多进程间一致
+        snapshot = self.shared_snapshot.read()
+        if snapshot is not None:
+            self.rates_version, self.rates_cache = snapshot
+        self.rates_expire_at = self._compute_expire_at(self.rates_cache) # 汇率缓存过期时间戳
+        self._rates_refresh_task = None # 正在进行的汇率刷新任务（所有等待者共享）
+        # 汇率上游链（按优先级故障转移，每个上游带熔断器）
+        self.rate_providers = create_provider_chain(EXCHANGE_API_KEY)
+        self._background_tasks = [] # 后台任务（汇率预刷新、新闻刷新）
+        # 每次成功刷新后依次调用的快照监听器 (监听器, 是否只在 leader 进程调用)，参数为上游返回的完整数据
+        self._snapshot_listeners = []
+        # 汇率增量日志：每次快照切换时预先计算各旧版本到新版本的变化，供 /api/rates/json?since= 使用
+        self.rate_deltas = RateDeltaLog()
+        if "conversion_rates" in self.rates_cache:
+            self.rate_deltas.update(self.rates_version, self.rates_cache["conversion_rates"])
+        self.add_snapshot_listener(self._update_rate_deltas)
+        # 汇率时间序列存储：每次刷新都会写入一行（多进程时只由 leader 写入）
+        self.rate_history = RateHistoryStore(RATE_HISTORY_DIR)
+        self.add_snapshot_listener(self._record_rate_history, leader_only=True)
+        self.history_series = SeriesCache() # 历史趋势图降采样结果缓存
+        # 汇率磁带：归档每次上游响应（只由 leader 写入）
+        self.rate_tape = RateTape(RATE_TAPE_DIR) if RATE_TAPE_ENABLED else None
+        self._cross_rates = None # 当前快照对应的交叉汇率矩阵
+        # 多基准换算图：每份新快照在线程池中预先计算所有货币对的最优换算路径
+        self._currency_graph = None
+        self._graph_pending = None # 正在线程池中构建的换算图 (汇率快照, future)
+        self._quote_edges = [] # CURRENCY_QUOTES_FILE 中的其他报价
+        self._quotes_mtime = None
+        self.add_snapshot_listener(self._update_currency_graph)
+        # 滚动波动率统计：启动时从时间序列存储加载，之后每份新快照增量更新
+        self.volatility = RollingVolatility()
+        self.add_snapshot_listener(self._update_volatility)
+        # 汇率预警引擎：每份新快照都会检查一次（多进程时各进程都检查，共享日志保证每条预警只触发一次）
+        self.alerts = AlertEngine(ALERTS_FILE)
+        self.add_snapshot_listener(self._evaluate_alerts)
+        self.news_cache = {} # 新闻内存缓存（看板显示的最新 5 条）
+        self.news_index = NewsIndex() # 所有抓取到的新闻（去重、带索引），用于搜索
         self.last_news_fetch = 0 # 上次获取新闻的时间戳
+        self.news_version = 0 # 新闻版本号，内容变化时递增
+        self.news_breaker = CircuitBreaker("alphavantage") # 新闻上游熔断器
+        self._news_listeners = [] # 新闻更新监听器
+        # 历史记录存储（旧版 JSON 文件中的记录会在首次使用时迁移）
+        self.history_store = create_history_store(DATA_DIR, HISTORY_RECORDS_FILE)
 
     def _load_json(self, filepath):
         """
@@ -55,159 +138,561 @@ class ExchangeService:
     def _save_json(self, filepath, data):
         """
         辅助方法：保存数据到 JSON 文件。
+        先写临时文件再原子替换，其他进程不会读到写了一半的文件。
         """
         try:
-            with open(filepath, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            atomic_write(filepath, json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8"))
         except Exception as e:
             print(f"保存JSON到 {filepath} 错误: {e}")
 
+    def snapshot_age(self):
+        """
+        返回当前汇率快照距上游发布时间的秒数，没有快照时返回 None。
+        """
+        timestamp = self.rates_cache.get("time_last_update_unix")
+        return time.time() - timestamp if timestamp else None
+
+    def _compute_expire_at(self, data):
+        """
+        根据上游返回的数据计算缓存过期时间。
+        优先使用上游给出的 time_next_update_unix（在此之前上游不会有新数据），
+        否则按 time_last_update_unix + RATES_CACHE_TTL 计算。
+        """
+        next_update = data.get("time_next_update_unix")
+        if next_update:
+            return next_update
+        return data.get("time_last_update_unix", 0) + RATES_CACHE_TTL
+
     async def get_realtime_rates(self):
         """
-        获取实时汇率。
+        获取实时汇率（stale-while-revalidate）。
         策略：
-        1. 检查内存/文件缓存是否在有效期内（5分钟）。
-        2. 如果缓存有效，直接返回缓存数据。
-        3. 如果缓存过期，请求外部 API。
-        4. 如果 API 请求失败，回退到旧缓存或默认静态汇率。
+        1. 缓存未过期，直接返回缓存数据。
+        2. 缓存已过期，仍立即返回旧数据，同时在后台触发一次刷新（所有请求共享同一次刷新）。
+        3. 完全没有缓存（冷启动）时，等待共享的刷新结果，最多等待 RATES_COLD_START_TIMEOUT 秒。
+        4. 如果刷新失败或超时，回退到默认静态汇率；失败后到重试时间之前的冷启动请求直接返回默认汇率。
+        正常情况下由后台任务 run_refresher 在过期前完成刷新，请求不会等待网络；
+        上游故障时熔断器会让刷新立即失败，请求延迟不受上游超时影响。
         """
-        now = time.time()
-        last_update = self.rates_cache.get("time_last_update_unix", 0)
-        
-        # 如果缓存新鲜（小于5分钟 / 300秒）
-        if now - last_update < 300 and "conversion_rates" in self.rates_cache:
+        if "conversion_rates" in self.rates_cache:
+            now = time.time()
+            if now < self.rates_expire_at:
+                RATES_CACHE_HIT.inc()
+            else:
+                RATES_CACHE_STALE.inc()
+                if now >= self.rates_expire_at + RATES_STALE_GRACE:
+                    self._ensure_refresh()
             return self.rates_cache["conversion_rates"]
 
-        # 从 ExchangeRate-API 获取最新数据
-        url = f"https://v6.exchangerate-api.com/v6/{EXCHANGE_API_KEY}/latest/USD"
+        RATES_CACHE_MISS.inc()
+        # 上次刷新失败、还未到重试时间时不再等待上游（失败的负缓存）
+        if self._rates_refresh_task is not None and time.time() < self.rates_expire_at:
+            return DEFAULT_RATES
+        try:
+            with span("rates.refresh"):
+                refreshed = await asyncio.wait_for(self.refresh_rates(), RATES_COLD_START_TIMEOUT)
+            if refreshed:
+                return self.rates_cache["conversion_rates"]
+        except asyncio.TimeoutError:
+            pass
+
+        # 最后手段：使用硬编码的默认汇率
+        return DEFAULT_RATES
+
+    def _ensure_refresh(self):
+        """
+        返回当前正在进行的刷新任务；如果没有，则启动一个新的。
+        保证任意时刻最多只有一个上游请求在进行（single-flight）。
+        """
+        task = self._rates_refresh_task
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._refresh())
+            self._rates_refresh_task = task
+        return task
+
+    async def refresh_rates(self):
+        """
+        刷新汇率并等待结果，返回是否成功。
+        并发调用会共享同一次刷新；使用 shield 保证某个等待者被取消时刷新仍会完成。
+        """
+        return await asyncio.shield(self._ensure_refresh())
+
+    async def _refresh(self):
+        """
+        执行一次刷新：leader 进程请求上游，follower 进程从共享快照同步。
+        原 leader 退出后，第一个尝试刷新的进程会拿到文件锁并接替 leader。
+        """
+        if self.shared_snapshot.try_acquire():
+            # 刚接替 leader 时先同步原 leader 最后写入的快照，保证版本号继续递增
+            await self._sync_shared_snapshot()
+            return await self._fetch_rates()
+        return await self._sync_shared_snapshot()
+
+    async def _sync_shared_snapshot(self):
+        """
+        follower：共享快照有新版本时应用并通知监听器，返回是否更新。
+        """
+        snapshot = self.shared_snapshot.read()
+        if snapshot is None or snapshot[0] <= self.rates_version:
+            return False
+        version, data = snapshot
+        self._apply_rates(data, version)
+        await self._notify_snapshot(data)
+        return True
+
+    def _persist_rates(self, version, data, provider=None):
+        """
+        leader：写入共享快照、JSON 缓存文件和汇率磁带（在线程池中执行）。
+        """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url)
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get("result") == "success":
-                        # 更新缓存并保存到文件
-                        self.rates_cache = data
-                        self._save_json(DAILY_RATES_FILE, data)
-                        return data["conversion_rates"]
+            self.shared_snapshot.write(version, data)
         except Exception as e:
+            print(f"写入共享快照错误: {e}")
+        self._save_json(DAILY_RATES_FILE, data)
+        if self.rate_tape is not None:
+            try:
+                self.rate_tape.record(data, provider, version)
+            except Exception as e:
+                print(f"写入汇率磁带错误: {e}")
+
+    async def _fetch_rates(self):
+        """
+        从汇率上游链获取最新数据并更新缓存。
+        失败时把过期时间推迟 RATES_RETRY_INTERVAL（所有上游都在熔断时推迟到最早恢复的时间），
+        避免每个请求都去重试上游。
+        """
+        try:
+            data = await self.rate_providers.fetch()
+        except ProviderError as e:
             print(f"API 错误: {e}")
-        
-        # 如果 API 失败，尝试使用旧缓存
+            self.rates_expire_at = max(time.time() + RATES_RETRY_INTERVAL, self.rate_providers.retry_at())
+            return False
+
+        # 更新缓存，并保存到共享快照和文件
+        self._apply_rates(data)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._persist_rates, self.rates_version, data, self.rate_providers.last_provider)
+        await self._notify_snapshot(data)
+        return True
+
+    def _apply_rates(self, data, version=None):
+        """
+        用一份新的上游数据替换当前缓存，并计算下次过期时间。
+        version 为共享快照的版本号（follower 同步时传入），否则在当前版本上加一。
+        如果上游给出的下次更新时间已经过去（上游延迟发布），则稍后重试。
+        """
+        self.rates_cache = data
+        self.rates_version = version if version is not None else self.rates_version + 1
+        expire_at = self._compute_expire_at(data)
+        now = time.time()
+        if expire_at <= now:
+            expire_at = now + RATES_RETRY_INTERVAL
+        self.rates_expire_at = expire_at
+
+    def add_snapshot_listener(self, listener, leader_only=False):
+        """
+        注册快照监听器（async 函数），每次汇率成功刷新后以上游数据为参数调用。
+        leader_only 为 True 时只在 leader 进程调用（用于写共享文件等只需执行一次的操作）。
+        """
+        self._snapshot_listeners.append((listener, leader_only))
+
+    async def _notify_snapshot(self, data):
+        """
+        依次通知所有快照监听器，单个监听器出错不影响其他监听器。
+        """
+        is_leader = self.shared_snapshot.is_leader
+        for listener, leader_only in self._snapshot_listeners:
+            if leader_only and not is_leader:
+                continue
+            try:
+                await listener(data)
+            except Exception as e:
+                print(f"快照监听器 {getattr(listener, '__name__', listener)} 错误: {e}")
+
+    def add_news_listener(self, listener):
+        """
+        注册新闻监听器（async 函数），新闻内容变化时以新闻列表为参数调用。
+        """
+        self._news_listeners.append(listener)
+
+    async def _notify_news(self, news_items):
+        for listener in self._news_listeners:
+            try:
+                await listener(news_items)
+            except Exception as e:
+                print(f"新闻监听器 {getattr(listener, '__name__', listener)} 错误: {e}")
+
+    async def _update_rate_deltas(self, data):
+        """
+        快照监听器：记录新快照并预先计算增量。
+        """
+        self.rate_deltas.update(self.rates_version, data["conversion_rates"])
+
+    def get_rates_delta(self, since, rates, codes=None):
+        """
+        获取从 since 版本到当前快照的汇率变化，见 RateDeltaLog.delta。
+        """
+        return self.rate_deltas.delta(since, self.rates_version, rates, codes)
+
+    async def _record_rate_history(self, data):
+        """
+        快照监听器：把本次汇率写入时间序列存储（在线程池中执行磁盘写入）。
+        """
+        timestamp = data.get("time_last_update_unix") or int(time.time())
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.rate_history.append, timestamp, data["conversion_rates"])
+
+    async def _update_volatility(self, data):
+        """
+        快照监听器：把新汇率追加到滚动波动率统计（已经统计过的快照会被忽略）。
+        """
+        timestamp = data.get("time_last_update_unix") or int(time.time())
+        self.volatility.update(timestamp, data["conversion_rates"])
+
+    async def _load_volatility(self):
+        """
+        从汇率时间序列存储读取最近的快照，初始化滚动波动率统计。
+        """
+        loop = asyncio.get_running_loop()
+        volatility = self.volatility
+        timestamps, values = await loop.run_in_executor(None, self.rate_history.tail, volatility.codes, volatility.max_rows)
+        volatility.load(timestamps, values)
+
+    def get_volatility(self, window_seconds, currencies=None, base="USD"):
+        """
+        获取最近一段时间内各货币相对 base 的波动率统计。
+        """
+        return self.volatility.window_stats(window_seconds, currencies, base)
+
+    async def _evaluate_alerts(self, data):
+        """
+        快照监听器：用新汇率检查预警，触发的预警写入历史记录。
+        """
+        fired = await self.alerts.evaluate(self.cross_rates_for(data["conversion_rates"]))
+        await self._record_fired_alerts(fired)
+
+    async def _record_fired_alerts(self, fired):
+        for alert in fired:
+            details = f"{alert['base']}/{alert['target']} {alert['condition']} {alert['threshold']} @ {round(alert['rate'], 6)}"
+            await self.add_history_record("alert_triggered", details)
+
+    async def register_alert(self, base, target, condition, threshold):
+        """
+        注册汇率预警，并立即用当前汇率检查一次该货币对。
+        返回 (预警, 是否已立即触发)。
+        """
+        rates = await self.get_realtime_rates()
+        alert = await self.alerts.register(base, target, condition, threshold)
+        fired = await self.alerts.evaluate(self.cross_rates_for(rates), pairs=[(base, target)])
+        await self._record_fired_alerts(fired)
+        return alert, any(a["id"] == alert["id"] for a in fired)
+
+    async def run_refresher(self):
+        """
+        后台预刷新循环。
+        启动时先从时间序列存储加载波动率统计，再把已缓存的快照通知给监听器（重复的快照会被忽略），
+        之后在缓存过期时（即上游发布新数据时）主动刷新，
+        使请求处理路径始终命中缓存，而不必等待网络。
+        多进程部署时只有 leader 按上述方式刷新，follower 每隔 SNAPSHOT_POLL_INTERVAL 检查共享快照，
+        并在 leader 退出后接替。
+        """
+        self.shared_snapshot.try_acquire()
+        try:
+            await self._load_volatility()
+        except Exception as e:
+            print(f"加载波动率数据错误: {e}")
         if "conversion_rates" in self.rates_cache:
-            return self.rates_cache["conversion_rates"]
-            
-        # 最后手段：使用硬编码的默认汇率
-        return DEFAULT_RATES
+            await self._notify_snapshot(self.rates_cache)
+        while True:
+            if not self.shared_snapshot.try_acquire():
+                await self.refresh_rates()
+                await asyncio.sleep(SNAPSHOT_POLL_INTERVAL)
+                continue
+            delay = self.rates_expire_at - time.time()
+            if delay > 0:
+                # 过期时间可能在休眠期间被请求触发的刷新更新，醒来后重新计算
+                await asyncio.sleep(delay)
+                continue
+            await self.refresh_rates()
+
+    async def run_news_refresher(self):
+        """
+        后台新闻刷新循环：缓存过期时主动获取新闻，失败时按重试间隔再试（熔断期间等到熔断结束）。
+        """
+        while True:
+            await self.get_news()
+            now = time.time()
+            delay = self.last_news_fetch + NEWS_CACHE_TTL - now
+            await asyncio.sleep(delay if delay > 0 else max(RATES_RETRY_INTERVAL, self.news_breaker.open_until - now))
+
+    def start_background_tasks(self):
+        """
+        启动后台任务（在应用 lifespan 启动阶段调用）。
+        """
+        if not self._background_tasks:
+            self._background_tasks = [
+                asyncio.ensure_future(self.run_refresher()),
+                asyncio.ensure_future(self.run_news_refresher()),
+            ]
 
-    async def get_historical_data(self, base="USD", target="CNY", days=30):
+    async def stop_background_tasks(self):
+        """
+        停止后台任务（在应用 lifespan 关闭阶段调用）。
+        """
+        tasks = self._background_tasks
+        self._background_tasks = []
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.shared_snapshot.release()
+
+    async def get_historical_data(self, base="USD", target="CNY", days=30, start=None, end=None,
+                                  resolution=None, max_points=HISTORY_MAX_POINTS):
         """
         获取历史汇率趋势数据。
-        注意：由于免费版 API 通常不支持历史数据查询，这里使用模拟算法生成逼真的波动数据。
-        基于当前实时汇率，生成过去 N 天的随机波动数据。
+        从汇率时间序列存储中读取 [start, end] 区间（默认为过去 N 天）base/target 的交叉汇率，
+        指定 resolution（秒）时聚合为 OHLC 分桶，否则超过 max_points 个点时用 LTTB 降采样。
+        结果按区间内容缓存，同一区间、同一参数的请求不会重复读取和计算。
         """
         current_rates = await self.get_realtime_rates()
         base_rate = current_rates.get(base, 1.0)
         target_rate = current_rates.get(target, 1.0)
-        
+
         # 计算当前的交叉汇率
         rate = target_rate / base_rate
-        
-        dates = []
-        values = []
-        import random
-        
-        # 生成过去 days 天的数据
-        for i in range(days):
-            d = datetime.now() - timedelta(days=days-i)
-            dates.append(d.strftime("%Y-%m-%d"))
-            # 随机波动 +/- 2%
-            fluctuation = random.uniform(0.995, 1.005)
-            values.append(round(rate * fluctuation, 4))
-            
-        return {"labels": dates, "data": values, "rate": rate}
+
+        end = end if end is not None else int(time.time())
+        start = start if start is not None else end - days * 86400
+        if start > end:
+            raise ValueError("开始时间晚于结束时间")
+        loop = asyncio.get_running_loop()
+        with span("rate_history.locate"):
+            window = await loop.run_in_executor(None, self._history_window_key, start, end)
+        key = (base, target, resolution, max_points) + window
+        series = self.history_series.get(key)
+        if series is not None:
+            SERIES_CACHE_HIT.inc()
+        else:
+            SERIES_CACHE_MISS.inc()
+            with span("rate_history.series"):
+                series = await loop.run_in_executor(None, self._build_history_series, base, target, start, end, resolution, max_points)
+            self.history_series.put(key, series)
+        return dict(series, rate=rate)
+
+    def _history_window_key(self, start, end):
+        lo, hi = self.rate_history.locate(start, end)
+        return self.rate_history.window_key(lo, hi)
+
+    def _build_history_series(self, base, target, start, end, resolution, max_points):
+        timestamps, values = self.rate_history.query(base, target, start, end)
+        return build_series(timestamps, values, resolution, max_points)
 
     async def get_news(self):
         """
         获取外汇市场新闻。
         使用 Alpha Vantage API。
-        缓存策略：1小时（3600秒）更新一次，避免频繁消耗 API 配额。
+        缓存策略：默认1小时（NEWS_CACHE_TTL）更新一次，避免频繁消耗 API 配额。
+        完整的 feed 会合并进新闻索引（按 URL 去重）供搜索使用，看板只显示其中最新的 5 条。
+        获取到新内容时通知新闻监听器。
         """
         now = time.time()
         # 如果缓存有效（1小时内），直接返回
-        if now - self.last_news_fetch < 3600 and self.news_cache:
+        if now - self.last_news_fetch < NEWS_CACHE_TTL and self.news_cache:
+            NEWS_CACHE_HIT.inc()
             return self.news_cache
 
+        NEWS_CACHE_MISS.inc()
+
+        # 熔断期间（包括缺少密钥、配额用尽）直接使用旧的新闻，不等待上游
+        if self.news_breaker.allow():
+            try:
+                feed = await self._fetch_news_feed()
+            except ProviderError as e:
+                self.news_breaker.record_failure(e, e.permanent)
+                print(f"新闻 API 错误: {e}")
+            except Exception as e:
+                self.news_breaker.record_failure(e)
+                print(f"新闻 API 错误: {e}")
+            else:
+                self.news_breaker.record_success()
+                self.news_index.ingest(feed)
+                # 看板只显示最新的5条
+                news_items = []
+                for item in self.news_index.latest(5):
+                    news_items.append({
+                        "title": item["title"],
+                        "url": item["url"],
+                        "source": item["source"],
+                        "summary": item["summary"][:100] + "..."
+                    })
+                changed = news_items != self.news_cache
+                self.news_cache = news_items
+                self.last_news_fetch = now
+                if changed:
+                    self.news_version += 1
+                    await self._notify_news(news_items)
+                return news_items
+
+        if self.news_cache:
+            # 获取失败，继续使用旧的新闻
+            NEWS_CACHE_STALE.inc()
+            return self.news_cache
+        return []
+
+    async def _fetch_news_feed(self):
+        """
+        请求 Alpha Vantage 新闻接口，返回 feed 列表，失败时抛出 ProviderError。
+        Alpha Vantage 在密钥无效或配额用尽时仍返回 200，只在 Information/Note 字段中说明原因。
+        """
+        if not ALPHAVANTAGE_API_KEY:
+            raise ProviderError("缺少 ALPHAVANTAGE_API_KEY", permanent=True)
         url = f"https://www.alphavantage.co/query?function=NEWS_SENTIMENT&topic=forex&apikey={ALPHAVANTAGE_API_KEY}"
+        response = await http_client.get("alphavantage", url)
+        if response.status_code != 200:
+            raise ProviderError(f"HTTP {response.status_code}")
+        data = response.json()
+        if "feed" not in data:
+            message = data.get("Information") or data.get("Note")
+            raise ProviderError(message or "响应中没有 feed", permanent=bool(message))
+        return data["feed"]
+
+    def search_news(self, query=None, currency=None, limit=20):
+        """
+        在已抓取的新闻中搜索（只读内存索引，不访问上游）。
+        返回 (命中总数, 新闻列表)。
+        """
+        return self.news_index.search(query, currency, limit)
+
+    def cross_rates_for(self, rates):
+        """
+        返回指定汇率快照的交叉汇率矩阵。
+        矩阵按快照对象缓存，同一份快照只构建一次，刷新后自动重建。
+        """
+        matrix = self._cross_rates
+        if matrix is None or matrix.source is not rates:
+            timestamp = self.rates_cache.get("time_last_update_unix") if rates is self.rates_cache.get("conversion_rates") else None
+            matrix = CrossRateMatrix(rates, timestamp)
+            self._cross_rates = matrix
+        return matrix
+
+    async def get_cross_rates(self):
+        """
+        获取当前快照的交叉汇率矩阵。
+        """
+        rates = await self.get_realtime_rates()
+        return self.cross_rates_for(rates)
+
+    def _reload_quotes(self):
+        """
+        报价文件有变化时重新读取（每份新快照检查一次）。
+        """
+        if not CURRENCY_QUOTES_FILE:
+            return
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url)
-                if response.status_code == 200:
-                    data = response.json()
-                    if "feed" in data:
-                        # 只取前5条新闻
-                        news_items = []
-                        for item in data["feed"][:5]:
-                            news_items.append({
-                                "title": item.get("title"),
-                                "url": item.get("url"),
-                                "source": item.get("source"),
-                                "summary": item.get("summary", "")[:100] + "..."
-                            })
-                        self.news_cache = news_items
-                        self.last_news_fetch = now
-                        return news_items
+            mtime = os.path.getmtime(CURRENCY_QUOTES_FILE)
+            if mtime != self._quotes_mtime:
+                self._quote_edges = load_quotes(CURRENCY_QUOTES_FILE)
+                self._quotes_mtime = mtime
         except Exception as e:
-            print(f"新闻 API 错误: {e}")
-            
-        return self.news_cache if self.news_cache else []
+            print(f"读取报价文件 {CURRENCY_QUOTES_FILE} 错误: {e}")
+
+    def _build_currency_graph(self, rates, timestamp=None):
+        self._reload_quotes()
+        edges = table_quotes("USD", rates, RATES_SPREAD_BPS, "snapshot") + self._quote_edges
+        return CurrencyGraph(edges, rates, timestamp)
+
+    async def _build_currency_graph_async(self, rates, timestamp=None):
+        """
+        在线程池中为 rates 构建换算图，同一快照只构建一次，并发的调用方共享同一个 future。
+        """
+        pending = self._graph_pending
+        if pending is None or pending[0] is not rates:
+            loop = asyncio.get_running_loop()
+            pending = (rates, loop.run_in_executor(None, self._build_currency_graph, rates, timestamp))
+            self._graph_pending = pending
+        graph = await pending[1]
+        if self._graph_pending is pending:
+            # 构建期间没有更新的快照开始构建，才替换当前的图
+            self._currency_graph = graph
+            self._graph_pending = None
+        return graph
+
+    async def _update_currency_graph(self, data):
+        """
+        快照监听器：在线程池中为新快照构建换算图。
+        """
+        rates = data["conversion_rates"]
+        if self._currency_graph is not None and self._currency_graph.source is rates:
+            return
+        graph = await self._build_currency_graph_async(rates, data.get("time_last_update_unix"))
+        cycles = graph.inconsistencies()
+        if cycles:
+            print(f"报价存在不一致的闭环: {cycles[:5]}")
+
+    async def currency_graph_for(self, rates):
+        """
+        返回指定汇率快照的换算图。通常已由快照监听器预先构建；
+        监听器尚未完成时等待它的构建结果，其他情况（如默认汇率）同样在线程池中按需构建，
+        不会在事件循环中计算。
+        """
+        graph = self._currency_graph
+        if graph is not None and graph.source is rates:
+            return graph
+        timestamp = self.rates_cache.get("time_last_update_unix") if rates is self.rates_cache.get("conversion_rates") else None
+        return await self._build_currency_graph_async(rates, timestamp)
+
+    async def convert_with_route(self, amount, from_curr, to_curr, rates):
+        """
+        按最优路径换算，返回 (换算结果, 实际汇率, 路径)；无法换算时返回 None。
+        金额按整数最小单位计算（见 money.convert_amount），结果按目标货币的小数位舍入。
+        """
+        result = (await self.currency_graph_for(rates)).route(from_curr, to_curr)
+        if result is None:
+            return None
+        rate, hops = result
+        converted = convert_amount(amount, from_curr, to_curr, rate)
+        if converted is None:
+            return None
+        return converted, rate, hops
 
-    def convert_currency(self, amount, from_curr, to_curr, rates):
+    async def convert_currency(self, amount, from_curr, to_curr, rates):
         """
         货币转换计算逻辑。
-        公式：(金额 / 源货币汇率) * 目标货币汇率
-        所有汇率都是基于 USD 的。
+        查询预先计算好的换算图：金额 * 最优路径的实际汇率。
         """
-        if from_curr not in rates or to_curr not in rates:
+        result = await self.convert_with_route(amount, from_curr, to_curr, rates)
+        if result is None:
             return 0.0
-        
-        # 先转换为 USD (基准)
-        amount_in_usd = amount / rates[from_curr]
-        # 再转换为目标货币
-        return round(amount_in_usd * rates[to_curr], 6)
+        return result[0]
 
-    def get_history_records(self, filter_type=None):
+    async def get_history_records(self, filter_type=None, limit=HISTORY_PAGE_SIZE, cursor=None):
         """
-        获取用户的操作历史记录。
+        获取用户的操作历史记录（按时间倒序分页）。
         支持按类型筛选（如只看 'purchase' 记录）。
+        返回 (记录列表, 下一页游标)。
         """
-        records = self._load_json(HISTORY_RECORDS_FILE)
-        if filter_type:
-            return [r for r in records if r.get("type") == filter_type]
-        return records
+        with span("history.query"):
+            return await self.history_store.query(filter_type, limit, cursor)
 
-    def add_history_record(self, record_type, details):
+    async def add_history_record(self, record_type, details):
         """
         添加一条新的历史记录。
         记录包含：ID、时间、类型、详情。
-        新记录会被插入到列表最前面。
         """
-        records = self._load_json(HISTORY_RECORDS_FILE)
-        new_record = {
-            "id": int(time.time() * 1000),
-            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "type": record_type, # 'purchase', 'sale', 'settle', 'warning'
-            "details": details
-        }
-        records.insert(0, new_record) # 添加到顶部
-        self._save_json(HISTORY_RECORDS_FILE, records)
-        return new_record
+        # record_type: 'purchase', 'sale', 'settle', 'warning'
+        with span("history.add"):
+            return await self.history_store.add(record_type, details)
 
-    def clear_history_records(self):
+    async def clear_history_records(self):
         """
         清空所有历史记录。
         """
-        self._save_json(HISTORY_RECORDS_FILE, [])
+        with span("history.clear"):
+            await self.history_store.clear()
 
 # 创建全局单例实例
 exchange_service = ExchangeService()
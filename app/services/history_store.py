@@ -0,0 +1,423 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+from bisect import bisect_left
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from dotenv import load_dotenv
+from app.services.metrics import HISTORY_WRITE_LATENCY
+from app.services.shared_snapshot import atomic_write, file_lock
+
+load_dotenv()
+
+# 历史记录后端：jsonl（默认，追加写 + 偏移索引）或 sqlite（WAL 模式）
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "jsonl")
+# 最多保留的记录条数（0 表示不限制），超过一定比例后触发压缩
+HISTORY_MAX_RECORDS = int(os.getenv("HISTORY_MAX_RECORDS", "5000"))
+# 每页返回的记录条数
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+
+
+class HistoryStore:
+    """
+    历史记录存储基类。
+    所有磁盘操作都在一个专用的单线程执行器中完成，不会阻塞事件循环，
+    同时保证写操作串行执行。子类实现以 _ 开头的同步方法。
+
+    记录 ID 单调递增（毫秒时间戳，冲突时顺延），分页游标即为 ID：
+    传入 cursor 时只返回 ID 小于 cursor 的记录。
+    多个 worker 进程可能共享同一份数据文件，每个操作都在 _transaction 中执行，
+    子类在其中加锁并与其他进程的修改同步。
+    """
+    def __init__(self, max_records=HISTORY_MAX_RECORDS):
+        self.max_records = max_records
+        self._last_id = 0
+        self._loaded = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-store")
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    @property
+    def version(self):
+        """
+        数据版本（用作响应缓存键）。由数据文件的元数据得出，
+        任一进程写入或清空后，所有进程看到的版本都会变化。
+        """
+        return self._file_version()
+
+    @contextmanager
+    def _transaction(self, exclusive):
+        """
+        子类可覆盖：加锁并同步其他进程的修改。exclusive 为 True 表示要写入。
+        """
+        yield
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self._load()
+            self._loaded = True
+
+    def _next_id(self):
+        new_id = max(int(time.time() * 1000), self._last_id + 1)
+        self._last_id = new_id
+        return new_id
+
+    def _needs_compaction(self):
+        return self.max_records > 0 and self._count() > self.max_records * 3 // 2
+
+    def _add_sync(self, record_type, details):
+        self._ensure_loaded()
+        start = time.perf_counter()
+        with self._transaction(True):
+            record = {
+                "id": self._next_id(),
+                "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "type": record_type,
+                "details": details
+            }
+            self._append(record)
+            # 超出保留上限一半时才压缩，摊还后每次追加仍为 O(1)
+            if self._needs_compaction():
+                self._compact()
+        HISTORY_WRITE_LATENCY.observe(time.perf_counter() - start)
+        return record
+
+    def _query_sync(self, filter_type, limit, cursor):
+        self._ensure_loaded()
+        with self._transaction(False):
+            return self._query(filter_type, limit, cursor)
+
+    def _clear_sync(self):
+        self._ensure_loaded()
+        with self._transaction(True):
+            self._clear()
+
+    def _compact_sync(self):
+        self._ensure_loaded()
+        with self._transaction(True):
+            if self.max_records > 0 and self._count() > self.max_records:
+                self._compact()
+
+    def _count_sync(self):
+        self._ensure_loaded()
+        with self._transaction(False):
+            return self._count()
+
+    def size(self):
+        """
+        返回当前记录条数（不触发加载，未加载时返回 None），供指标等非阻塞场景使用。
+        """
+        return self._count() if self._loaded else None
+
+    async def add(self, record_type, details):
+        """
+        追加一条记录，返回新记录。
+        """
+        return await self._run(self._add_sync, record_type, details)
+
+    async def query(self, filter_type=None, limit=HISTORY_PAGE_SIZE, cursor=None):
+        """
+        按时间倒序分页查询，返回 (记录列表, 下一页游标)。
+        没有更多记录时游标为 None。
+        """
+        return await self._run(self._query_sync, filter_type, limit, cursor)
+
+    async def clear(self):
+        """
+        清空所有记录。
+        """
+        await self._run(self._clear_sync)
+
+    async def compact(self):
+        """
+        立即执行保留策略，只保留最新的 max_records 条。
+        """
+        await self._run(self._compact_sync)
+
+    async def count(self):
+        """
+        返回当前记录条数。
+        """
+        return await self._run(self._count_sync)
+
+    def _load_legacy(self, legacy_path):
+        """
+        读取旧版 history_records.json（新记录在前），按写入顺序返回。
+        """
+        if not legacy_path or not os.path.exists(legacy_path):
+            return []
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except Exception as e:
+            print(f"读取旧历史记录 {legacy_path} 错误: {e}")
+            return []
+        return sorted(records, key=lambda r: r.get("id", 0))
+
+    # 以下方法由子类实现
+    def _file_version(self):
+        raise NotImplementedError
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _append(self, record):
+        raise NotImplementedError
+
+    def _query(self, filter_type, limit, cursor):
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+    def _compact(self):
+        raise NotImplementedError
+
+    def _count(self):
+        raise NotImplementedError
+
+
+class JsonlHistoryStore(HistoryStore):
+    """
+    追加写 JSONL 历史记录存储。
+    每行一条记录，内存中维护 (ID, 文件偏移) 索引以及按类型划分的二级索引，
+    追加为 O(1)，分页查询只读取需要的行。
+    多个 worker 进程共享同一个文件：所有操作都持有文件锁（写入为互斥锁，查询为共享锁），
+    进入锁后先检查文件的 inode 和大小，把其他进程追加的行增量读入索引；
+    清空和压缩都用原子替换生成新文件，其他进程发现 inode 变化后重建索引。
+    """
+    def __init__(self, path, legacy_path=None, max_records=HISTORY_MAX_RECORDS):
+        super().__init__(max_records)
+        self.path = path
+        self.legacy_path = legacy_path
+        self.lock_path = path + ".lock"
+        self._reset_index()
+
+    def _reset_index(self, inode=None):
+        self._ids = []
+        self._offsets = []
+        self._type_index = {} # type -> (ids, offsets)
+        self._inode = inode # 已建立索引的文件 inode
+        self._end = 0 # 已建立索引的文件长度
+
+    def _index(self, record, offset):
+        self._ids.append(record["id"])
+        self._offsets.append(offset)
+        ids, offsets = self._type_index.setdefault(record.get("type"), ([], []))
+        ids.append(record["id"])
+        offsets.append(offset)
+        self._last_id = max(self._last_id, record["id"])
+
+    def _encode(self, record):
+        return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def _file_version(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    @contextmanager
+    def _transaction(self, exclusive):
+        with file_lock(self.lock_path, shared=not exclusive):
+            self._refresh(repair=exclusive)
+            yield
+
+    def _load(self):
+        if os.path.exists(self.path):
+            return
+        with file_lock(self.lock_path):
+            if not os.path.exists(self.path):
+                # 首次启动：迁移旧版 JSON 文件中的记录
+                atomic_write(self.path, b"".join(self._encode(r) for r in self._load_legacy(self.legacy_path)))
+
+    def _refresh(self, repair=False):
+        """
+        让索引与文件保持一致（在文件锁内调用）。
+        repair 为 True（持有互斥锁）时截断异常退出时写了一半的行。
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset_index()
+            return
+        if st.st_ino != self._inode or st.st_size < self._end:
+            # 文件被清空、压缩或替换
+            self._reset_index(st.st_ino)
+        if st.st_size == self._end:
+            return
+        offset = self._end
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self._index(record, offset)
+                offset += len(line)
+        self._end = offset
+        if repair and st.st_size != offset:
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+
+    def _append(self, record):
+        data = self._encode(record)
+        with open(self.path, "ab") as f:
+            f.write(data)
+        if self._inode is None:
+            self._inode = os.stat(self.path).st_ino
+        self._index(record, self._end)
+        self._end += len(data)
+
+    def _read_at(self, offsets):
+        records = []
+        with open(self.path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                records.append(json.loads(f.readline()))
+        return records
+
+    def _query(self, filter_type, limit, cursor):
+        if filter_type:
+            ids, offsets = self._type_index.get(filter_type, ([], []))
+        else:
+            ids, offsets = self._ids, self._offsets
+        end = bisect_left(ids, cursor) if cursor else len(ids)
+        start = max(0, end - limit)
+        records = self._read_at(reversed(offsets[start:end]))
+        next_cursor = ids[start] if start > 0 else None
+        return records, next_cursor
+
+    def _rewrite(self, records):
+        """
+        用 records 原子替换整个文件并重建索引。
+        """
+        lines = [self._encode(record) for record in records]
+        atomic_write(self.path, b"".join(lines))
+        self._reset_index(os.stat(self.path).st_ino)
+        for record, line in zip(records, lines):
+            self._index(record, self._end)
+            self._end += len(line)
+
+    def _clear(self):
+        self._rewrite([])
+
+    def _compact(self):
+        self._rewrite(self._read_at(self._offsets[-self.max_records:]))
+
+    def _count(self):
+        return len(self._ids)
+
+
+class SqliteHistoryStore(HistoryStore):
+    """
+    SQLite（WAL 模式）历史记录存储。
+    (type, id) 上建立索引，按类型筛选和游标分页都走索引。
+    """
+    def __init__(self, path, legacy_path=None, max_records=HISTORY_MAX_RECORDS):
+        super().__init__(max_records)
+        self.path = path
+        self.legacy_path = legacy_path
+        self._conn = None
+        self._size = 0
+
+    def _file_version(self):
+        # WAL 模式下提交写入 -wal 文件，检查点时写回主文件
+        version = []
+        for path in (self.path, self.path + "-wal"):
+            try:
+                st = os.stat(path)
+                version += [st.st_size, st.st_mtime_ns]
+            except OSError:
+                version += [None, None]
+        return tuple(version)
+
+    @contextmanager
+    def _transaction(self, exclusive):
+        # 写入前先取得数据库写锁，再读取其他进程写入后的最大 ID 和条数
+        if exclusive:
+            self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            last_id, self._size = self._conn.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM history").fetchone()
+            self._last_id = max(self._last_id, last_id)
+            yield
+        finally:
+            if self._conn.in_transaction:
+                self._conn.commit()
+
+    def _load(self):
+        is_new = not os.path.exists(self.path)
+        # 连接只在执行器线程中使用
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "id INTEGER PRIMARY KEY, date TEXT, type TEXT, details TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_history_type ON history (type, id)")
+        if is_new:
+            self._conn.executemany(
+                "INSERT INTO history (id, date, type, details) VALUES (?, ?, ?, ?)",
+                [(r["id"], r.get("date"), r.get("type"), r.get("details")) for r in self._load_legacy(self.legacy_path)]
+            )
+        self._conn.commit()
+        self._last_id, self._size = self._conn.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM history").fetchone()
+
+    def _append(self, record):
+        self._conn.execute(
+            "INSERT INTO history (id, date, type, details) VALUES (?, ?, ?, ?)",
+            (record["id"], record["date"], record["type"], record["details"])
+        )
+        self._conn.commit()
+        self._size += 1
+
+    def _query(self, filter_type, limit, cursor):
+        sql = "SELECT id, date, type, details FROM history WHERE 1=1"
+        params = []
+        if filter_type:
+            sql += " AND type = ?"
+            params.append(filter_type)
+        if cursor:
+            sql += " AND id < ?"
+            params.append(cursor)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit + 1)
+        rows = self._conn.execute(sql, params).fetchall()
+        records = [{"id": r[0], "date": r[1], "type": r[2], "details": r[3]} for r in rows[:limit]]
+        next_cursor = records[-1]["id"] if len(rows) > limit else None
+        return records, next_cursor
+
+    def _clear(self):
+        self._conn.execute("DELETE FROM history")
+        self._conn.commit()
+        self._size = 0
+
+    def _compact(self):
+        self._conn.execute(
+            "DELETE FROM history WHERE id < (SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (self.max_records - 1,)
+        )
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def _count(self):
+        return self._size
+
+
+def create_history_store(data_dir, legacy_path=None):
+    """
+    根据 HISTORY_BACKEND 配置创建历史记录存储。
+    """
+    if HISTORY_BACKEND == "sqlite":
+        return SqliteHistoryStore(os.path.join(data_dir, "history_records.sqlite3"), legacy_path)
+    return JsonlHistoryStore(os.path.join(data_dir, "history_records.jsonl"), legacy_path)
@@ -0,0 +1,109 @@
+import os
+import time
+import httpx
+from dotenv import load_dotenv
+from app.services.metrics import UPSTREAM_LATENCY, UPSTREAM_REQUESTS
+from app.services.profiling import span
+
+load_dotenv()
+
+# 连接池设置
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") == "1"
+
+# 各上游服务的超时时间（秒）
+PROVIDER_TIMEOUTS = {
+    "exchangerate": float(os.getenv("EXCHANGE_API_TIMEOUT", "10")),
+    "openerapi": float(os.getenv("OPEN_ER_API_TIMEOUT", "10")),
+    "alphavantage": float(os.getenv("ALPHAVANTAGE_API_TIMEOUT", "15")),
+}
+DEFAULT_TIMEOUT = float(os.getenv("HTTP_DEFAULT_TIMEOUT", "10"))
+
+# HTTP/2 依赖可选的 h2 包，未安装时退回 HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HttpClientManager:
+    """
+    共享 HTTP 客户端管理器。
+    整个进程只保留一个长连接的 httpx.AsyncClient，所有上游服务共用同一个连接池，
+    避免每次请求都重新进行 DNS 解析、TCP 和 TLS 握手。
+    客户端在 FastAPI lifespan 中创建和关闭。
+    """
+    def __init__(self):
+        self._client = None
+
+    def _create_client(self, transport=None):
+        """
+        按配置创建客户端。transport 参数用于测试时注入模拟传输层。
+        """
+        limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+        return httpx.AsyncClient(
+            limits=limits,
+            timeout=DEFAULT_TIMEOUT,
+            http2=HTTP2_ENABLED and HTTP2_AVAILABLE,
+            transport=transport,
+        )
+
+    async def start(self, transport=None):
+        """
+        创建共享客户端（lifespan 启动阶段调用）。
+        """
+        if self._client is None:
+            self._client = self._create_client(transport)
+
+    async def close(self):
+        """
+        关闭共享客户端并释放连接池（lifespan 关闭阶段调用）。
+        """
+        client = self._client
+        self._client = None
+        if client is not None:
+            await client.aclose()
+
+    @property
+    def client(self):
+        """
+        获取共享客户端。
+        如果在 lifespan 之外使用（例如脚本中），则按需创建。
+        """
+        if self._client is None:
+            self._client = self._create_client()
+        return self._client
+
+    def timeout_for(self, provider):
+        """
+        返回指定上游服务的超时时间。
+        """
+        return PROVIDER_TIMEOUTS.get(provider, DEFAULT_TIMEOUT)
+
+    async def get(self, provider, url, **kwargs):
+        """
+        使用共享客户端发送 GET 请求，并应用该上游服务的超时设置。
+        同时记录该上游的请求耗时和结果（HTTP 状态类别或异常类型）。
+        """
+        kwargs.setdefault("timeout", self.timeout_for(provider))
+        start = time.perf_counter()
+        try:
+            with span(f"upstream.{provider}"):
+                response = await self.client.get(url, **kwargs)
+        except Exception as e:
+            UPSTREAM_LATENCY.labels(provider).observe(time.perf_counter() - start)
+            UPSTREAM_REQUESTS.labels(provider, type(e).__name__).inc()
+            raise
+        UPSTREAM_LATENCY.labels(provider).observe(time.perf_counter() - start)
+        UPSTREAM_REQUESTS.labels(provider, f"{response.status_code // 100}xx").inc()
+        return response
+
+# 创建全局单例实例
+http_client = HttpClientManager()
@@ -0,0 +1,259 @@
+import os
+import time
+from bisect import bisect_left
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 是否启用请求指标中间件
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# 默认延迟分桶（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join('%s="%s"' % (n, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for n, v in zip(names, values))
+    return "{%s}" % pairs
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _HistogramChild:
+    """
+    单个标签组合的直方图：分桶计数在创建时预先分配，记录时只做一次二分查找和两次加法。
+    """
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric:
+    """
+    指标基类。带标签的指标按标签值元组缓存子对象，
+    同一组标签只在第一次出现时分配，之后的记录不产生新对象。
+    调用方应在模块加载或初始化时用 labels() 取得子对象并保存下来。
+    """
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labelnames, values, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labelnames, values)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """
+    单调递增计数器。
+    """
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.value += amount
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield "_total", self.labelnames, values, child.value
+
+
+class Histogram(_Metric):
+    """
+    直方图（累计分桶），用于延迟等分布。
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def _samples(self):
+        names = self.labelnames + ("le",)
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), child.counts):
+                cumulative += count
+                yield "_bucket", names, values + (_format_value(float(bound)),), cumulative
+            yield "_sum", self.labelnames, values, child.sum
+            yield "_count", self.labelnames, values, child.count
+
+
+class Gauge(_Metric):
+    """
+    瞬时值指标。值在抓取时由回调函数计算，记录路径上没有任何开销。
+    回调返回一个数值，或 {标签值元组: 数值}。
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, callback, labelnames=()):
+        self.callback = callback
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return None
+
+    def _samples(self):
+        try:
+            value = self.callback()
+        except Exception as e:
+            print(f"指标 {self.name} 回调错误: {e}")
+            return
+        if value is None:
+            return
+        if isinstance(value, dict):
+            for values, v in value.items():
+                yield "", self.labelnames, values, v
+        else:
+            yield "", self.labelnames, (), value
+
+
+class MetricsRegistry:
+    """
+    指标注册表，负责按 Prometheus 文本格式输出所有指标。
+    所有计数都在事件循环线程（或单个专用写线程）中完成，不需要加锁。
+    """
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"指标已存在: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, callback, labelnames=()):
+        return self._register(Gauge(name, documentation, callback, labelnames))
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    纯 ASGI 请求指标中间件（不经过 BaseHTTPMiddleware，不会包装请求/响应体）。
+    请求结束后按路由模板（如 /api/history，而不是带参数的实际路径）记录延迟和状态码，
+    未匹配路由的请求统一记为 <unmatched>，避免标签数量无限增长。
+    """
+    def __init__(self, app):
+        self.app = app
+        self.latency = HTTP_REQUEST_LATENCY
+        self.requests = HTTP_REQUESTS
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            path = getattr(route, "path", None) or getattr(route, "path_format", None)
+            if path is None:
+                path = "/static" if scope.get("path", "").startswith("/static/") else "<unmatched>"
+            method = scope["method"]
+            self.latency.labels(method, path).observe(elapsed)
+            self.requests.labels(method, path, status[0]).inc()
+
+
+# 创建全局指标注册表
+registry = MetricsRegistry()
+
+# HTTP 请求
+HTTP_REQUEST_LATENCY = registry.histogram(
+    "dashboard_http_request_duration_seconds", "HTTP 请求处理耗时（秒）", ("method", "route"))
+HTTP_REQUESTS = registry.counter(
+    "dashboard_http_requests", "HTTP 请求数", ("method", "route", "status"))
+
+# 缓存
+CACHE_REQUESTS = registry.counter(
+    "dashboard_cache_requests", "缓存访问次数（result 为 hit/miss/stale）", ("cache", "result"))
+RATES_CACHE_HIT = CACHE_REQUESTS.labels("rates", "hit")
+RATES_CACHE_MISS = CACHE_REQUESTS.labels("rates", "miss")
+RATES_CACHE_STALE = CACHE_REQUESTS.labels("rates", "stale")
+NEWS_CACHE_HIT = CACHE_REQUESTS.labels("news", "hit")
+NEWS_CACHE_MISS = CACHE_REQUESTS.labels("news", "miss")
+NEWS_CACHE_STALE = CACHE_REQUESTS.labels("news", "stale")
+SERIES_CACHE_HIT = CACHE_REQUESTS.labels("history_series", "hit")
+SERIES_CACHE_MISS = CACHE_REQUESTS.labels("history_series", "miss")
+
+# 上游请求
+UPSTREAM_LATENCY = registry.histogram(
+    "dashboard_upstream_request_duration_seconds", "上游 API 请求耗时（秒）", ("provider",))
+UPSTREAM_REQUESTS = registry.counter(
+    "dashboard_upstream_requests", "上游 API 请求数（outcome 为 HTTP 状态类别或异常类型）", ("provider", "outcome"))
+
+# 历史记录存储
+HISTORY_WRITE_LATENCY = registry.histogram(
+    "dashboard_history_write_duration_seconds", "历史记录写入耗时（秒）")
@@ -0,0 +1,140 @@
+import numpy as np
+
+# ISO 4217 货币的小数位数（最小货币单位），未列出的货币按 2 位处理
+MINOR_UNITS = {
+    "BIF": 0, "CLP": 0, "DJF": 0, "GNF": 0, "ISK": 0, "JPY": 0, "KMF": 0, "KRW": 0, "PYG": 0,
+    "RWF": 0, "UGX": 0, "UYI": 0, "VND": 0, "VUV": 0, "XAF": 0, "XOF": 0, "XPF": 0,
+    "BHD": 3, "IQD": 3, "JOD": 3, "KWD": 3, "LYD": 3, "OMR": 3, "TND": 3,
+    "CLF": 4, "UYW": 4,
+}
+DEFAULT_MINOR_UNIT = 2
+
+# 汇率保留的有效数字位数：汇率 ≈ 有效数字(整数) × 10^指数
+RATE_DIGITS = 9
+
+INT64_MAX = int(np.iinfo(np.int64).max)
+# 最小单位金额的上限，留出余量保证加减运算不会溢出
+AMOUNT_LIMIT = 2.0 ** 62
+POW10 = 10 ** np.arange(19, dtype=np.int64)
+
+
+def minor_unit(code):
+    """
+    返回货币的小数位数。
+    """
+    return MINOR_UNITS.get(code, DEFAULT_MINOR_UNIT)
+
+
+def minor_units(codes):
+    """
+    返回一组货币的小数位数数组。
+    """
+    return np.array([minor_unit(c) for c in codes], dtype=np.int64)
+
+
+def to_minor(amounts, exponents):
+    """
+    把金额（float 或数组）转换为最小货币单位的 int64，按银行家舍入（四舍六入五成双）。
+    返回 (整数数组, 有效掩码)，NaN、无穷大和超出范围的金额无效（对应位置为 0）。
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    scaled = amounts * 10.0 ** np.asarray(exponents, dtype=np.float64)
+    valid = np.isfinite(scaled) & (np.abs(np.nan_to_num(scaled)) < AMOUNT_LIMIT)
+    return np.where(valid, np.rint(np.where(valid, scaled, 0.0)), 0.0).astype(np.int64), valid
+
+
+def from_minor(minor, exponents):
+    """
+    把最小单位金额转换为 float（用于输出），结果是与十进制金额最接近的 float。
+    """
+    return np.asarray(minor, dtype=np.float64) / 10.0 ** np.asarray(exponents, dtype=np.float64)
+
+
+def scale_rates(rates):
+    """
+    把 float 汇率（或汇率数组）转换为整数表示，返回 (有效数字, 指数) 两个 int64 数组：
+    汇率 ≈ 有效数字 × 10^指数，有效数字最多 RATE_DIGITS 位（去掉末尾的 0）。
+    无效汇率（NaN、非正数）的有效数字为 0。
+    """
+    rates = np.asarray(rates, dtype=np.float64)
+    valid = np.isfinite(rates) & (rates > 0)
+    safe = np.where(valid, rates, 1.0)
+    exponent = np.floor(np.log10(safe)).astype(np.int64) - (RATE_DIGITS - 1)
+    # 除以精确的 10 的幂比乘以 10 的负幂更准确
+    significand = np.where(exponent < 0, safe * 10.0 ** np.maximum(-exponent, 0), safe / 10.0 ** np.maximum(exponent, 0))
+    significand = np.rint(significand).astype(np.int64)
+    for _ in range(RATE_DIGITS - 1):
+        trailing = (significand % 10 == 0) & (significand != 0)
+        if not trailing.any():
+            break
+        significand = np.where(trailing, significand // 10, significand)
+        exponent = np.where(trailing, exponent + 1, exponent)
+    return np.where(valid, significand, 0), exponent
+
+
+def round_div(numerator, denominator):
+    """
+    int64 整数除法（denominator > 0），按银行家舍入。
+    """
+    quotient, remainder = np.divmod(numerator, denominator)
+    twice = 2 * remainder
+    return quotient + ((twice > denominator) | ((twice == denominator) & (quotient % 2 == 1)))
+
+
+def _round_div_int(numerator, denominator):
+    quotient, remainder = divmod(numerator, denominator)
+    twice = 2 * remainder
+    if twice > denominator or (twice == denominator and quotient % 2 == 1):
+        quotient += 1
+    return quotient
+
+
+def convert_minor(amounts, from_exponents, to_exponents, significands, rate_exponents):
+    """
+    把最小单位金额按整数汇率换算为目标货币的最小单位，按银行家舍入：
+      结果 = 金额 × 有效数字 × 10^(目标小数位 − 源小数位 + 汇率指数)
+    参数可以是标量或可广播的数组，全部在 int64 中向量化计算；
+    少数乘积可能超出 int64 的行（金额极大时）逐行用 Python 整数精确计算。
+    返回 (结果数组, 有效掩码)，汇率无效或结果超出 int64 的行无效（对应位置为 0）。
+    """
+    arrays = np.broadcast_arrays(amounts, from_exponents, to_exponents, significands, rate_exponents)
+    shape = arrays[0].shape
+    amounts, from_exponents, to_exponents, significands, rate_exponents = (np.asarray(a, dtype=np.int64).ravel() for a in arrays)
+    shift = to_exponents - from_exponents + rate_exponents
+    valid = significands > 0
+    # 按 float 估算乘积大小（留出余量），能安全放进 int64 的走快速路径
+    magnitude = np.abs(amounts.astype(np.float64)) * significands * 10.0 ** np.maximum(shift, 0)
+    fast = valid & (magnitude < AMOUNT_LIMIT) & (shift >= -18)
+    result = np.zeros(amounts.shape, dtype=np.int64)
+
+    product = amounts[fast] * significands[fast]
+    fast_shift = shift[fast]
+    up = fast_shift >= 0
+    fast_result = np.empty(product.shape, dtype=np.int64)
+    fast_result[up] = product[up] * POW10[fast_shift[up]]
+    fast_result[~up] = round_div(product[~up], POW10[-fast_shift[~up]])
+    result[fast] = fast_result
+
+    for i in np.flatnonzero(valid & ~fast):
+        exact = int(amounts[i]) * int(significands[i])
+        s = int(shift[i])
+        value = exact * 10 ** s if s >= 0 else _round_div_int(exact, 10 ** -s)
+        if abs(value) > INT64_MAX:
+            valid[i] = False
+        else:
+            result[i] = value
+    return result.reshape(shape), valid.reshape(shape)
+
+
+def convert_amount(amount, from_curr, to_curr, rate):
+    """
+    单笔换算：amount 个 from_curr 按 rate 换算为 to_curr，
+    金额和结果都按各自货币的小数位舍入。无法换算时返回 None。
+    """
+    from_exp, to_exp = minor_unit(from_curr), minor_unit(to_curr)
+    minor, ok = to_minor(amount, from_exp)
+    significand, exponent = scale_rates(rate)
+    result, valid = convert_minor(minor, from_exp, to_exp, significand, exponent)
+    if not (ok & valid):
+        return None
+    return float(from_minor(result, to_exp))
@@ -0,0 +1,197 @@
+import os
+import re
+import time
+import heapq
+from calendar import timegm
+from urllib.parse import urlsplit, urlunsplit
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 新闻保留天数和最大条数，超出后淘汰最旧的新闻
+NEWS_RETENTION_DAYS = float(os.getenv("NEWS_RETENTION_DAYS", "7"))
+NEWS_MAX_ITEMS = int(os.getenv("NEWS_MAX_ITEMS", "2000"))
+
+# 可从标题/摘要中识别的货币代码
+KNOWN_CURRENCIES = {
+    "USD", "CNY", "EUR", "GBP", "JPY", "HKD", "AUD", "CAD", "SGD", "CHF",
+    "INR", "RUB", "KRW", "THB", "VND", "MYR", "IDR", "PHP", "TWD", "NZD",
+    "SEK", "NOK", "DKK", "MXN", "BRL", "ZAR", "TRY", "PLN", "AED", "SAR"
+}
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+CODE_PATTERN = re.compile(r"\b[A-Z]{3}\b")
+
+
+def tokenize(text):
+    """
+    把文本切分为小写词元（用于建立和查询倒排索引）。
+    """
+    return [t for t in TOKEN_PATTERN.findall((text or "").lower()) if len(t) > 1 or not t.isascii()]
+
+
+def normalize_url(url):
+    """
+    规范化新闻链接用于去重：去掉首尾空白和 #片段，主机名转小写。
+    """
+    parts = urlsplit((url or "").strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, ""))
+
+
+def parse_published(value):
+    """
+    解析 Alpha Vantage 的 time_published（如 20240101T123000），失败时返回当前时间。
+    """
+    try:
+        return timegm(time.strptime(value[:15], "%Y%m%dT%H%M%S"))
+    except (TypeError, ValueError):
+        return int(time.time())
+
+
+def extract_currencies(item):
+    """
+    提取新闻关联的货币/代码标签：ticker_sentiment 中的 FOREX:XXX、CRYPTO:XXX 及其他代码，
+    以及标题和摘要中出现的货币代码。
+    """
+    tags = set()
+    for ticker in item.get("ticker_sentiment") or []:
+        symbol = str(ticker.get("ticker") or "").upper()
+        if symbol:
+            tags.add(symbol.split(":", 1)[-1])
+    text = f"{item.get('title') or ''} {item.get('summary') or ''}"
+    tags.update(code for code in CODE_PATTERN.findall(text) if code in KNOWN_CURRENCIES)
+    return tags
+
+
+class NewsIndex:
+    """
+    新闻内存索引。
+    每次抓取的完整 feed 都会合并进来，按规范化后的 URL 去重；
+    标题和摘要建立倒排索引（词元 -> 新闻 ID 集合），货币/代码标签另建一个标签索引，
+    搜索时只对几个集合求交集，再按发布时间取最新的若干条，不需要访问上游。
+    超过保留期限或条数上限的旧新闻会从所有索引中移除。
+    """
+    def __init__(self, retention_days=NEWS_RETENTION_DAYS, max_items=NEWS_MAX_ITEMS):
+        self.retention = retention_days * 86400
+        self.max_items = max_items
+        self.items = {} # id -> 新闻
+        self._by_url = {} # 规范化 URL -> id
+        self._terms = {} # 词元 -> {id}
+        self._tags = {} # 货币/代码 -> {id}
+        self._doc_terms = {} # id -> (词元集合, 标签集合)，用于删除
+        self._last_id = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def ingest(self, feed):
+        """
+        合并一批上游新闻，返回新增的条数。已存在的链接只更新内容。
+        """
+        added = 0
+        for raw in feed:
+            url = normalize_url(raw.get("url"))
+            if not url:
+                continue
+            item = {
+                "title": raw.get("title") or "",
+                "url": raw.get("url"),
+                "source": raw.get("source") or "",
+                "summary": raw.get("summary") or "",
+                "published": parse_published(raw.get("time_published")),
+                "currencies": sorted(extract_currencies(raw)),
+            }
+            existing = self._by_url.get(url)
+            if existing is not None:
+                self._unindex(existing)
+                item_id = existing
+            else:
+                self._last_id += 1
+                item_id = self._last_id
+                added += 1
+            item["id"] = item_id
+            self._index(item_id, url, item)
+        self.evict()
+        return added
+
+    def _index(self, item_id, url, item):
+        terms = set(tokenize(item["title"])) | set(tokenize(item["summary"]))
+        tags = set(item["currencies"])
+        self.items[item_id] = item
+        self._by_url[url] = item_id
+        self._doc_terms[item_id] = (terms, tags)
+        for term in terms:
+            self._terms.setdefault(term, set()).add(item_id)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(item_id)
+
+    def _unindex(self, item_id):
+        item = self.items.pop(item_id, None)
+        if item is None:
+            return
+        self._by_url.pop(normalize_url(item["url"]), None)
+        terms, tags = self._doc_terms.pop(item_id)
+        for index, keys in ((self._terms, terms), (self._tags, tags)):
+            for key in keys:
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(item_id)
+                    if not ids:
+                        del index[key]
+
+    def evict(self, now=None):
+        """
+        移除超过保留期限的新闻；条数仍超过上限时移除最旧的。
+        """
+        cutoff = (now or time.time()) - self.retention
+        expired = [i for i, item in self.items.items() if item["published"] < cutoff]
+        overflow = len(self.items) - len(expired) - self.max_items
+        if overflow > 0:
+            expired_set = set(expired)
+            remaining = [i for i in self.items if i not in expired_set]
+            expired += heapq.nsmallest(overflow, remaining, key=self._sort_key)
+        for item_id in expired:
+            self._unindex(item_id)
+
+    def _sort_key(self, item_id):
+        return (self.items[item_id]["published"], item_id)
+
+    def latest(self, limit=5):
+        """
+        返回最新的 limit 条新闻。
+        """
+        return [self.items[i] for i in heapq.nlargest(limit, self.items, key=self._sort_key)]
+
+    def search(self, query=None, currency=None, limit=20):
+        """
+        搜索新闻：query 中的所有词元都必须出现（AND），currency 为货币/代码标签过滤。
+        返回 (命中总数, 按发布时间倒序的前 limit 条)。
+        """
+        sets = []
+        for term in set(tokenize(query)):
+            ids = self._terms.get(term)
+            if not ids:
+                return 0, []
+            sets.append(ids)
+        if currency:
+            ids = self._tags.get(currency.upper())
+            if not ids:
+                return 0, []
+            sets.append(ids)
+        if not sets:
+            return len(self.items), self.latest(limit)
+
+        sets.sort(key=len)
+        matches = set(sets[0])
+        for ids in sets[1:]:
+            matches &= ids
+            if not matches:
+                return 0, []
+        top = heapq.nlargest(limit, matches, key=self._sort_key)
+        return len(matches), [self.items[i] for i in top]
+
+    def tag_counts(self):
+        """
+        返回每个货币/代码标签关联的新闻数。
+        """
+        return {tag: len(ids) for tag, ids in sorted(self._tags.items())}
@@ -0,0 +1,247 @@
+import io
+import os
+import hmac
+import time
+import random
+import marshal
+import pstats
+import cProfile
+import itertools
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from jinja2 import Template
+
+load_dotenv()
+
+# 随机抽样分析的请求比例（0~1，0 表示不抽样）
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# 管理令牌：请求带上 X-Profile-Token 头且与之相同时强制分析该请求，/admin/profiles 也需要该令牌；为空时两者都关闭
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+# 保留最近多少条分析记录
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))
+# 文本摘要中列出的函数数量
+PROFILE_TOP_FUNCTIONS = int(os.getenv("PROFILE_TOP_FUNCTIONS", "40"))
+# 单个请求最多运行 cProfile 的秒数，超时后停止分析器（耗时段照常记录）
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "5"))
+# 不分析的路径前缀（逗号分隔），默认排除长连接的 SSE 推送
+PROFILE_EXCLUDE_PATHS = tuple(p.strip() for p in os.getenv("PROFILE_EXCLUDE_PATHS", "/api/stream").split(",") if p.strip())
+
+PROFILE_HEADER = "x-profile-token"
+ADMIN_PREFIX = "/admin/profiles"
+
+# 当前请求的分析记录（未被分析的请求为 None）
+_current_trace = ContextVar("profile_trace", default=None)
+
+
+def token_matches(value):
+    """
+    用常量时间比较检查管理令牌。
+    """
+    return bool(PROFILE_TOKEN) and value is not None and hmac.compare_digest(value, PROFILE_TOKEN)
+
+
+@contextmanager
+def span(name):
+    """
+    记录一段耗时（上游请求、模板渲染、历史记录读写等）。
+    当前请求没有被分析时只多一次 ContextVar 读取，可以放在任何热路径上。
+    线程池中的代码拿不到请求上下文，应在事件循环中包住 await run_in_executor(...)。
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        trace.spans.append({
+            "name": name,
+            "start_ms": round((start - trace.started) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3),
+        })
+
+
+class ProfiledTemplate(Template):
+    """
+    渲染时记录 template.<模板名> 耗时段的 Jinja2 模板（TemplateResponse 和直接渲染片段都会经过这里）。
+    """
+    def render(self, *args, **kwargs):
+        with span(f"template.{self.name}"):
+            return super().render(*args, **kwargs)
+
+
+def instrument_templates(templates):
+    """
+    让 Jinja2Templates 之后加载的模板都记录渲染耗时。
+    """
+    templates.env.template_class = ProfiledTemplate
+    return templates
+
+
+class Trace:
+    """
+    一次请求的分析记录：请求信息、耗时段，以及（拿到分析器时）cProfile 统计。
+    """
+    __slots__ = ("id", "method", "path", "query", "trigger", "timestamp", "started",
+                 "duration_ms", "status", "spans", "profile_text", "profile_data")
+
+    def __init__(self, trace_id, scope, trigger):
+        self.id = trace_id
+        self.method = scope.get("method")
+        self.path = scope.get("path")
+        self.query = scope.get("query_string", b"").decode("latin-1")
+        self.trigger = trigger
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.status = None
+        self.spans = []
+        self.profile_text = None
+        self.profile_data = None
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "trigger": self.trigger,
+            "timestamp": self.timestamp,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "spans": len(self.spans),
+            "profiled": self.profile_data is not None,
+        }
+
+    def to_dict(self):
+        data = self.summary()
+        data["spans"] = self.spans
+        data["profile"] = self.profile_text
+        return data
+
+
+class ProfileBuffer:
+    """
+    最近的分析记录（有界环形缓冲区，满后丢弃最旧的）。
+    """
+    def __init__(self, size=PROFILE_BUFFER_SIZE):
+        self._traces = deque(maxlen=size)
+        self._ids = itertools.count(1)
+
+    def next_id(self):
+        return next(self._ids)
+
+    def add(self, trace):
+        self._traces.append(trace)
+
+    def list(self):
+        return [t.summary() for t in reversed(self._traces)]
+
+    def get(self, trace_id):
+        for trace in self._traces:
+            if trace.id == trace_id:
+                return trace
+        return None
+
+    def __len__(self):
+        return len(self._traces)
+
+
+class ProfilingMiddleware:
+    """
+    按需请求分析中间件（纯 ASGI）。
+    按 PROFILE_SAMPLE_RATE 随机抽样，或对带正确 X-Profile-Token 头的请求进行分析：
+    记录各耗时段，并用 cProfile 记录整个请求的函数调用统计。
+    cProfile 同一时刻只能有一个在运行，且会统计事件循环线程中同时运行的所有代码，
+    所以同一时间只对一个请求启用 cProfile，其他被抽中的请求只记录耗时段。
+    流式响应（text/event-stream）在发出响应头后即停止 cProfile，
+    任何请求运行 cProfile 最多 PROFILE_MAX_SECONDS 秒，避免长连接一直占用分析器。
+    PROFILE_EXCLUDE_PATHS 下的路径完全不分析。
+    被分析的请求会在响应头 X-Profile-Id 中返回记录编号。
+    """
+    def __init__(self, app, buffer=None, sample_rate=PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.buffer = buffer if buffer is not None else profile_buffer
+        self.sample_rate = sample_rate
+        self._profiler_lock = threading.Lock()
+
+    def _trigger(self, scope):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path.startswith(ADMIN_PREFIX) or path.startswith(PROFILE_EXCLUDE_PATHS):
+            return None
+        if PROFILE_TOKEN:
+            for key, value in scope.get("headers", ()):
+                if key == PROFILE_HEADER.encode() and token_matches(value.decode("latin-1")):
+                    return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(self.buffer.next_id(), scope, trigger)
+        status = [500]
+        profiler = cProfile.Profile() if self._profiler_lock.acquire(blocking=False) else None
+        running = [False]
+
+        def stop_profiler():
+            # 只在事件循环线程中调用（cProfile 按线程生效）
+            if running[0]:
+                running[0] = False
+                profiler.disable()
+                self._profiler_lock.release()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                headers = list(message.get("headers", []))
+                for key, value in headers:
+                    if key.lower() == b"content-type" and value.startswith(b"text/event-stream"):
+                        stop_profiler()
+                message = dict(message, headers=headers + [(b"x-profile-id", str(trace.id).encode())])
+            await send(message)
+
+        token = _current_trace.set(trace)
+        timer = None
+        try:
+            if profiler is not None:
+                timer = asyncio.get_running_loop().call_later(PROFILE_MAX_SECONDS, stop_profiler)
+                running[0] = True
+                profiler.enable()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler is not None:
+                timer.cancel()
+                stop_profiler()
+            _current_trace.reset(token)
+            trace.duration_ms = round((time.perf_counter() - trace.started) * 1000, 3)
+            trace.status = status[0]
+            if profiler is not None:
+                _attach_profile(trace, profiler)
+            self.buffer.add(trace)
+
+
+def _attach_profile(trace, profiler):
+    """
+    保存 cProfile 统计：文本摘要（按累计耗时排序）和可下载的原始数据（pstats 格式）。
+    """
+    profiler.create_stats()
+    trace.profile_data = marshal.dumps(profiler.stats)
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+    trace.profile_text = out.getvalue()
+
+
+# 创建全局分析记录缓冲区
+profile_buffer = ProfileBuffer()
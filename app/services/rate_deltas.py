@@ -0,0 +1,90 @@
+import os
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 保留最近多少个快照版本用于增量计算，客户端的版本更旧时返回完整汇率
+RATES_DELTA_VERSIONS = int(os.getenv("RATES_DELTA_VERSIONS", "64"))
+
+
+def parse_symbols(symbols):
+    """
+    解析逗号分隔的货币列表，返回去重排序后的元组（可直接作为缓存键）；未指定时返回 None。
+    """
+    if not symbols:
+        return None
+    return tuple(sorted({c.strip().upper() for c in symbols.split(",") if c.strip()}))
+
+
+def project(rates, codes):
+    """
+    只保留 codes 中的货币（codes 为 None 时原样返回），未知货币忽略。
+    """
+    if codes is None:
+        return rates
+    return {c: rates[c] for c in codes if c in rates}
+
+
+def diff_rates(old, new):
+    """
+    返回从 old 到 new 的增量：(变化或新增的汇率, 被删除的货币列表)。
+    """
+    changed = {c: r for c, r in new.items() if old.get(c) != r}
+    removed = sorted(c for c in old if c not in new)
+    return changed, removed
+
+
+class RateDeltaLog:
+    """
+    汇率快照增量日志。
+    保留最近 RATES_DELTA_VERSIONS 个快照，每次快照切换时一次性算好每个旧版本到新版本的增量，
+    轮询的客户端带上自己持有的版本号（since）即可直接拿到预先算好的变化部分。
+    版本号来自 ExchangeService.rates_version，多进程间一致，且只增不减。
+    """
+    def __init__(self, max_versions=RATES_DELTA_VERSIONS):
+        self.max_versions = max_versions
+        self.version = None
+        self.rates = {}
+        self._snapshots = OrderedDict() # 版本号 -> 汇率字典
+        self._deltas = {} # 旧版本号 -> 到当前版本的增量
+
+    def update(self, version, rates):
+        """
+        记录一份新快照（版本号不大于当前版本时忽略）。
+        """
+        if self.version is not None and version <= self.version:
+            return
+        self._snapshots[version] = rates
+        while len(self._snapshots) > self.max_versions:
+            self._snapshots.popitem(last=False)
+        self._deltas = {old: diff_rates(old_rates, rates)
+                        for old, old_rates in self._snapshots.items() if old != version}
+        self.version = version
+        self.rates = rates
+
+    def delta(self, since, version, rates, codes=None):
+        """
+        返回客户端从 since 版本更新到 version 版本所需的数据：
+          {"version": 当前版本, "since": since, "full": 是否为完整汇率, "rates": {...}, "removed": [...]}
+        since 太旧、来自未来（如服务重启后版本重置）或当前快照不在日志中（默认汇率）时返回完整汇率。
+        codes 不为 None 时只返回这些货币。
+        """
+        if version != self.version or rates is not self.rates:
+            changed, removed, full = rates, [], True
+        elif since == version:
+            changed, removed, full = {}, [], False
+        elif since in self._deltas:
+            (changed, removed), full = self._deltas[since], False
+        else:
+            changed, removed, full = rates, [], True
+        if codes is not None:
+            wanted = set(codes)
+            removed = [c for c in removed if c in wanted]
+        return {
+            "version": version,
+            "since": since,
+            "full": full,
+            "rates": project(changed, codes),
+            "removed": removed
+        }
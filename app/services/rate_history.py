@@ -0,0 +1,260 @@
+import os
+import sys
+import csv
+import json
+import shutil
+import threading
+from datetime import datetime, timezone
+import numpy as np
+
+TIMESTAMP_DTYPE = np.int64
+RATE_DTYPE = np.float64
+
+
+class RateHistoryStore:
+    """
+    列式汇率时间序列存储。
+    目录结构：
+      timestamps.i64     int64 时间戳（秒），严格递增
+      columns/<CCY>.f64  每种货币一列 float64（USD 基准汇率），缺失值为 NaN
+    追加时先写各列，最后写时间戳，时间戳文件的长度即为有效行数，
+    异常退出时多写的列数据会在下次打开时截掉。
+    查询时用 numpy.memmap 只映射时间戳和需要的两列，按时间二分定位区间，
+    不会把整个存储读入内存。
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.columns_dir = os.path.join(directory, "columns")
+        self.timestamps_path = os.path.join(directory, "timestamps.i64")
+        self._lock = threading.Lock()
+        self._prepared = False
+
+    def _column_path(self, currency):
+        return os.path.join(self.columns_dir, f"{currency}.f64")
+
+    def _prepare(self):
+        """
+        创建目录，并把各列长度修正为与时间戳一致。
+        """
+        if self._prepared:
+            return
+        os.makedirs(self.columns_dir, exist_ok=True)
+        size = self.row_count() * RATE_DTYPE().itemsize
+        for currency in self.currencies():
+            path = self._column_path(currency)
+            column_size = os.path.getsize(path)
+            if column_size > size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+            elif column_size < size:
+                with open(path, "ab") as f:
+                    f.write(np.full((size - column_size) // RATE_DTYPE().itemsize, np.nan, dtype=RATE_DTYPE).tobytes())
+        self._prepared = True
+
+    def row_count(self):
+        """
+        返回已写入的快照条数。
+        """
+        if not os.path.exists(self.timestamps_path):
+            return 0
+        return os.path.getsize(self.timestamps_path) // TIMESTAMP_DTYPE().itemsize
+
+    def currencies(self):
+        """
+        返回存储中的所有货币代码。
+        """
+        if not os.path.isdir(self.columns_dir):
+            return []
+        return sorted(name[:-4] for name in os.listdir(self.columns_dir) if name.endswith(".f64"))
+
+    def last_timestamp(self):
+        """
+        返回最后一条快照的时间戳，没有数据时返回 None。
+        """
+        n = self.row_count()
+        if n == 0:
+            return None
+        return int(self._map(self.timestamps_path, TIMESTAMP_DTYPE, n)[-1])
+
+    def _map(self, path, dtype, n):
+        if n == 0 or not os.path.exists(path):
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(n,))
+
+    def append(self, timestamp, rates):
+        """
+        追加一条汇率快照（USD 基准）。
+        时间戳不晚于最后一条时忽略（同一份上游数据重复写入），返回是否写入。
+        """
+        with self._lock:
+            self._prepare()
+            return self._append(int(timestamp), rates)
+
+    def _append(self, timestamp, rates):
+        n = self.row_count()
+        if n and timestamp <= self.last_timestamp():
+            return False
+        existing = set(self.currencies())
+        for currency in existing | set(rates):
+            with open(self._column_path(currency), "ab") as f:
+                if currency not in existing and n:
+                    # 新出现的货币：之前的行补 NaN
+                    f.write(np.full(n, np.nan, dtype=RATE_DTYPE).tobytes())
+                f.write(np.array([rates.get(currency, np.nan)], dtype=RATE_DTYPE).tobytes())
+        with open(self.timestamps_path, "ab") as f:
+            f.write(np.array([timestamp], dtype=TIMESTAMP_DTYPE).tobytes())
+        return True
+
+    def locate(self, start=None, end=None):
+        """
+        二分查找 [start, end] 区间对应的行号范围，返回 (lo, hi)。
+        """
+        n = self.row_count()
+        timestamps = self._map(self.timestamps_path, TIMESTAMP_DTYPE, n)
+        lo = int(np.searchsorted(timestamps, start, side="left")) if start is not None else 0
+        hi = int(np.searchsorted(timestamps, end, side="right")) if end is not None else n
+        return lo, max(lo, hi)
+
+    def window_key(self, lo, hi):
+        """
+        返回第 [lo, hi) 行的标识 (首条时间戳, 末条时间戳, 条数)，用作缓存键：
+        追加或回填改变了区间内容时标识也会变化。
+        """
+        n = self.row_count()
+        hi = min(hi, n)
+        if lo >= hi:
+            return (None, None, 0)
+        timestamps = self._map(self.timestamps_path, TIMESTAMP_DTYPE, n)
+        return (int(timestamps[lo]), int(timestamps[hi - 1]), hi - lo)
+
+    def query(self, base, target, start=None, end=None):
+        """
+        查询 [start, end] 区间内 base/target 的交叉汇率序列。
+        返回 (时间戳数组, 汇率数组)，缺失的点会被剔除。
+        """
+        lo, hi = self.locate(start, end)
+        return self.read_rows(base, target, lo, hi)
+
+    def read_rows(self, base, target, lo, hi):
+        """
+        读取第 [lo, hi) 行 base/target 的交叉汇率序列，返回 (时间戳数组, 汇率数组)，缺失的点会被剔除。
+        """
+        n = self.row_count()
+        hi = min(hi, n)
+        if lo >= hi or not os.path.exists(self._column_path(base)) or not os.path.exists(self._column_path(target)):
+            return np.empty(0, dtype=TIMESTAMP_DTYPE), np.empty(0, dtype=RATE_DTYPE)
+
+        timestamps = self._map(self.timestamps_path, TIMESTAMP_DTYPE, n)
+        base_column = self._map(self._column_path(base), RATE_DTYPE, n)[lo:hi]
+        target_column = self._map(self._column_path(target), RATE_DTYPE, n)[lo:hi]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = target_column / base_column
+        mask = np.isfinite(values)
+        return np.array(timestamps[lo:hi][mask]), values[mask]
+
+    def tail(self, currencies, max_rows):
+        """
+        读取最近 max_rows 条快照中指定货币的汇率。
+        返回 (时间戳数组, 二维汇率数组[行, 货币])，不存在的货币整列为 NaN。
+        """
+        n = self.row_count()
+        lo = max(0, n - max_rows)
+        timestamps = np.array(self._map(self.timestamps_path, TIMESTAMP_DTYPE, n)[lo:])
+        values = np.full((n - lo, len(currencies)), np.nan, dtype=RATE_DTYPE)
+        for j, currency in enumerate(currencies):
+            path = self._column_path(currency)
+            if os.path.exists(path):
+                values[:, j] = self._map(path, RATE_DTYPE, n)[lo:]
+        return timestamps, values
+
+    def import_file(self, path):
+        """
+        从本地文件导入历史数据（回填），返回导入的快照条数。
+        支持的格式：
+          .csv   表头为 timestamp,USD,CNY,...，timestamp 可以是 Unix 秒或 YYYY-MM-DD
+          .json  单个或一组 ExchangeRate-API 格式的响应（time_last_update_unix + conversion_rates）
+          .jsonl 每行一个上述响应
+        """
+        snapshots = load_backfill(path)
+        if not snapshots:
+            return 0
+        with self._lock:
+            self._prepare()
+            last = self.last_timestamp()
+            if last is None or min(snapshots) > last:
+                for timestamp in sorted(snapshots):
+                    self._append(timestamp, snapshots[timestamp])
+            else:
+                self._rebuild(snapshots)
+        return len(snapshots)
+
+    def _rebuild(self, snapshots):
+        """
+        回填数据早于已有数据时，合并后重写整个存储（离线操作）。
+        已有数据优先于导入数据。
+        """
+        n = self.row_count()
+        timestamps = self._map(self.timestamps_path, TIMESTAMP_DTYPE, n)
+        columns = {c: self._map(self._column_path(c), RATE_DTYPE, n) for c in self.currencies()}
+        merged = dict(snapshots)
+        for i, timestamp in enumerate(timestamps.tolist()):
+            merged[timestamp] = {c: float(col[i]) for c, col in columns.items() if not np.isnan(col[i])}
+        del timestamps, columns
+
+        tmp = RateHistoryStore(self.directory + ".tmp")
+        shutil.rmtree(tmp.directory, ignore_errors=True)
+        tmp._prepare()
+        for timestamp in sorted(merged):
+            tmp._append(timestamp, merged[timestamp])
+
+        old_directory = self.directory + ".old"
+        shutil.rmtree(old_directory, ignore_errors=True)
+        if os.path.exists(self.directory):
+            os.replace(self.directory, old_directory)
+        os.replace(tmp.directory, self.directory)
+        shutil.rmtree(old_directory, ignore_errors=True)
+
+
+def _parse_timestamp(value):
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    return int(datetime.strptime(value[:10], "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+
+
+def load_backfill(path):
+    """
+    读取回填文件，返回 {时间戳: {货币: 汇率}}。
+    """
+    snapshots = {}
+    if path.endswith(".csv"):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                timestamp = _parse_timestamp(row.pop("timestamp"))
+                snapshots[timestamp] = {c: float(v) for c, v in row.items() if v not in (None, "")}
+        return snapshots
+
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            items = [json.loads(line) for line in f if line.strip()]
+        else:
+            items = json.load(f)
+            if isinstance(items, dict):
+                items = [items]
+    for item in items:
+        rates = item.get("conversion_rates") or item.get("rates")
+        timestamp = item.get("time_last_update_unix")
+        if rates and timestamp:
+            snapshots[int(timestamp)] = rates
+    return snapshots
+
+
+if __name__ == "__main__":
+    # 命令行回填：python -m app.services.rate_history <文件> [存储目录]
+    from app.services.exchange_api import DATA_DIR
+    if len(sys.argv) < 2:
+        print("用法: python -m app.services.rate_history <backfill.csv|json|jsonl> [存储目录]")
+        sys.exit(1)
+    directory = sys.argv[2] if len(sys.argv) > 2 else os.path.join(DATA_DIR, "rate_history")
+    count = RateHistoryStore(directory).import_file(sys.argv[1])
+    print(f"已导入 {count} 条快照到 {directory}")
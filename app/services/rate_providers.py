@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import random
+import asyncio
+from dotenv import load_dotenv
+from app.services.http_client import http_client
+
+load_dotenv()
+
+# 按优先级排列的汇率上游：exchangerate（需要 EXCHANGE_API_KEY）、openerapi（第三方免费接口，无需密钥，需要时自行加入）、file（本地文件）
+RATE_PROVIDERS = os.getenv("RATE_PROVIDERS", "exchangerate")
+# 本地文件上游读取的文件（ExchangeRate-API 格式的 JSON）
+RATES_FILE_PROVIDER_PATH = os.getenv("RATES_FILE_PROVIDER_PATH", "")
+# 对冲请求：主上游超过该秒数仍未返回时并行请求下一个上游，取先成功的结果（0 表示关闭，按顺序故障转移）
+RATE_HEDGE_DELAY = float(os.getenv("RATE_HEDGE_DELAY", "0"))
+
+# 熔断器：连续失败多少次后熔断，熔断时长从 BREAKER_BASE_BACKOFF 开始指数增长，最长 BREAKER_MAX_BACKOFF（秒）
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_BASE_BACKOFF = float(os.getenv("BREAKER_BASE_BACKOFF", "30"))
+BREAKER_MAX_BACKOFF = float(os.getenv("BREAKER_MAX_BACKOFF", "1800"))
+
+
+class ProviderError(Exception):
+    """
+    上游请求失败。permanent 为 True 表示重试也不会成功（缺少或无效的密钥、额度用尽），
+    熔断器会直接按最长时间熔断（失败的负缓存）。
+    """
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class CircuitBreaker:
+    """
+    熔断器。
+    closed：正常放行；连续失败达到阈值后进入 open，在熔断期内直接拒绝，请求不会再等待上游超时；
+    熔断期结束后进入 half-open，只放行一次试探请求：成功则恢复 closed，失败则以翻倍的时长再次熔断。
+    熔断时长带 ±10% 抖动，避免多个实例同时重试。
+    """
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 base_backoff=BREAKER_BASE_BACKOFF, max_backoff=BREAKER_MAX_BACKOFF):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.failures = 0 # 连续失败次数
+        self.trips = 0 # 连续熔断次数（决定下次熔断时长）
+        self.open_until = 0
+        self.last_error = None
+        self._probing = False
+
+    @property
+    def state(self):
+        if self.open_until == 0:
+            return "closed"
+        if time.time() < self.open_until:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        """
+        判断当前是否允许请求。half-open 状态下只放行一个试探请求。
+        """
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0
+        self.last_error = None
+        self._probing = False
+
+    def record_failure(self, error=None, permanent=False):
+        self.failures += 1
+        self.last_error = str(error) if error else None
+        probing = self._probing
+        self._probing = False
+        if permanent:
+            self._trip(self.max_backoff)
+        elif probing or self.failures >= self.failure_threshold:
+            self._trip(min(self.base_backoff * (2 ** self.trips), self.max_backoff))
+
+    def _trip(self, backoff):
+        self.trips += 1
+        self.open_until = time.time() + backoff * random.uniform(0.9, 1.1)
+        print(f"上游 {self.name} 熔断 {round(backoff)} 秒: {self.last_error}")
+
+
+class RateProvider:
+    """
+    汇率上游基类。fetch() 返回 ExchangeRate-API 格式的数据
+    （result、conversion_rates、time_last_update_unix、time_next_update_unix），失败时抛出 ProviderError。
+    """
+    name = ""
+
+    async def fetch(self):
+        raise NotImplementedError
+
+
+class ExchangeRateApiProvider(RateProvider):
+    """
+    ExchangeRate-API（v6，需要密钥）。
+    """
+    name = "exchangerate"
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    async def fetch(self):
+        if not self.api_key:
+            raise ProviderError("缺少 EXCHANGE_API_KEY", permanent=True)
+        url = f"https://v6.exchangerate-api.com/v6/{self.api_key}/latest/USD"
+        response = await http_client.get(self.name, url)
+        try:
+            data = response.json()
+        except ValueError:
+            raise ProviderError(f"HTTP {response.status_code}")
+        if response.status_code == 200 and data.get("result") == "success":
+            return data
+        error_type = data.get("error-type") or f"HTTP {response.status_code}"
+        raise ProviderError(error_type, permanent=error_type in ("invalid-key", "inactive-account", "quota-reached"))
+
+
+class OpenErApiProvider(RateProvider):
+    """
+    open.er-api.com（ExchangeRate-API 的免费接口，无需密钥，每日更新）。
+    """
+    name = "openerapi"
+
+    async def fetch(self):
+        response = await http_client.get(self.name, "https://open.er-api.com/v6/latest/USD")
+        if response.status_code != 200:
+            raise ProviderError(f"HTTP {response.status_code}")
+        data = response.json()
+        if data.get("result") != "success" or not data.get("rates"):
+            raise ProviderError(data.get("error-type") or "无效响应")
+        return {
+            "result": "success",
+            "base_code": "USD",
+            "time_last_update_unix": data.get("time_last_update_unix"),
+            "time_next_update_unix": data.get("time_next_update_unix"),
+            "conversion_rates": data["rates"]
+        }
+
+
+class FileRateProvider(RateProvider):
+    """
+    本地文件上游：读取 ExchangeRate-API 格式（conversion_rates 或 rates）的 JSON 文件，
+    适合内网环境或由其他系统定期写入汇率。文件没有时间戳时使用文件修改时间。
+    下游（共享快照、换算图、交叉汇率矩阵）都假定汇率以 USD 为基准，
+    其他基准货币的文件会换算为 USD 基准；文件中没有 USD 汇率时无法换算，视为永久错误。
+    """
+    name = "file"
+
+    def __init__(self, path):
+        self.path = path
+
+    def _read(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        rates = data.get("conversion_rates") or data.get("rates")
+        if not rates:
+            raise ProviderError(f"{self.path} 中没有汇率数据")
+        base = str(data.get("base_code") or "USD").upper()
+        if base != "USD":
+            usd = rates.get("USD")
+            if not isinstance(usd, (int, float)) or usd <= 0:
+                raise ProviderError(f"{self.path} 的基准货币为 {base}，且没有有效的 USD 汇率，无法换算为 USD 基准", permanent=True)
+            rates = {code: rate / usd for code, rate in rates.items()}
+            rates["USD"] = 1.0
+        return {
+            "result": "success",
+            "base_code": "USD",
+            "time_last_update_unix": data.get("time_last_update_unix") or int(os.path.getmtime(self.path)),
+            "time_next_update_unix": data.get("time_next_update_unix"),
+            "conversion_rates": rates
+        }
+
+    async def fetch(self):
+        if not self.path or not os.path.exists(self.path):
+            raise ProviderError(f"汇率文件不存在: {self.path}", permanent=True)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, self._read)
+        except (OSError, ValueError) as e:
+            raise ProviderError(str(e))
+
+
+class ProviderChain:
+    """
+    多上游汇率获取。
+    按优先级依次尝试各个上游，熔断中的上游直接跳过；所有上游都在熔断时立即失败，不产生任何等待。
+    设置 hedge_delay 后启用对冲请求：当前上游超过 hedge_delay 秒未返回时并行请求下一个，
+    取第一个成功的结果并取消其余请求。
+    """
+    def __init__(self, providers, hedge_delay=RATE_HEDGE_DELAY):
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+        self.breakers = {p.name: CircuitBreaker(p.name) for p in providers}
+        self.last_provider = None # 最近一次成功的上游
+
+    def retry_at(self):
+        """
+        返回最早有上游可以重试的时间戳。
+        """
+        return min((b.open_until for b in self.breakers.values()), default=0)
+
+    async def _attempt(self, provider):
+        breaker = self.breakers[provider.name]
+        try:
+            data = await provider.fetch()
+        except ProviderError as e:
+            breaker.record_failure(e, e.permanent)
+            raise
+        except asyncio.CancelledError:
+            # 对冲中被取消的请求不计为失败，但要释放 half-open 的试探名额
+            breaker._probing = False
+            raise
+        except Exception as e:
+            breaker.record_failure(e)
+            raise ProviderError(f"{type(e).__name__}: {e}")
+        breaker.record_success()
+        self.last_provider = provider.name
+        return data
+
+    def _next_allowed(self, queue):
+        """
+        从队列中取出下一个熔断器放行的上游（没有时返回 None）。
+        熔断器只在真正要请求某个上游时才询问：half-open 的试探名额一旦被占用，必须由这次请求的结果释放，
+        否则从未被请求的后备上游会一直停留在“试探中”，再也不会被重试。
+        """
+        while queue:
+            provider = queue.pop(0)
+            if self.breakers[provider.name].allow():
+                return provider
+        return None
+
+    async def fetch(self):
+        """
+        获取一份汇率数据，所有上游都失败时抛出 ProviderError。
+        """
+        queue = list(self.providers)
+        provider = self._next_allowed(queue)
+        if provider is None:
+            raise ProviderError("所有汇率上游均处于熔断状态")
+        if self.hedge_delay > 0:
+            return await self._fetch_hedged(provider, queue)
+
+        errors = []
+        while provider is not None:
+            try:
+                return await self._attempt(provider)
+            except ProviderError as e:
+                errors.append(f"{provider.name}: {e}")
+            provider = self._next_allowed(queue)
+        raise ProviderError("; ".join(errors))
+
+    async def _fetch_hedged(self, provider, queue):
+        pending = set()
+        errors = []
+        try:
+            while provider is not None or pending:
+                if provider is not None:
+                    task = asyncio.ensure_future(self._attempt(provider))
+                    task.provider_name = provider.name
+                    pending.add(task)
+                # 还有后备上游时最多等待 hedge_delay 秒，否则等到有结果为止
+                timeout = self.hedge_delay if queue else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(f"{task.provider_name}: {task.exception()}")
+                # 超时或有上游失败：启动下一个后备上游
+                provider = self._next_allowed(queue)
+            raise ProviderError("; ".join(errors))
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def create_provider_chain(exchange_api_key):
+    """
+    按 RATE_PROVIDERS 配置创建上游链。
+    """
+    providers = []
+    for name in RATE_PROVIDERS.split(","):
+        name = name.strip()
+        if name == "exchangerate":
+            providers.append(ExchangeRateApiProvider(exchange_api_key))
+        elif name == "openerapi":
+            providers.append(OpenErApiProvider())
+        elif name == "file":
+            providers.append(FileRateProvider(RATES_FILE_PROVIDER_PATH))
+        elif name:
+            print(f"未知的汇率上游: {name}")
+    return ProviderChain(providers)
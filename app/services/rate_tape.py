@@ -0,0 +1,122 @@
+import os
+import gzip
+import json
+import time
+import zlib
+import threading
+from datetime import datetime, timezone
+import numpy as np
+
+TAPE_SUFFIX = ".ndjson.gz"
+
+
+class RateTape:
+    """
+    汇率磁带：归档每一次上游响应，用于回放和回测。
+    按记录时间的 UTC 日期分文件（YYYY-MM-DD.ndjson.gz），每条记录一行 JSON：
+      {"recorded_at": 记录时间, "provider": 上游名称, "version": 快照版本, "data": 上游原始响应}
+    每次追加都写成一个独立的 gzip 成员，多成员 gzip 文件可以整体顺序解压；
+    写入途中异常退出最多只会损坏最后一条记录，读取时会自动跳过。
+    多进程部署时只有 leader 写入。
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def path_for(self, timestamp):
+        day = datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d")
+        return os.path.join(self.directory, day + TAPE_SUFFIX)
+
+    def record(self, data, provider=None, version=None, recorded_at=None):
+        """
+        追加一条上游响应（在线程池中调用）。
+        """
+        recorded_at = int(recorded_at or time.time())
+        line = json.dumps({"recorded_at": recorded_at, "provider": provider, "version": version, "data": data},
+                          ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with gzip.open(self.path_for(recorded_at), "ab") as f:
+                f.write(line.encode("utf-8") + b"\n")
+
+    def files(self, start=None, end=None):
+        """
+        返回与 [start, end] 区间有重叠的磁带文件（按日期升序）。
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        first = self.path_for(start) if start is not None else None
+        last = self.path_for(end) if end is not None else None
+        paths = sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(TAPE_SUFFIX))
+        return [p for p in paths if (first is None or p >= first) and (last is None or p <= last)]
+
+    def read(self, start=None, end=None):
+        """
+        按时间顺序读取 [start, end] 区间内的记录。
+        """
+        for path in self.files(start, end):
+            yield from read_tape_file(path, start, end)
+
+
+def read_tape_file(path, start=None, end=None):
+    """
+    读取单个磁带文件中 [start, end] 区间内的记录，末尾不完整的记录会被忽略。
+    """
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                recorded_at = record.get("recorded_at", 0)
+                if (start is not None and recorded_at < start) or (end is not None and recorded_at > end):
+                    continue
+                yield record
+    except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+        print(f"磁带文件 {path} 不完整: {e}")
+
+
+def records_to_arrays(records, codes):
+    """
+    把磁带记录转换为 (记录时间数组, 汇率矩阵[行, 货币])，缺失的汇率为 NaN。
+    """
+    timestamps = []
+    rows = []
+    for record in records:
+        rates = (record.get("data") or {}).get("conversion_rates")
+        if not rates:
+            continue
+        timestamps.append(record["recorded_at"])
+        rows.append([rates.get(code, np.nan) for code in codes])
+    values = np.array(rows, dtype=np.float64).reshape(len(rows), len(codes))
+    return np.array(timestamps, dtype=np.int64), values
+
+
+def write_fixture(directory, snapshots, start, interval, provider="fixture"):
+    """
+    生成确定性的磁带（用于性能测试和回测样例）：snapshots 为汇率字典列表，
+    从 start 开始每隔 interval 秒一条。同一天的记录一次写入。
+    """
+    tape = RateTape(directory)
+    os.makedirs(directory, exist_ok=True)
+    lines = {}
+    for i, rates in enumerate(snapshots):
+        recorded_at = start + i * interval
+        record = {
+            "recorded_at": recorded_at,
+            "provider": provider,
+            "version": i + 1,
+            "data": {
+                "result": "success",
+                "base_code": "USD",
+                "time_last_update_unix": recorded_at,
+                "time_next_update_unix": recorded_at + interval,
+                "conversion_rates": rates
+            }
+        }
+        lines.setdefault(tape.path_for(recorded_at), []).append(json.dumps(record, separators=(",", ":")))
+    for path, day_lines in lines.items():
+        with gzip.open(path, "ab") as f:
+            f.write(("\n".join(day_lines) + "\n").encode("utf-8"))
+    return tape
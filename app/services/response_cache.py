@@ -0,0 +1,137 @@
+import os
+import gzip
+import hashlib
+import inspect
+from collections import OrderedDict
+from fastapi import Response
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 缓存的响应条数上限（LRU 淘汰）
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+# 小于该字节数的响应不压缩
+MIN_COMPRESS_SIZE = 512
+
+# brotli 为可选依赖，未安装时只提供 gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CachedBody:
+    """
+    一份已渲染的响应体，以及按需生成并缓存的压缩版本。
+    """
+    __slots__ = ("body", "media_type", "etag", "_encoded")
+
+    def __init__(self, body, media_type):
+        self.body = body
+        self.media_type = media_type
+        self.etag = 'W/"%s"' % hashlib.blake2b(body, digest_size=12).hexdigest()
+        self._encoded = {}
+
+    def encoded(self, encoding):
+        """
+        返回指定编码的响应体，每种编码只压缩一次。
+        """
+        data = self._encoded.get(encoding)
+        if data is None:
+            if encoding == "br":
+                data = brotli.compress(self.body)
+            else:
+                data = gzip.compress(self.body, compresslevel=6)
+            self._encoded[encoding] = data
+        return data
+
+
+def accepted_encodings(header):
+    """
+    解析 Accept-Encoding，返回客户端接受的编码集合（忽略 q=0 的项）。
+    """
+    encodings = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if name:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+def etag_matches(header, etag):
+    """
+    判断 If-None-Match 是否匹配（弱比较）。
+    """
+    if not header:
+        return False
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate == etag or candidate == bare or candidate[2:] == bare:
+            return True
+    return False
+
+
+class ResponseCache:
+    """
+    版本化响应缓存。
+    缓存键由调用方给出，通常为 (接口, 语言, 数据版本)：数据版本不变时直接复用已渲染的响应体，
+    数据更新后版本号变化，旧条目自然失效并按 LRU 淘汰。
+    命中 If-None-Match 时返回 304；否则按 Accept-Encoding 返回 brotli / gzip / 原始响应体。
+    """
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def clear(self):
+        self._entries.clear()
+
+    async def get(self, key, render, media_type):
+        """
+        获取缓存条目，不存在时调用 render 渲染（render 可返回 str/bytes 或其 awaitable）。
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        body = render()
+        if inspect.isawaitable(body):
+            body = await body
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        entry = CachedBody(body, media_type)
+        self._entries[key] = entry
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def respond(self, request, key, render, media_type="text/html; charset=utf-8",
+                      cache_control="no-cache", vary=("Accept-Encoding",), headers=None):
+        """
+        返回带 ETag / Cache-Control 的响应，客户端缓存仍然有效时返回 304。
+        """
+        entry = await self.get(key, render, media_type)
+        response_headers = {
+            "ETag": entry.etag,
+            "Cache-Control": cache_control,
+            "Vary": ", ".join(vary),
+        }
+        if headers:
+            response_headers.update(headers)
+
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            return Response(status_code=304, headers=response_headers)
+
+        body = entry.body
+        if len(body) >= MIN_COMPRESS_SIZE:
+            encodings = accepted_encodings(request.headers.get("accept-encoding"))
+            encoding = "br" if brotli is not None and "br" in encodings else "gzip" if "gzip" in encodings else None
+            if encoding:
+                body = entry.encoded(encoding)
+                response_headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type=entry.media_type, headers=response_headers)
+
+# 创建全局单例实例
+response_cache = ResponseCache()
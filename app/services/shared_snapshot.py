@@ -0,0 +1,196 @@
+import os
+import mmap
+import zlib
+import struct
+import tempfile
+from contextlib import contextmanager
+import numpy as np
+
+# 文件锁：POSIX 使用 fcntl，Windows 使用 msvcrt
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# 快照文件头：魔数、格式版本、保留、快照版本、上游发布时间、上游下次更新时间、货币数量、数据校验和
+HEADER = struct.Struct("<4sHHQqqII")
+MAGIC = b"FXRS"
+FORMAT_VERSION = 1
+CODE_WIDTH = 8
+CODE_DTYPE = f"S{CODE_WIDTH}"
+RATE_DTYPE = "<f8"
+
+
+def atomic_write(path, data):
+    """
+    原子写入文件：先写入同目录下的临时文件并 fsync，再用 os.replace 替换目标文件。
+    读取方要么看到旧文件，要么看到完整的新文件，不会读到写了一半的内容。
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """
+    阻塞式文件锁，用于多个 worker 进程读写同一个数据文件。
+    shared 为 True 时为共享锁（多个读者可以同时持有）；Windows 下只有互斥锁。
+    """
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def encode_snapshot(version, data):
+    """
+    把上游数据编码为二进制快照：文件头 + 定长货币代码数组 + float64 汇率数组。
+    """
+    rates = data["conversion_rates"]
+    codes = np.array([c.encode("ascii") for c in rates], dtype=CODE_DTYPE)
+    values = np.array(list(rates.values()), dtype=RATE_DTYPE)
+    payload = codes.tobytes() + values.tobytes()
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, 0, version,
+        int(data.get("time_last_update_unix") or 0),
+        int(data.get("time_next_update_unix") or 0),
+        len(codes), zlib.crc32(payload)
+    )
+    return header + payload
+
+
+def decode_snapshot(buffer):
+    """
+    解析二进制快照，返回 (快照版本, 上游格式的数据字典)。格式不正确时抛出 ValueError。
+    """
+    if len(buffer) < HEADER.size:
+        raise ValueError("快照文件不完整")
+    magic, fmt, _, version, last_update, next_update, count, crc = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or fmt != FORMAT_VERSION:
+        raise ValueError("快照格式不支持")
+    end = HEADER.size + count * (CODE_WIDTH + 8)
+    if len(buffer) < end or zlib.crc32(buffer[HEADER.size:end]) != crc:
+        raise ValueError("快照校验失败")
+    codes = np.frombuffer(buffer, dtype=CODE_DTYPE, count=count, offset=HEADER.size).tolist()
+    values = np.frombuffer(buffer, dtype=RATE_DTYPE, count=count, offset=HEADER.size + count * CODE_WIDTH).tolist()
+    data = {
+        "result": "success",
+        "base_code": "USD",
+        "time_last_update_unix": last_update,
+        "time_next_update_unix": next_update,
+        "conversion_rates": {c.decode("ascii"): v for c, v in zip(codes, values)}
+    }
+    return version, data
+
+
+class SharedSnapshot:
+    """
+    多进程共享的汇率快照。
+    使用 uvicorn --workers N 时每个进程都有自己的 exchange_service，
+    通过一把文件锁选出一个 leader：只有 leader 请求上游并写入快照，
+    其他进程（follower）只需检查快照文件是否变化，再以内存映射方式读取二进制快照，
+    不需要重新解析 JSON，版本号也与 leader 保持一致。
+    leader 进程退出后操作系统会释放文件锁，follower 下次检查时即可接替。
+    """
+    def __init__(self, path, lock_path):
+        self.path = path
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._stat_key = None
+
+    @property
+    def is_leader(self):
+        return self._lock_file is not None
+
+    def try_acquire(self):
+        """
+        尝试成为 leader（非阻塞），返回当前进程是否为 leader。
+        """
+        if self._lock_file is not None:
+            return True
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        f = open(self.lock_path, "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f
+        return True
+
+    def release(self):
+        """
+        释放 leader 身份。
+        """
+        f = self._lock_file
+        self._lock_file = None
+        if f is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError:
+            pass
+        f.close()
+
+    def write(self, version, data):
+        """
+        写入一份新快照（只应由 leader 调用）。
+        """
+        atomic_write(self.path, encode_snapshot(version, data))
+        self._stat_key = self._current_stat_key()
+
+    def _current_stat_key(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def read(self, force=False):
+        """
+        读取快照，返回 (快照版本, 数据)。
+        文件自上次读取后没有变化（或不存在、损坏）时返回 None；force 为 True 时总是重新读取。
+        """
+        key = self._current_stat_key()
+        if key is None or (key == self._stat_key and not force):
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    result = decode_snapshot(buffer)
+        except (OSError, ValueError) as e:
+            print(f"读取共享快照 {self.path} 错误: {e}")
+            return None
+        self._stat_key = key
+        return result
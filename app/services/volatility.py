@@ -0,0 +1,179 @@
+import os
+import re
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 参与波动率统计的货币
+VOLATILITY_CURRENCIES = os.getenv(
+    "VOLATILITY_CURRENCIES",
+    "USD,CNY,EUR,GBP,JPY,HKD,AUD,CAD,SGD,CHF,INR,RUB,KRW,THB,VND,MYR,IDR,PHP,TWD,NZD"
+).split(",")
+# 支持作为计价基准的货币（每个非 USD 基准额外维护一组交叉乘积前缀和）
+VOLATILITY_BASES = os.getenv("VOLATILITY_BASES", "USD,CNY").split(",")
+# 保留的最大快照条数，超出后丢弃最旧的一半
+VOLATILITY_MAX_ROWS = int(os.getenv("VOLATILITY_MAX_ROWS", "20000"))
+
+WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def parse_window(window):
+    """
+    解析时间窗口字符串（如 7d、24h、30m、2w），纯数字按天计算，返回秒数。
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*", window or "")
+    if not match:
+        raise ValueError(f"无效的时间窗口: {window}")
+    return int(float(match.group(1)) * WINDOW_UNITS[match.group(2) or "d"])
+
+
+class RollingVolatility:
+    """
+    增量滚动波动率统计。
+    每份快照到来时只计算一次各货币相对 USD 的对数收益率 r，并在前缀和数组中追加一行：
+      N = Σ有效点数，S1 = Σr，S2 = Σr²，以及每个非 USD 基准 B 的 C_B = Σ r·r_B。
+    更新代价为 O(货币数)，任意时间窗口的统计量都可由两行前缀和相减得到，
+    查询时同样是 O(货币数)，不必在窗口内重新计算。
+    相对基准 B 的收益率为 r - r_B，其方差由 S2 - 2·C_B + S2_B 推出。
+    """
+    def __init__(self, currencies=VOLATILITY_CURRENCIES, bases=VOLATILITY_BASES, max_rows=VOLATILITY_MAX_ROWS):
+        self.codes = list(currencies)
+        self.index = {c: i for i, c in enumerate(self.codes)}
+        self.bases = [b for b in bases if b in self.index]
+        self.max_rows = max_rows
+        width = len(self.codes)
+        self._capacity = 64
+        self._rows = 0
+        self._timestamps = np.zeros(self._capacity, dtype=np.int64)
+        self._count = np.zeros((self._capacity, width))
+        self._s1 = np.zeros((self._capacity, width))
+        self._s2 = np.zeros((self._capacity, width))
+        self._cross = {b: np.zeros((self._capacity, width)) for b in self.bases if b != "USD"}
+        self._last_log = None
+
+    @property
+    def last_timestamp(self):
+        return int(self._timestamps[self._rows - 1]) if self._rows else None
+
+    def _grow(self):
+        """
+        容量不足时扩容；超过 max_rows 时丢弃最旧的一半（前缀和相减仍然成立）。
+        """
+        if self._rows >= self.max_rows:
+            drop = self._rows // 2
+            arrays = [self._timestamps, self._count, self._s1, self._s2] + list(self._cross.values())
+            for array in arrays:
+                array[:self._rows - drop] = array[drop:self._rows]
+            self._rows -= drop
+            return
+        self._capacity *= 2
+        self._timestamps = np.resize(self._timestamps, self._capacity)
+        self._count = np.resize(self._count, (self._capacity, len(self.codes)))
+        self._s1 = np.resize(self._s1, (self._capacity, len(self.codes)))
+        self._s2 = np.resize(self._s2, (self._capacity, len(self.codes)))
+        self._cross = {b: np.resize(a, (self._capacity, len(self.codes))) for b, a in self._cross.items()}
+
+    def _append_row(self, timestamp, log_rates):
+        if self._rows >= self._capacity or self._rows >= self.max_rows:
+            self._grow()
+        i = self._rows
+        self._timestamps[i] = timestamp
+        if self._last_log is None or i == 0:
+            returns = np.zeros(len(self.codes))
+            valid = np.zeros(len(self.codes))
+            prev = None
+        else:
+            returns = log_rates - self._last_log
+            valid = np.isfinite(returns).astype(np.float64)
+            returns = np.where(valid > 0, returns, 0.0)
+            prev = i - 1
+        if prev is None:
+            self._count[i] = valid
+            self._s1[i] = returns
+            self._s2[i] = returns * returns
+            for base, array in self._cross.items():
+                array[i] = returns * returns[self.index[base]]
+        else:
+            self._count[i] = self._count[prev] + valid
+            self._s1[i] = self._s1[prev] + returns
+            self._s2[i] = self._s2[prev] + returns * returns
+            for base, array in self._cross.items():
+                array[i] = array[prev] + returns * returns[self.index[base]]
+        # 缺失的货币保留上一次的有效值，下次收益率跨越缺失区间
+        if self._last_log is None:
+            self._last_log = log_rates
+        else:
+            self._last_log = np.where(np.isfinite(log_rates), log_rates, self._last_log)
+        self._rows += 1
+
+    def _log_rates(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(values > 0, np.log(values), np.nan)
+
+    def update(self, timestamp, rates):
+        """
+        追加一份 USD 基准汇率快照，时间戳不晚于上一条时忽略。返回是否更新。
+        """
+        if self._rows and timestamp <= self.last_timestamp:
+            return False
+        values = [rates.get(c, np.nan) for c in self.codes]
+        self._append_row(int(timestamp), self._log_rates(values))
+        return True
+
+    def load(self, timestamps, values):
+        """
+        用历史数据（时间戳数组、二维汇率数组[行, 货币]，列顺序与 codes 一致）初始化。
+        """
+        log_values = self._log_rates(values)
+        for timestamp, row in zip(timestamps.tolist(), log_values):
+            if not self._rows or timestamp > self.last_timestamp:
+                self._append_row(timestamp, row)
+
+    def window_stats(self, window_seconds, currencies=None, base="USD"):
+        """
+        计算最近 window_seconds 秒内各货币相对 base 的对数收益率统计。
+        返回 {货币: {count, mean, std, volatility_pct, realized_pct}}，以及窗口的起止时间戳。
+        """
+        if base not in self.bases:
+            raise ValueError(f"不支持的基准货币: {base}")
+        codes = [c for c in (currencies or self.codes) if c in self.index]
+        if self._rows < 2:
+            return {}, None, None
+
+        end = self._rows - 1
+        start_ts = int(self._timestamps[end]) - window_seconds
+        # 窗口内的收益率对应快照下标 [k, end]，前缀和取 end 行减 k-1 行
+        k = max(int(np.searchsorted(self._timestamps[:self._rows], start_ts, side="left")), 1)
+        if k > end:
+            return {}, start_ts, int(self._timestamps[end])
+
+        cols = np.array([self.index[c] for c in codes], dtype=np.intp)
+        count = self._count[end, cols] - self._count[k - 1, cols]
+        s1 = self._s1[end, cols] - self._s1[k - 1, cols]
+        s2 = self._s2[end, cols] - self._s2[k - 1, cols]
+        if base != "USD":
+            b = self.index[base]
+            s1_b = self._s1[end, b] - self._s1[k - 1, b]
+            s2_b = self._s2[end, b] - self._s2[k - 1, b]
+            cross = self._cross[base][end, cols] - self._cross[base][k - 1, cols]
+            s1 = s1 - s1_b
+            s2 = s2 - 2 * cross + s2_b
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(count > 0, s1 / count, 0.0)
+            variance = np.maximum(np.where(count > 0, s2 / count, 0.0) - mean * mean, 0.0)
+        std = np.sqrt(variance)
+        realized = np.sqrt(np.maximum(s2, 0.0))
+
+        stats = {}
+        for i, code in enumerate(codes):
+            stats[code] = {
+                "count": int(count[i]),
+                "mean": float(mean[i]),
+                "std": float(std[i]),
+                "volatility_pct": round(float(std[i]) * 100, 4),
+                "realized_pct": round(float(realized[i]) * 100, 4)
+            }
+        return stats, start_ts, int(self._timestamps[end])
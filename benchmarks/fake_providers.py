@@ -0,0 +1,106 @@
+import time
+import random
+import asyncio
+import httpx
+
+# 模拟的货币及其初始汇率（USD 基准）
+BASE_RATES = {
+    "USD": 1.0, "CNY": 7.25, "EUR": 0.92, "GBP": 0.79, "JPY": 150.0,
+    "HKD": 7.82, "AUD": 1.52, "CAD": 1.36, "SGD": 1.35, "CHF": 0.88,
+    "INR": 83.2, "RUB": 91.5, "KRW": 1330.0, "THB": 35.9, "VND": 24500.0,
+    "MYR": 4.72, "IDR": 15600.0, "PHP": 56.1, "TWD": 31.6, "NZD": 1.64
+}
+
+
+class FakeProviders:
+    """
+    本地模拟的上游服务（ExchangeRate-API、open.er-api.com 和 Alpha Vantage）。
+    通过 httpx.MockTransport 注入到共享 HTTP 客户端，不会产生任何网络请求。
+    每个上游可分别配置延迟（秒，均值与抖动）和失败率，
+    汇率每次发布时做一次小幅随机游走，发布间隔由 update_interval 控制。
+    open.er-api.com 作为备用汇率上游，与主上游返回同一份汇率，失败率由 fallback_failure_rate 单独控制。
+    指定 tape（汇率磁带目录）时不再随机游走，而是每次发布依次回放磁带中的汇率，结果完全确定。
+    """
+    def __init__(self, latency=0.05, jitter=0.02, failure_rate=0.0, news_latency=0.2,
+                 news_failure_rate=0.0, update_interval=5, seed=None, fallback_failure_rate=0.0, tape=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.news_latency = news_latency
+        self.news_failure_rate = news_failure_rate
+        self.fallback_failure_rate = fallback_failure_rate
+        self.update_interval = update_interval
+        self.random = random.Random(seed)
+        self.rates = dict(BASE_RATES)
+        self.tape_rates = None
+        if tape:
+            from app.services.rate_tape import RateTape
+            self.tape_rates = [r["data"]["conversion_rates"] for r in RateTape(tape).read()
+                               if (r.get("data") or {}).get("conversion_rates")]
+            if not self.tape_rates:
+                raise ValueError(f"磁带 {tape} 中没有汇率数据")
+        self.tape_position = -1 # 下一次发布时前进到磁带的第一条
+        self.published_at = 0
+        self.calls = {"exchangerate": 0, "openerapi": 0, "alphavantage": 0}
+        self.failures = {"exchangerate": 0, "openerapi": 0, "alphavantage": 0}
+
+    def transport(self):
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request):
+        host = request.url.host
+        if "exchangerate" in host:
+            return await self._respond("exchangerate", self.latency, self.failure_rate, self._rates_payload)
+        if host == "open.er-api.com":
+            return await self._respond("openerapi", self.latency, self.fallback_failure_rate, self._open_rates_payload)
+        if "alphavantage" in host:
+            return await self._respond("alphavantage", self.news_latency, self.news_failure_rate, self._news_payload)
+        return httpx.Response(404, json={"error": "unknown host"})
+
+    async def _respond(self, provider, latency, failure_rate, payload):
+        self.calls[provider] += 1
+        delay = max(0.0, latency + self.random.uniform(-self.jitter, self.jitter))
+        if delay:
+            await asyncio.sleep(delay)
+        if self.random.random() < failure_rate:
+            self.failures[provider] += 1
+            # 一半模拟连接错误，一半模拟 5xx
+            if self.random.random() < 0.5:
+                raise httpx.ConnectError("simulated upstream failure")
+            return httpx.Response(503, json={"error": "simulated upstream failure"})
+        return httpx.Response(200, json=payload())
+
+    def _rates_payload(self):
+        now = int(time.time())
+        if now - self.published_at >= self.update_interval:
+            self.published_at = now
+            if self.tape_rates:
+                self.tape_position += 1
+                self.rates = dict(self.tape_rates[self.tape_position % len(self.tape_rates)])
+            else:
+                for code in self.rates:
+                    if code != "USD":
+                        self.rates[code] *= 1 + self.random.gauss(0, 0.001)
+        return {
+            "result": "success",
+            "base_code": "USD",
+            "time_last_update_unix": self.published_at,
+            "time_next_update_unix": self.published_at + self.update_interval,
+            "conversion_rates": dict(self.rates)
+        }
+
+    def _open_rates_payload(self):
+        data = self._rates_payload()
+        data["rates"] = data.pop("conversion_rates")
+        return data
+
+    def _news_payload(self):
+        feed = []
+        for i in range(10):
+            feed.append({
+                "title": f"Forex market update #{i}",
+                "url": f"https://example.com/news/{int(time.time()) // 3600}/{i}",
+                "source": "Benchmark",
+                "summary": "Simulated news item used by the benchmark suite. " * 3
+            })
+        return {"feed": feed}
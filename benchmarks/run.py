@@ -0,0 +1,278 @@
+"""
+基准测试 / 压测脚本。
+在进程内启动 app.main（上游 API 由 FakeProviders 模拟），按权重混合请求各个接口，
+统计每个接口的吞吐量和 p50/p95/p99 延迟，并把结果写入 JSON 文件便于对比。
+
+用法（在项目根目录执行）：
+  python -m benchmarks.run --duration 30 --concurrency 32
+  python -m benchmarks.run --latency 0.2 --failure-rate 0.1 --compare /tmp/dashboard-benchmarks/上一次.json
+结果默认写入系统临时目录下的 dashboard-benchmarks/（可用 BENCHMARK_RESULTS_DIR 或 --output 指定），不会留在代码仓库中。
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+import numpy as np
+import httpx
+
+RESULTS_DIR = os.getenv("BENCHMARK_RESULTS_DIR") or os.path.join(tempfile.gettempdir(), "dashboard-benchmarks")
+
+CURRENCIES = ["USD", "CNY", "EUR", "GBP", "JPY", "HKD", "AUD", "CAD", "SGD", "CHF"]
+
+# 各接口的默认流量权重（大致对应看板页面的实际使用比例）
+DEFAULT_MIX = {
+    "index": 2,
+    "realtime": 30,
+    "convert": 25,
+    "purchase": 8,
+    "sale": 8,
+    "history": 12,
+    "settle_history": 15,
+}
+
+
+def build_request(name, rng):
+    """
+    生成一个接口的请求参数，返回 (method, url, kwargs)。
+    """
+    if name == "index":
+        return "GET", "/", {}
+    if name == "realtime":
+        return "GET", "/api/realtime", {}
+    if name == "convert":
+        return "POST", "/api/convert", {"data": {
+            "amount": str(round(rng.uniform(1, 10000), 2)),
+            "from_curr": rng.choice(CURRENCIES),
+            "to_curr": rng.choice(CURRENCIES)
+        }}
+    if name == "purchase":
+        n = rng.randint(2, 5)
+        return "POST", "/api/purchase/compare", {"data": {
+            "amount": [str(round(rng.uniform(100, 5000), 2)) for _ in range(n)],
+            "currency": [rng.choice(CURRENCIES) for _ in range(n)]
+        }}
+    if name == "sale":
+        n = rng.randint(1, 4)
+        return "POST", "/api/sale/price", {"data": {
+            "cost_cny": str(round(rng.uniform(10, 1000), 2)),
+            "market": [rng.choice(CURRENCIES) for _ in range(n)],
+            "margin": [str(rng.randint(5, 60)) for _ in range(n)]
+        }}
+    if name == "history":
+        base, target = rng.sample(CURRENCIES, 2)
+        return "GET", f"/api/history?base={base}&target={target}&days=30", {}
+    if name == "settle_history":
+        filter_type = rng.choice(["", "&filter_type=purchase_cost_compare", "&filter_type=smart_pricing"])
+        return "GET", f"/api/settle/history?limit=50{filter_type}", {}
+    raise ValueError(f"未知接口: {name}")
+
+
+def parse_mix(text):
+    """
+    解析 --mix 参数，例如 "realtime=50,convert=30,history=20"。
+    """
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"未知接口: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Recorder:
+    """
+    按接口收集延迟样本（秒）和错误数。
+    """
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.status = {}
+
+    def record(self, name, elapsed, status):
+        self.samples.setdefault(name, []).append(elapsed)
+        key = f"{name}:{status}"
+        self.status[key] = self.status.get(key, 0) + 1
+        if status is None or status >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, duration):
+        endpoints = {}
+        total = 0
+        for name, samples in sorted(self.samples.items()):
+            values = np.array(samples) * 1000
+            total += len(values)
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            endpoints[name] = {
+                "count": len(values),
+                "errors": self.errors.get(name, 0),
+                "throughput_rps": round(len(values) / duration, 2),
+                "mean_ms": round(float(values.mean()), 3),
+                "p50_ms": round(float(p50), 3),
+                "p95_ms": round(float(p95), 3),
+                "p99_ms": round(float(p99), 3),
+                "max_ms": round(float(values.max()), 3),
+            }
+        return {
+            "endpoints": endpoints,
+            "total": {
+                "count": total,
+                "errors": sum(self.errors.values()),
+                "throughput_rps": round(total / duration, 2) if duration else 0,
+            },
+            "status": self.status,
+        }
+
+
+async def worker(client, names, weights, rng, deadline, recorder, warmup_until):
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            return
+        name = rng.choices(names, weights)[0]
+        method, url, kwargs = build_request(name, rng)
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = response.status_code
+        except Exception as e:
+            print(f"请求 {name} 错误: {e}")
+            status = None
+        elapsed = time.perf_counter() - start
+        if start >= warmup_until:
+            recorder.record(name, elapsed, status)
+
+
+async def run_benchmark(args):
+    from benchmarks.fake_providers import FakeProviders
+    # 必须在设置好数据目录等环境变量之后再导入应用
+    from app.main import app
+    from app.services.http_client import http_client
+
+    providers = FakeProviders(
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        news_latency=args.news_latency,
+        news_failure_rate=args.news_failure_rate,
+        update_interval=args.update_interval,
+        seed=args.seed,
+        fallback_failure_rate=args.fallback_failure_rate,
+        tape=args.tape,
+    )
+    # 先用模拟传输层创建共享客户端，lifespan 中的 start() 会复用它
+    await http_client.start(transport=providers.transport())
+
+    mix = args.mix or DEFAULT_MIX
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    recorder = Recorder()
+
+    # ASGITransport 不会触发 lifespan，这里手动进入
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", cookies={"lang": args.lang}) as client:
+            start = time.perf_counter()
+            warmup_until = start + args.warmup
+            deadline = warmup_until + args.duration
+            await asyncio.gather(*[
+                worker(client, names, weights, random.Random(args.seed + i), deadline, recorder, warmup_until)
+                for i in range(args.concurrency)
+            ])
+
+    result = recorder.summary(args.duration)
+    result["upstream"] = {"calls": providers.calls, "failures": providers.failures}
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def print_table(result, baseline=None):
+    header = f"{'endpoint':<16}{'count':>8}{'err':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    if baseline:
+        header += f"{'Δp50':>9}{'Δp95':>9}"
+    print(header)
+    for name, stats in result["endpoints"].items():
+        line = (f"{name:<16}{stats['count']:>8}{stats['errors']:>6}{stats['throughput_rps']:>10}"
+                f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+        old = (baseline or {}).get("endpoints", {}).get(name)
+        if old:
+            for key in ("p50_ms", "p95_ms"):
+                delta = (stats[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+                line += f"{delta:>+8.1f}%"
+        print(line)
+    total = result["total"]
+    print(f"total: {total['count']} 请求, {total['errors']} 错误, {total['throughput_rps']} req/s")
+    print(f"upstream: {result['upstream']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exchange Rate Dashboard 基准测试")
+    parser.add_argument("--duration", type=float, default=20, help="统计时长（秒）")
+    parser.add_argument("--warmup", type=float, default=2, help="预热时长（秒），不计入统计")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发客户端数")
+    parser.add_argument("--mix", type=parse_mix, default=None, help="流量权重，如 realtime=50,convert=30")
+    parser.add_argument("--lang", default="zh", help="请求使用的语言 Cookie")
+    parser.add_argument("--latency", type=float, default=0.05, help="汇率上游平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.02, help="上游延迟抖动（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="汇率上游失败率 (0~1)")
+    parser.add_argument("--fallback-failure-rate", type=float, default=0.0, help="备用汇率上游 (open.er-api.com) 失败率 (0~1)")
+    parser.add_argument("--news-latency", type=float, default=0.2, help="新闻上游平均延迟（秒）")
+    parser.add_argument("--news-failure-rate", type=float, default=0.0, help="新闻上游失败率 (0~1)")
+    parser.add_argument("--update-interval", type=int, default=5, help="模拟上游的汇率发布间隔（秒）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tape", default=None, help="用汇率磁带目录回放上游汇率（结果可复现）")
+    parser.add_argument("--data-dir", default=None, help="应用数据目录（默认使用临时目录）")
+    parser.add_argument("--output", default=None, help="结果文件路径（默认 <临时目录>/dashboard-benchmarks/<时间>.json）")
+    parser.add_argument("--compare", default=None, help="与之前的结果文件对比")
+    args = parser.parse_args(argv)
+
+    # 使用独立的数据目录，不影响真实的历史记录和汇率缓存
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="dashboard-bench-")
+    os.makedirs(data_dir, exist_ok=True)
+    os.environ["DASHBOARD_DATA_DIR"] = data_dir
+    os.environ.setdefault("EXCHANGE_API_KEY", "benchmark")
+    os.environ.setdefault("ALPHAVANTAGE_API_KEY", "benchmark")
+    # 模拟服务同时提供备用上游，默认一起压测故障转移
+    os.environ.setdefault("RATE_PROVIDERS", "exchangerate,openerapi")
+
+    result = asyncio.run(run_benchmark(args))
+    result["config"] = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+    result["config"]["data_dir"] = data_dir
+    result["environment"] = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "commit": git_commit(),
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(result, baseline)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    main()
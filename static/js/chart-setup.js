@@ -65,14 +65,14 @@ function initRadarChart() {
     const primaryColor = style.getPropertyValue('--primary-color').trim() || '#4361ee';
     const primaryRgb = style.getPropertyValue('--primary-rgb').trim() || '67, 97, 238';
     
-    // 模拟的波动率数据
+    // 波动率数据由后端 /api/volatility 计算，初始化后异步加载
     radarChart = new Chart(ctx, {
         type: 'radar',
         data: {
             labels: ['USD', 'EUR', 'JPY', 'GBP', 'AUD'], // 雷达图的五个维度
             datasets: [{
                 label: (typeof TRANS !== 'undefined') ? TRANS.volatility_label : '7-Day Volatility (%)',
-                data: [0.5, 0.8, 1.2, 0.6, 0.9], // 模拟数据
+                data: [0, 0, 0, 0, 0], // 加载完成前为 0
                 fill: true,
                 backgroundColor: `rgba(${primaryRgb}, 0.2)`,
                 borderColor: primaryColor,
@@ -132,8 +132,7 @@ function initRadarChart() {
                         showLabelBackdrop: false,
                         z: 1
                     },
-                    suggestedMin: 0,
-                    suggestedMax: 1.5
+                    suggestedMin: 0
                 }
             }
         }
@@ -141,6 +140,24 @@ function initRadarChart() {
 
     // 暴露给全局，供主题切换使用
     window.radarChart = radarChart;
+    updateVolatility();
+}
+
+/**
+ * 更新波动雷达数据
+ * 各货币相对人民币的 7 天已实现波动率 (%)，由后端基于汇率时间序列增量计算
+ */
+function updateVolatility() {
+    const currencies = radarChart.data.labels;
+
+    fetch(`/api/volatility?window=7d&base=CNY&currencies=${currencies.join(',')}`)
+        .then(response => response.json())
+        .then(data => {
+            const stats = data.currencies || {};
+            radarChart.data.datasets[0].data = currencies.map(curr => stats[curr] ? stats[curr].realized_pct : 0);
+            radarChart.update();
+        })
+        .catch(err => console.error('Failed to load volatility:', err));
 }
 
 /**
@@ -150,8 +167,11 @@ function initRadarChart() {
 function updateChart() {
     const base = document.getElementById('chart-base').value;
     const target = document.getElementById('chart-target').value;
+    // 点数不超过画布宽度（像素），长区间由后端降采样
+    const canvas = document.getElementById('historyChart');
+    const maxPoints = Math.min(2000, Math.max(100, Math.round(canvas.clientWidth || 0)));
     
-    fetch(`/api/history?base=${base}&target=${target}&days=30`)
+    fetch(`/api/history?base=${base}&target=${target}&days=30&max_points=${maxPoints}`)
         .then(response => response.json())
         .then(data => {
             historyChart.data.labels = data.labels;
@@ -166,32 +186,29 @@ function updateChart() {
 
 /**
  * 更新人民币汇率矩阵
- * 计算主要货币对人民币的汇率
+ * 交叉汇率由后端 /api/matrix 预先计算，这里只请求需要的一列 (X/CNY)
  */
 function updateMatrix() {
-    fetch('/api/rates/json')
+    // 使用全局定义的货币列表，如果没有则使用默认列表
+    const currencies = ((typeof SUPPORTED_CURRENCIES !== 'undefined') ? SUPPORTED_CURRENCIES : ['USD', 'EUR', 'JPY', 'GBP'])
+        .filter(curr => curr !== 'CNY'); // 跳过 CNY/CNY
+
+    fetch(`/api/matrix?base=${currencies.join(',')}&quotes=CNY`)
         .then(response => response.json())
-        .then(rates => {
-            const cny = rates['CNY'] || 7.25;
+        .then(data => {
             const tbody = document.getElementById('matrix-body');
             if (!tbody) return;
             
             tbody.innerHTML = '';
-            
-            // 使用全局定义的货币列表，如果没有则使用默认列表
-            const currencies = (typeof SUPPORTED_CURRENCIES !== 'undefined') ? SUPPORTED_CURRENCIES : ['USD', 'EUR', 'JPY', 'GBP'];
+
+            // data.rates[i][0] 即 1 单位 data.base[i] 兑换的 CNY
+            const values = {};
+            data.base.forEach((curr, i) => {
+                if (data.rates[i] && data.rates[i].length) values[curr] = data.rates[i][0];
+            });
             
             currencies.forEach(curr => {
-                if (curr === 'CNY') return; // 跳过 CNY/CNY
-                
-                // 计算交叉汇率: X/CNY = (USD/CNY) / (USD/X)
-                // rates[curr] 是 USD/X
-                let rateText = '-';
-                if (rates[curr]) {
-                    const val = cny / rates[curr];
-                    rateText = val.toFixed(4);
-                }
-                
+                const rateText = (curr in values) ? values[curr].toFixed(4) : '-';
                 const row = document.createElement('tr');
                 row.innerHTML = `<td>${curr}/CNY</td><td>${rateText}</td>`;
                 tbody.appendChild(row);
@@ -0,0 +1,76 @@
+import asyncio
+from app.services.alerts import AlertEngine
+
+
+class FlatMatrix:
+    def __init__(self, rate):
+        self.value = rate
+
+    def rate(self, base, target):
+        return self.value
+
+
+def test_alert_fires_once_across_engines_sharing_a_log(tmp_path):
+    # 两个实例模拟两个 worker 进程
+    path = str(tmp_path / "alerts.jsonl")
+    a, b = AlertEngine(path), AlertEngine(path)
+    notified = []
+    a.add_listener(notified.extend)
+
+    async def scenario():
+        alert = await a.register("USD", "EUR", ">", 1.0)
+        fired = await b.evaluate(FlatMatrix(2.0))
+        assert [f["id"] for f in fired] == [alert["id"]]
+        # b 已经触发，a 重放日志后不会再次触发，但会收到通知
+        assert await a.evaluate(FlatMatrix(2.0)) == []
+        assert [n["id"] for n in notified] == [alert["id"]]
+        assert len(a) == len(b) == 0
+
+    asyncio.run(scenario())
+
+
+def test_startup_compacts_log_and_other_engines_reload(tmp_path):
+    path = str(tmp_path / "alerts.jsonl")
+    a = AlertEngine(path)
+
+    async def scenario():
+        kept = await a.register("USD", "EUR", ">", 2.0)
+        dropped = await a.register("USD", "JPY", "<", 1.0)
+        await a.remove(dropped["id"])
+        # 新进程启动时压缩日志
+        b = AlertEngine(path)
+        assert len(b) == 0
+        await b.load()
+        assert len(b) == 1
+        with open(path, encoding="utf-8") as f:
+            assert len(f.readlines()) == 1
+        await b.register("USD", "GBP", ">", 3.0)
+        assert await a.remove(kept["id"]) is not None
+        assert len(a) == 1
+
+    asyncio.run(scenario())
+
+
+def test_notification_numbers_agree_across_engines_and_restarts(tmp_path):
+    path = str(tmp_path / "alerts.jsonl")
+    a, b = AlertEngine(path), AlertEngine(path)
+
+    async def scenario():
+        await a.register("USD", "EUR", ">", 1.0)
+        await b.register("USD", "JPY", ">", 1.0)
+        await a.evaluate(FlatMatrix(2.0), pairs=[("USD", "EUR")])
+        await b.evaluate(FlatMatrix(2.0))
+        await a.evaluate(FlatMatrix(2.0))
+        assert [n["seq"] for n in a.recent_notifications()] == [1, 2]
+        assert a.recent_notifications() == b.recent_notifications()
+
+        # 重启压缩日志后序号继续递增
+        c = AlertEngine(path)
+        await c.register("USD", "GBP", ">", 1.0)
+        fired = await c.evaluate(FlatMatrix(2.0))
+        assert [f["seq"] for f in fired] == [3]
+        assert [n["seq"] for n in b.recent_notifications(since=2)] == []
+        await b.evaluate(FlatMatrix(2.0))
+        assert [n["seq"] for n in b.recent_notifications(since=2)] == [3]
+
+    asyncio.run(scenario())
@@ -0,0 +1,34 @@
+import io
+import json
+import asyncio
+import pytest
+from app.services.batch_convert import BatchConverter, BatchFormatError
+from app.services.cross_rates import CrossRateMatrix
+
+MATRIX = CrossRateMatrix({"USD": 1.0, "EUR": 0.5})
+
+
+def convert(body, input_format, output_format=None):
+    converter = BatchConverter(MATRIX, input_format=input_format, output_format=output_format)
+    converter.open(io.BytesIO(body))
+
+    async def collect():
+        return b"".join([chunk async for chunk in converter.stream()]).decode("utf-8")
+    return asyncio.run(collect())
+
+
+def test_csv_quoted_field_may_contain_newlines():
+    body = 'amount,from,to,note\n10,USD,EUR,"two\nlines"\n\n4,EUR,USD,x\n'.encode("utf-8")
+    assert convert(body, "csv") == 'amount,from,to,note,rate,result\n10,USD,EUR,"two\nlines",0.5,5.0\n4,EUR,USD,x,2.0,8.0\n'
+
+
+def test_ndjson_accepts_from_to_aliases():
+    body = b'{"amount": 10, "from": "USD", "to": "EUR"}\n{"amount": 4, "from_curr": "EUR", "to_curr": "USD"}\n'
+    rows = [json.loads(line) for line in convert(body, "ndjson").splitlines()]
+    assert [r["result"] for r in rows] == [5.0, 8.0]
+
+
+def test_non_utf8_body_is_a_format_error():
+    converter = BatchConverter(MATRIX)
+    with pytest.raises(BatchFormatError):
+        converter.open(io.BytesIO(b"amount,from,to\n10,USD,\xff\n"))
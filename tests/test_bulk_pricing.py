@@ -0,0 +1,17 @@
+import io
+import pytest
+from app.services.batch_convert import BatchFormatError
+from app.services.bulk_pricing import read_quotes
+
+
+def test_malformed_csv_is_a_format_error():
+    body = b'sku,amount\n"' + b"x" * 200000 + b'",1\n'
+    with pytest.raises(BatchFormatError):
+        read_quotes(io.BytesIO(body), "csv")
+
+
+def test_csv_quotes_are_read_by_column():
+    columns, rows, markets = read_quotes(io.BytesIO(b"sku,amount,currency\nA,10,USD\n\nB,5\n"), "csv")
+    assert rows == 2
+    assert columns == {"sku": ["A", "B"], "amount": ["10", "5"], "currency": ["USD", ""]}
+    assert markets == []
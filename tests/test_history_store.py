@@ -0,0 +1,45 @@
+import os
+import asyncio
+import pytest
+from app.services.history_store import JsonlHistoryStore, SqliteHistoryStore
+
+
+@pytest.mark.parametrize("store_class", [JsonlHistoryStore, SqliteHistoryStore])
+def test_stores_sharing_a_file_see_each_others_writes(tmp_path, store_class):
+    # 两个实例模拟两个 worker 进程
+    path = str(tmp_path / "history")
+    a, b = store_class(path, max_records=4), store_class(path, max_records=4)
+
+    async def scenario():
+        version = b.version
+        await a.add("x", "1")
+        assert b.version != version
+        await b.add("y", "2")
+        records, _ = await a.query(None, 10, None)
+        assert [r["details"] for r in records] == ["2", "1"]
+
+        # 压缩后另一个实例的索引仍然有效
+        for i in range(6):
+            await (a if i % 2 else b).add("x", str(i))
+        assert await a.query(None, 10, None) == await b.query(None, 10, None)
+
+        await a.clear()
+        assert await b.query(None, 10, None) == ([], None)
+        await b.add("x", "after")
+        records, _ = await a.query(None, 10, None)
+        assert [r["details"] for r in records] == ["after"]
+
+    asyncio.run(scenario())
+
+
+def test_jsonl_store_drops_partial_trailing_line(tmp_path):
+    path = str(tmp_path / "history.jsonl")
+    asyncio.run(JsonlHistoryStore(path).add("x", "1"))
+    with open(path, "ab") as f:
+        f.write(b'{"id": 9')
+    store = JsonlHistoryStore(path)
+    asyncio.run(store.add("x", "2"))
+    records, _ = asyncio.run(store.query(None, 10, None))
+    assert [r["details"] for r in records] == ["2", "1"]
+    with open(path, "rb") as f:
+        assert f.read().count(b"\n") == 2
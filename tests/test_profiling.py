@@ -0,0 +1,53 @@
+import asyncio
+from app.services import profiling
+from app.services.profiling import ProfileBuffer, ProfilingMiddleware
+
+
+def make_stream_app(content_type, chunks):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type)]})
+        for _ in range(chunks):
+            await asyncio.sleep(0.01)
+            await send({"type": "http.response.body", "body": b"data: x\n\n", "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    return app
+
+
+def run(middleware, path):
+    sent = []
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+        if message["type"] == "http.response.body" and message.get("more_body"):
+            # 流式响应进行中，分析器应该已经释放
+            assert not middleware._profiler_lock.locked()
+
+    scope = {"type": "http", "method": "GET", "path": path, "headers": []}
+    asyncio.run(middleware(scope, receive, send))
+    return sent
+
+
+def test_excluded_paths_are_not_profiled():
+    buffer = ProfileBuffer()
+    middleware = ProfilingMiddleware(make_stream_app(b"text/event-stream", 1), buffer=buffer, sample_rate=1)
+    run(middleware, "/api/stream")
+    assert len(buffer) == 0
+
+
+def test_event_stream_releases_profiler_after_headers():
+    buffer = ProfileBuffer()
+    middleware = ProfilingMiddleware(make_stream_app(b"text/event-stream", 3), buffer=buffer, sample_rate=1)
+    run(middleware, "/events")
+    assert buffer.list()[0]["profiled"]
+    assert not middleware._profiler_lock.locked()
+
+
+def test_profiler_is_capped(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_MAX_SECONDS", 0.005)
+    buffer = ProfileBuffer()
+    middleware = ProfilingMiddleware(make_stream_app(b"text/plain", 3), buffer=buffer, sample_rate=1)
+    run(middleware, "/slow")
+    assert buffer.list()[0]["profiled"]
@@ -0,0 +1,78 @@
+import json
+import time
+import asyncio
+import pytest
+from app.services.rate_providers import FileRateProvider, ProviderChain, ProviderError, RateProvider
+
+
+class StubProvider(RateProvider):
+    def __init__(self, name, delay=0):
+        self.name = name
+        self.delay = delay
+        self.healthy = True
+        self.calls = 0
+
+    async def fetch(self):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if not self.healthy:
+            raise ProviderError(f"{self.name} down")
+        return {"result": "success", "provider": self.name}
+
+
+def half_open(breaker):
+    breaker.trips = 1
+    breaker.open_until = time.time() - 1
+
+
+@pytest.mark.parametrize("hedge_delay", [0, 0.01])
+def test_untried_half_open_fallback_is_retried_later(hedge_delay):
+    primary, fallback = StubProvider("a"), StubProvider("b")
+    chain = ProviderChain([primary, fallback], hedge_delay=hedge_delay)
+    half_open(chain.breakers["b"])
+
+    # 主上游正常时不请求后备上游，也不能占用它的试探名额
+    assert asyncio.run(chain.fetch())["provider"] == "a"
+    assert fallback.calls == 0
+    assert chain.breakers["b"].state == "half-open"
+
+    primary.healthy = False
+    assert asyncio.run(chain.fetch())["provider"] == "b"
+    assert chain.breakers["b"].state == "closed"
+
+
+def test_all_breakers_open_fails_fast():
+    chain = ProviderChain([StubProvider("a"), StubProvider("b")])
+    for breaker in chain.breakers.values():
+        breaker.open_until = time.time() + 60
+    with pytest.raises(ProviderError):
+        asyncio.run(chain.fetch())
+
+
+def test_hedged_request_uses_fallback_when_primary_is_slow():
+    slow, fast = StubProvider("a", delay=1), StubProvider("b")
+    chain = ProviderChain([slow, fast], hedge_delay=0.01)
+    assert asyncio.run(chain.fetch())["provider"] == "b"
+    # 被取消的主上游请求不计为失败
+    assert chain.breakers["a"].failures == 0
+
+
+def write_rates(tmp_path, data):
+    path = tmp_path / "rates.json"
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return FileRateProvider(str(path))
+
+
+def test_file_provider_rebases_to_usd(tmp_path):
+    provider = write_rates(tmp_path, {"base_code": "EUR", "conversion_rates": {"EUR": 1, "USD": 1.25, "JPY": 150}})
+    data = asyncio.run(provider.fetch())
+    assert data["base_code"] == "USD"
+    assert data["conversion_rates"] == {"EUR": 0.8, "USD": 1.0, "JPY": 120.0}
+
+
+def test_file_provider_without_usd_rate_is_rejected(tmp_path):
+    provider = write_rates(tmp_path, {"base_code": "EUR", "rates": {"EUR": 1, "JPY": 150}})
+    with pytest.raises(ProviderError) as excinfo:
+        asyncio.run(provider.fetch())
+    assert excinfo.value.permanent